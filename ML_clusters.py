@@ -4,8 +4,9 @@ import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 
-from nanoporemlv2.featureeng.datasetio import load_dataset, scan_for_datasets, load_separated_by_meta
+from nanoporemlv2.featureeng.datasetio import load_dataset, scan_for_datasets, load_separated_by_meta, DEFAULT_CATALOG_FILENAME
 from nanoporemlv2.mltools.datasettools import *
+from nanoporemlv2.mltools.clustering import ksweep
 
 from sklearn.cluster import KMeans
 import scipy.stats as stats
@@ -91,7 +92,8 @@ elif freq == '40M':
 else:
     assert False
 
-files = scan_for_datasets(scanroot)
+catalog = scanroot/DEFAULT_CATALOG_FILENAME # Index of the datasets, only changed ones are read again
+files = scan_for_datasets(scanroot, catalog=catalog)
 
 
 COL_MAP = { # For the ML part (avg10pSSpGeoPlus) of the vector
@@ -136,82 +138,54 @@ def get_main_cluster(dataset):
     else:
         tabprint3(f'RNG: RandomState({seed})')
         
-    ## Init
-    n_clusters = 4 # Starting n_clusters
-    last_max_pcorr = 0.0 # Do not edit
-    while n_clusters >= 4: # Min n_clusters
-        tabprint3('Clusters:', n_clusters)
-        
-        ## Do clustering
-        kmeans = KMeans(n_clusters=n_clusters, random_state=rng).fit(X_clustering)
-        kmeans.predict(X_clustering)
-        cluster_centers = kmeans.cluster_centers_
+    ## Sweep
+    start_n_clusters = 4 # Starting n_clusters
+    min_n_clusters = 4 # Min n_clusters
+    batch_size = 4096 if freq == '40M' else None # Mini-batch k-means for the big full res vectors
+    def until(step): # Termination condition, checked after each n_clusters, stops sweep when True
+        # return step.max_similarity < 0.85 # Stop when all cluster centers below centain similarity value
+        # return abs(step.delta_max_similarity) < 0.1 # Stop when converge (as measured by small change in max_pcorr)
+        # return step.n_clusters <= 4 and step.max_similarity < 0.85 # Additionally enforce a max n_cluster
+        return False
+    # Each n_clusters after the first starts from the last one's centers, most similar pair merged
+    for step in ksweep(X_clustering, start_n_clusters, min_n_clusters, random_state=rng, batch_size=batch_size, until=until):
+        tabprint3('Clusters:', step.n_clusters)
         
         ## Stats
         ## Cluster sizes
-        cluster_sizes = {}
-        for i in range(len(cluster_centers)):
-            cluster_size = np.count_nonzero(kmeans.labels_==i)
-            cluster_sizes[i] = cluster_size
-        sorted_clusters = sorted(cluster_sizes.keys(), key=lambda key: cluster_sizes[key], reverse=True)
-        largest_cluster = sorted_clusters[0]
+        cluster_sizes = dict(enumerate(step.sizes.tolist()))
         tabprint4('Cluster sizes:', cluster_sizes)
-        tabprint4('Largest cluster:', largest_cluster)
+        tabprint4('Largest cluster:', step.order[0])
         
         ## Stats
         ## Pairwise similarities (pearson coeff) between each cluster centers
         tabprint4('- Pairwise similarities -')
-        pcorrs = []
-        for i in range(len(cluster_centers)):
-            for j in range(len(cluster_centers)):
-                if j> i:
-                    pcorr = stats.pearsonr(cluster_centers[i], cluster_centers[j])[0]
-                    pcorrs.append(pcorr)
-                    tabprint4(i,j,pcorr)
-        max_pcorr = max(pcorrs) if len(pcorrs) > 0 else 0.0 # Similarity value of the most similar pair of cluster centers
-        tabprint4('Similarity of most similar pair:', max_pcorr)
-        
-        ## Termination condition
-        delta_max_pcorr = last_max_pcorr - max_pcorr # max_pcorr from last n_cluster's iteration - max_pcorr from current n_cluster's iteration
-        tabprint4('Change in max similarity:', delta_max_pcorr)
-        # if max_pcorr < 0.85: # Stop when all cluster centers below centain similarity value
-        #     break
-        # if abs(delta_max_pcorr) < 0.1: # Stop when converge (as measured by small change in max_pcorr)
-        #     break
-        # if n_clusters <= 4 and max_pcorr < 0.85: # Additionally enforce a max n_cluster
-        #     break
-    
-        ## Loop contiuation matters
-        n_clusters -= 1
-        last_max_pcorr = max_pcorr
+        for i in range(step.n_clusters):
+            for j in range(i+1, step.n_clusters):
+                tabprint4(i,j,step.similarities[i, j])
+        tabprint4('Similarity of most similar pair:', step.max_similarity) # Similarity value of the most similar pair of cluster centers
+        tabprint4('Change in max similarity:', step.delta_max_similarity) # max_pcorr from last n_cluster's iteration - max_pcorr from current n_cluster's iteration
 
     ## Select cluster to retrieve
     wanted_cluster_idx = 0 # Index of wanted cluster, 0 for largest cluster, 1 for next largest cluster, so on
-    ## Retrieve selected cluster
-    assert wanted_cluster_idx < n_clusters
-    ind = kmeans.labels_ == sorted_clusters[wanted_cluster_idx] 
+    ## Optionally select additional clusters
+    n_extra_clusters_to_inc = 0 # How many extra (smaller) clusters to include
+    ## Retrieve selected cluster and extra clusters
+    ind = step.selected(wanted_cluster_idx, n_extra_clusters_to_inc)
     ## Select feature set to return
     # X_retfrom = X_clustering
     X_retfrom = X_ml
     # X_retfrom = X_fullres
-    ## Retrieve selected features of selected cluster
+    ## Retrieve selected features of selected clusters
     X_ret, y_ret = (X_retfrom[ind,:], y[ind])
 
-    ## Optionally select additional clusters
-    n_extra_clusters_to_inc = 0 # How many extra (smaller) clusters to include
-    ## Retrieve extra clusters and combine
-    assert wanted_cluster_idx + n_extra_clusters_to_inc < n_clusters
-    for i in range(n_extra_clusters_to_inc):
-        ind_ = kmeans.labels_ == sorted_clusters[wanted_cluster_idx+1+i]
-        # X_ret, y_ret = combine_datasets_Xy(X_ret, y_ret, X_clustering[ind_,:], y[ind_])
-        X_ret, y_ret = combine_datasets_Xy(X_ret, y_ret, X_retfrom[ind_,:], y[ind_])
-
     return (X_ret, y_ret)    
 
-separated = load_separated_by_meta('signed_voltage', *files)
-
 #Select Voltage Here
-for volt in [0.5]:
+volts = [0.5]
+separated = load_separated_by_meta('signed_voltage', *files, mmap=True, catalog=catalog, groups=volts) # Only the voltages used get read
+
+for volt in volts:
     
     tabprint0('Voltage:', volt, tabs=0)
     datasets = separated[volt]
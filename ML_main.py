@@ -2,14 +2,17 @@
 
 import time
 
+from pathlib import Path
+
 import numpy as np
 import scipy.signal as sig
 import scipy.stats as stats
 
 import matplotlib.pyplot as plt
 
-from nanoporemlv2.featureeng.datasetio import load_dataset, scan_for_datasets, load_separated_by_meta
+from nanoporemlv2.featureeng.datasetio import load_dataset, scan_for_datasets, load_separated_by_meta, DEFAULT_CATALOG_FILENAME
 from nanoporemlv2.mltools.datasettools import *
+from nanoporemlv2.mltools.experiments import ExperimentRunner, ExperimentLog
 
 from sklearn.model_selection import train_test_split ### ONLY USE AS train_VAL_split
 from sklearn.model_selection import cross_val_score
@@ -31,12 +34,9 @@ import pprint
 
 #%%
 
-logfilename = f'LOG FILE ADDRESS HERE'
-
-logfile = open(logfilename, 'x')
+logfilename = f'LOG FILE ADDRESS HERE' # JSON lines, one record per result
 
 def _print(*objects, sep=' ', end='\n'):
-    print(*objects, sep=sep, end=end, file=logfile, flush=True)
     print(*objects, sep=sep, end=end)
 
 LABEL_ORDER = ['BSA', 'ConA', 'BovineHb', 'HSA']
@@ -60,103 +60,121 @@ tabprint1 = lambda *objects: tabprint(*objects, tabs=1)
 tabprint2 = lambda *objects: tabprint(*objects, tabs=2)
 tabprint3 = lambda *objects: tabprint(*objects, tabs=3)
 
-files = scan_for_datasets(r'PATH') #Insert Path of Files Here!
+# Workers of the experiment pool may import this script again, e.g. on
+# Windows, so everything that runs goes under here
+if __name__ == '__main__':
+
+    log = ExperimentLog(logfilename)
+
+    scanroot = Path(r'PATH') #Insert Path of Files Here!
+    catalog = scanroot/DEFAULT_CATALOG_FILENAME # Index of the datasets, only changed ones are read again
+    files = scan_for_datasets(scanroot, catalog=catalog)
 
-separated = load_separated_by_meta('signed_voltage', *files)
+    rf = RandomForestClassifier(
+        criterion='entropy',
+        max_features='sqrt',
+        class_weight='balanced'
+        )
+    param_grid = { # Only do search for main params
+        "n_estimators": [80, 90, 100, 110, 120],
+        "max_features": [0.3, "sqrt", None]
+        }
 
-for volt in [0.5]:
+    # Every (voltage, combination, repeat, params, fold) fit is a task for the pool
+    # inner_jobs is n_jobs of each forest, workers default to cores/inner_jobs
+    runner = ExperimentRunner(max_workers=None, inner_jobs=1, log=log)
+
+    volts = [0.5]
+    separated = load_separated_by_meta('signed_voltage', *files, mmap=True, catalog=catalog, groups=volts) # Only the voltages used get read
+
+    for volt in volts:
     
-    tabprint0('Voltage:', volt, tabs=0)
-    datasets = separated[volt]
+        tabprint0('Voltage:', volt, tabs=0)
+        datasets = separated[volt]
     
-    combined = combine_datasets(*datasets)
-    combined = nan_rows_removed(*combined)
+        combined = combine_datasets(*datasets)
+        combined = nan_rows_removed(*combined)
 
-    _, _y = combined
-    labels = np.unique(_y)
+        _, _y = combined
+        labels = np.unique(_y)
     
-    grouped = group_by_label(combined)
-    counts = summarize_grouped(grouped)
-    tabprint1('Total valid vectors:', counts)
+        grouped = group_by_label(combined)
+        counts = summarize_grouped(grouped)
+        tabprint1('Total valid vectors:', counts)
     
-    combis = []
-    combis += list(combinations(labels, 2))
-    #combis += list(combinations(labels, 3))
-    #combis += list(combinations(labels, 4))
+        combis = []
+        combis += list(combinations(labels, 2))
+        #combis += list(combinations(labels, 3))
+        #combis += list(combinations(labels, 4))
     
-    for combi in combis:
-        
-        tabprint1('Combination:', combi)
-        selgrouped = { key:val for key, val in grouped.items() if key in combi }
+        for combi in combis:
         
-        equalrep = get_equal_rep_groups(selgrouped, sampling='random')
-        repcount = len(equalrep[combi[0]][1])
-        tabprint2("First how many vectors of each label used is:", repcount)
+            tabprint1('Combination:', combi)
+            selgrouped = { key:val for key, val in grouped.items() if key in combi }
         
-        testpct = 0.1
-        tabprint2('Portion of each label in reduced set reserved for testing:', testpct)
-        testsize = int(repcount*testpct//1)
-        tabprint2('Vectors from end of each label in reduced set reserved for testing:', testsize)
-        trainvalsize = repcount-testsize
-        tabprint2('Num remaining vectors per label in reduced set for trainval:', trainvalsize)
-
-        test_X, test_y = combine_datasets(
-            *list( slice_dataset(*dataset, -testsize, None, None) for dataset in equalrep.values() )
-            )
-        trainval_X, trainval_y = combine_datasets(
-            *list( slice_dataset(*dataset, None, trainvalsize, None) for dataset in equalrep.values() )
-            )
+            equalrep = get_equal_rep_groups(selgrouped, sampling='random')
+            repcount = len(equalrep[combi[0]][1])
+            tabprint2("First how many vectors of each label used is:", repcount)
         
-        testscores = []
-        confmats = []
-        for repeati in range(10):
-            tabprint2('Repeat #:', repeati)
-            seed = time.time_ns() // 100 % 1_000_000_000
-            rng = np.random.RandomState(seed)
-            tabprint3('RNG for this repeat:', f'RandomState({seed})')
-            rf = RandomForestClassifier(
-                criterion='entropy',
-                max_features='sqrt',
-                class_weight='balanced'
+            testpct = 0.1
+            tabprint2('Portion of each label in reduced set reserved for testing:', testpct)
+            testsize = int(repcount*testpct//1)
+            tabprint2('Vectors from end of each label in reduced set reserved for testing:', testsize)
+            trainvalsize = repcount-testsize
+            tabprint2('Num remaining vectors per label in reduced set for trainval:', trainvalsize)
+
+            test_X, test_y = combine_datasets(
+                *list( slice_dataset(*dataset, -testsize, None, None) for dataset in equalrep.values() )
                 )
-            param_grid = { # Only do search for main params
-                "n_estimators": [80, 90, 100, 110, 120],
-                "max_features": [0.3, "sqrt", None]
-                }
-            clf = GridSearchCV(
-                rf, param_grid,
-                cv=StratifiedKFold(n_splits=5, shuffle=False), 
-                scoring=make_scorer(f1_score, average='weighted')
+            trainval_X, trainval_y = combine_datasets(
+                *list( slice_dataset(*dataset, None, trainvalsize, None) for dataset in equalrep.values() )
                 )
-            clf.fit(trainval_X, trainval_y)
-            tabprint3('- CV results -')
-            multilinetabprint3(clf.cv_results_)
-            tabprint3('- Val F1-score of best model -')
-            tabprint3(clf.best_score_)
-            tabprint3('- Params of best model -')
-            multilinetabprint3(clf.best_params_)
-            testscore = clf.score(test_X, test_y)
-            tabprint3('Test F1-score of best model:', testscore)
-            confmat = confusion_matrix(
-                test_y, clf.predict(test_X), 
+        
+            runner.add(
+                (volt, combi),
+                (trainval_X, trainval_y), (test_X, test_y),
+                rf, param_grid,
+                cv=StratifiedKFold(n_splits=5, shuffle=False),
+                scoring=make_scorer(f1_score, average='weighted'),
+                repeats=10,
                 labels=[label for label in LABEL_ORDER if label in combi] # Match order in LABEL_ORDER
                 )
-            tabprint3('- Conf matrix from test of best model -')
-            multilinetabprint3(confmat)
-            testscores.append(testscore)
-            confmats.append(confmat)
-        
-        tabprint2('- Test scores from repeats -')
-        tabprint2(testscores)
-        bestrepeati, highesttestscore = max(enumerate(testscores))
-        lowesttestscore = min(testscores)
-        avgtestscore = np.average(testscores)
-        testscoresstd = np.std(testscores)
-        tabprint2('Highest test score:', highesttestscore)
-        tabprint2('Lowest test score:', lowesttestscore)
-        tabprint2('Average test score:', avgtestscore)
-        tabprint2('Test scores std:', testscoresstd)
-        tabprint2('- Conf mat from repeat with highest test score -')
-        multilinetabprint2(confmats[bestrepeati])
-        
-        
+            log.write({
+                'event': 'setup',
+                'key': (volt, combi),
+                'counts': counts,
+                'repcount': repcount,
+                'testpct': testpct,
+                'testsize': testsize,
+                'trainvalsize': trainvalsize
+                })
+
+    #%%
+
+    tabprint0('Running experiments')
+    for result in runner.run(): # As they complete, all also in the log
+        volt, combi = result['key']
+        if result['event'] == 'repeat':
+            tabprint1('Voltage:', volt, 'Combination:', combi, 'Repeat #:', result['repeat'])
+            tabprint2('RNG for this repeat:', f"RandomState({result['seed']})")
+            tabprint2('- Val F1-score of best model -')
+            tabprint2(result['best_score'])
+            tabprint2('- Params of best model -')
+            multilinetabprint2(result['best_params'])
+            tabprint2('Test F1-score of best model:', result['test_score'])
+            tabprint2('- Conf matrix from test of best model -')
+            multilinetabprint2(result['confmat'])
+        else:
+            tabprint1('Voltage:', volt, 'Combination:', combi, 'done')
+            tabprint2('- Test scores from repeats -')
+            tabprint2(result['test_scores'])
+            tabprint2('Highest test score:', result['highest'])
+            tabprint2('Lowest test score:', result['lowest'])
+            tabprint2('Average test score:', result['average'])
+            tabprint2('Test scores std:', result['std'])
+            tabprint2('- Conf mat from repeat with highest test score -')
+            multilinetabprint2(result['best_confmat'])
+
+    runner.close()
+
+#
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+from functools import partial
+import sys
+
+import numpy as np
+
+from nanoporemlv2.mltools.datasettools import expand_and_center
+from nanoporemlv2.utils.benchmarking import measure, print_header, run_checks
+
+#%%
+
+def gen_fullres(rows, cols, seed=0):
+    # Full res rows as in datasets, a bump at a random place padded with zeros,
+    # with noise, some flat tops and some rows without any peaks
+    rng = np.random.default_rng(seed)
+    X = np.zeros((rows, cols))
+    lens = rng.integers(3, cols+1, rows)
+    for m in range(rows):
+        n = lens[m]
+        X[m, :n] = rng.uniform(0, 2) * np.sin(np.linspace(0, np.pi, n)) + rng.normal(0, 0.1, n)
+    plateaus = rng.random(rows) < 0.1
+    X[plateaus] = np.round(X[plateaus], 1) # Flat tops
+    X[rng.random(rows) < 0.01] = 0 # No peaks
+    return X
+
+#%%
+
+def check_expand_and_center():
+    # Row by row and batch, into a new array and into a float32 out
+    X = gen_fullres(2_000, 250, seed=1)
+    loop_X = expand_and_center(X, batch=False)
+    batch_X = expand_and_center(X)
+    assert loop_X.dtype == batch_X.dtype, 'Row by row and batch dtypes differ'
+    assert np.array_equal(loop_X, batch_X, equal_nan=True), 'Row by row and batch results differ'
+    out = np.empty(loop_X.shape, dtype=np.float32)
+    expand_and_center(X, out=out)
+    assert np.array_equal(loop_X.astype(np.float32), out, equal_nan=True), \
+        'Row by row and float32 batch results differ'
+
+CHECKS = [check_expand_and_center]
+
+#%%
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rows", type=int, default=50_000)
+    parser.add_argument("--cols", type=int, default=250)
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    #%%
+
+    print_header('benchmark_centering.py', args)
+    passed = run_checks(CHECKS)
+    print()
+
+    #%%
+
+    X = gen_fullres(args.rows, args.cols)
+
+    loop_X, loop_time, _ = measure(partial(expand_and_center, batch=False), X, repeats=args.repeats)
+    _, batch_time, _ = measure(expand_and_center, X, repeats=args.repeats)
+    out = np.empty(loop_X.shape, dtype=np.float32)
+    _, out_time, _ = measure(partial(expand_and_center, out=out), X, repeats=args.repeats)
+
+    print(f'Row by row:      {loop_time:.4f}s')
+    print(f'Batch:           {batch_time:.4f}s')
+    print(f'Batch, float32:  {out_time:.4f}s')
+    print(f'Speedup: {loop_time/batch_time:.1f}x')
+    print()
+
+    #%%
+
+    if not passed:
+        sys.exit(1)
+    sys.exit(0)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import tempfile
+import sys
+
+from pathlib import Path
+
+import numpy as np
+
+from nanoporemlv2.dataloaders.common import WORKING_DTYPES
+from nanoporemlv2.dataloaders.synthetic import SyntheticTrace, score_detection
+from nanoporemlv2.eventextraction.pipeline import EventExtractionPipeline, Settings
+from nanoporemlv2.eventextraction.events import Events
+from nanoporemlv2.signal.signal import Signals
+from nanoporemlv2.utils.benchmarking import PIPELINE_CLEANERS, synthetic_params, measure, print_header, run_checks
+
+#%%
+
+def gen_reference(samples, seed, noise_exponent, peaks):
+    # Float64 reference data, as loaders give
+    params = synthetic_params(
+        samples=samples,
+        seed=seed,
+        noise_exponent=noise_exponent,
+        peaks_not_dips=peaks
+        )
+    return SyntheticTrace(params)
+
+def run_pipeline(synthetic, dtype, fc):
+    trace = synthetic.to_trace()
+    trace.info.dtype = dtype
+    settings = Settings(trace_info=trace.info)
+    settings.cleaners = PIPELINE_CLEANERS
+    settings.cleaner_params = {
+        'lowpassfilter': {'fc': fc},
+        'zapmasker': {'roll_seconds': 0.01, 'extra_collateral_damage_rolls': 1}
+        }
+    settings.eventextractor = 'ftrtextractor'
+    settings.eventextractor_params = {'ftrtextractor': {}}
+    pipeline = EventExtractionPipeline(trace, settings)
+    pipeline.run(preserve_orig=False)
+    return pipeline
+
+def bounds(events):
+    return np.array([[event.start, event.end] for event in events], dtype=np.int64).reshape(-1, 2)
+
+def bound_shifts(ref, low):
+    # Largest bound shift of every event, None if the events do not pair up one to one
+    if len(ref) != len(low) or score_detection(ref, low)['true_positives'] != len(ref):
+        return None
+    return np.abs(ref - low).max(axis=1)
+
+def result_dtypes(pipeline, tmp_dir):
+    # Dtypes of everything computed from the trace, also after saving and loading
+    events = pipeline.events
+    signals = events.to_signals()
+    events_path = Path(tmp_dir)/'dtype.events.npz'
+    signals_path = Path(tmp_dir)/'dtype.rawsignals.npz'
+    events.save(events_path, overwrite=True)
+    signals.save(signals_path, overwrite=True)
+    dtypes = {
+        pipeline.trace.current.dtype.name,
+        events.table.baseline.dtype.name,
+        signals.to_ragged()[0].dtype.name,
+        Signals.load(signals_path).to_ragged()[0].dtype.name,
+        Events.load(events_path).data.current.dtype.name
+        }
+    return dtypes, events_path, signals_path
+
+#%%
+
+def check_float32_pipeline():
+    # float32 is not bit identical to float64, threshold crossings within
+    # float32 rounding can land a sample either way
+    # Pins down a case where one event moves and one where none do
+    for seed, expected_moved in [(0, 1), (1, 0)]:
+        synthetic = gen_reference(2_000_000, seed, 1.0, False)
+        ref = bounds(run_pipeline(synthetic, 'float64', 50_000).events)
+        low = bounds(run_pipeline(synthetic, 'float32', 50_000).events)
+        shifts = bound_shifts(ref, low)
+        assert shifts is not None, f'Seed {seed}: float32 events do not pair up with float64 ones'
+        moved = int(np.count_nonzero(shifts))
+        assert moved <= expected_moved and shifts.max() <= 1, \
+            f'Seed {seed}: {moved} of {len(ref)} events moved, by up to {shifts.max()} samples'
+
+def check_float32_dtypes():
+    synthetic = gen_reference(500_000, 0, 1.0, False)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for dtype in WORKING_DTYPES:
+            dtypes, _, _ = result_dtypes(run_pipeline(synthetic, dtype, 50_000), tmp_dir)
+            assert dtypes == {dtype}, f'Not all arrays are {dtype}: {sorted(dtypes)}'
+
+CHECKS = [check_float32_dtypes, check_float32_pipeline]
+
+#%%
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--samples", type=int, default=5_000_000)
+    parser.add_argument("--seeds", type=int, nargs='+', default=[0, 1, 2])
+    parser.add_argument("--noise-exponents", type=float, nargs='+', default=[0.0, 1.0])
+    parser.add_argument("--fc", type=float, default=50_000)
+    args = parser.parse_args()
+
+    #%%
+
+    print_header('benchmark_dtype.py', args)
+    passed = run_checks(CHECKS)
+    print()
+
+    #%%
+
+    tmp_dir = tempfile.TemporaryDirectory()
+
+    for seed in args.seeds:
+        for noise_exponent in args.noise_exponents:
+            for peaks in [False, True]:
+                synthetic = gen_reference(args.samples, seed, noise_exponent, peaks)
+                print(f'Seed: {seed}, Noise exponent: {noise_exponent}, Peaks: {peaks}')
+
+                results = {}
+                for dtype in WORKING_DTYPES:
+                    pipeline, dt, peak = measure(run_pipeline, synthetic, dtype, args.fc, memory=True)
+                    dtypes, events_path, signals_path = result_dtypes(pipeline, tmp_dir.name)
+                    results[dtype] = (bounds(pipeline.events), pipeline.events.to_signals())
+                    score = score_detection(synthetic.events, results[dtype][0])
+                    print(
+                        f'\t{dtype}: {dt:.3f}s, {peak/1e6:.1f}MB peak, '
+                        f'events {events_path.stat().st_size/1e6:.2f}MB, signals {signals_path.stat().st_size/1e6:.2f}MB on disk, '
+                        f'{len(results[dtype][0])} events, recall {score["recall"]:.3f}, dtypes {sorted(dtypes)}'
+                        )
+
+                ref, ref_signals = results['float64']
+                low, low_signals = results['float32']
+                shifts = bound_shifts(ref, low)
+                if shifts is None:
+                    print('\tfloat32 events do not pair up with float64 ones')
+                else:
+                    moved = int(np.count_nonzero(shifts))
+                    print(f'\tEvents with moved bounds: {moved} of {len(ref)}, by at most {int(shifts.max()) if len(shifts) > 0 else 0} samples')
+                    if moved == 0:
+                        ref_values, _ = ref_signals.to_ragged()
+                        low_values, _ = low_signals.to_ragged()
+                        err = np.nanmax(np.abs(ref_values - low_values)) / np.nanmax(np.abs(ref_values))
+                        print(f'\tMax signal error relative to largest value: {err:.2e}')
+                print()
+
+    tmp_dir.cleanup()
+
+    #%%
+
+    if not passed:
+        sys.exit(1)
+    sys.exit(0)
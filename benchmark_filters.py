@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import sys
+
+import numpy as np
+import scipy.signal as sig
+
+from nanoporemlv2.dataloaders.synthetic import SyntheticTrace
+from nanoporemlv2.eventextraction.cleaners.filters import blocked_sosfiltfilt, sos_settle_samples, PRESETS
+from nanoporemlv2.utils.benchmarking import measure, print_header, run_checks, synthetic_params
+
+#%%
+
+def gen_soses(sampling_rate, cutoffs):
+    # Low pass filters as LowPassFilter designs them, and the presets
+    soses = {f'lowpass {fc:g}Hz': sig.butter(8, fc, btype='low', output='sos', fs=sampling_rate) for fc in cutoffs}
+    soses.update(PRESETS)
+    return soses
+
+def filter_copy_inplace(sos, x):
+    x = x.copy()
+    return blocked_sosfiltfilt(sos, x, out=x)
+
+#%%
+
+def check_blocked_sosfiltfilt():
+    # Within 1e-9 of sosfiltfilt relative to the largest value, for blocks
+    # shorter than the filter takes to settle as well as long ones, into a new
+    # array and in place
+    params = synthetic_params(samples=1_000_000, seed=0, noise_exponent=1.0)
+    x = SyntheticTrace(params).to_trace().current
+    for name, sos in gen_soses(params.sampling_rate, [1_000, 10_000, 50_000, 100_000]).items():
+        ref = sig.sosfiltfilt(sos, x)
+        tol = 1e-9*np.abs(ref).max()
+        for block_size in [sos_settle_samples(sos)//2, 10_000, 100_000]:
+            out = blocked_sosfiltfilt(sos, x, block_size=block_size)
+            assert np.abs(out - ref).max() <= tol, f'{name}, block size {block_size}: differs from sosfiltfilt'
+        out = x.copy()
+        blocked_sosfiltfilt(sos, out, out=out, block_size=100_000)
+        assert np.abs(out - ref).max() <= tol, f'{name}, in place: differs from sosfiltfilt'
+
+CHECKS = [check_blocked_sosfiltfilt]
+
+#%%
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--samples", type=int, nargs='+', default=[1_000_000, 10_000_000])
+    parser.add_argument("--cutoffs", type=float, nargs='+', default=[10_000, 50_000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    parser.add_argument("--no-memory", action='store_true')
+    args = parser.parse_args()
+
+    #%%
+
+    print_header('benchmark_filters.py', args)
+    passed = run_checks(CHECKS)
+    print()
+
+    #%%
+
+    memory = not args.no_memory
+
+    for samples in args.samples:
+        params = synthetic_params(samples=samples, seed=args.seed)
+        x = SyntheticTrace(params).to_trace().current
+        print(f'Samples: {samples}')
+        for name, sos in gen_soses(params.sampling_rate, args.cutoffs).items():
+            print(f'\t{name}')
+            ref, ref_time, ref_peak = measure(sig.sosfiltfilt, sos, x, repeats=args.repeats, memory=memory)
+            out, blocked_time, blocked_peak = measure(blocked_sosfiltfilt, sos, x, repeats=args.repeats, memory=memory)
+            _, inplace_time, inplace_peak = measure(filter_copy_inplace, sos, x, repeats=args.repeats, memory=memory)
+            line = f'\t\tsosfiltfilt: {ref_time:.4f}s, blocked: {blocked_time:.4f}s, blocked in place (with copy): {inplace_time:.4f}s'
+            if memory:
+                line += f'\n\t\tPeak: {ref_peak/1e6:.1f}MB, {blocked_peak/1e6:.1f}MB, {inplace_peak/1e6:.1f}MB'
+            print(line)
+            print(f'\t\tMax error relative to largest value: {np.abs(out - ref).max()/np.abs(ref).max():.2e}')
+        print()
+
+    #%%
+
+    if not passed:
+        sys.exit(1)
+    sys.exit(0)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import sys
+
+import numpy as np
+
+from nanoporemlv2.eventextraction.utils import walk_event_bounds, batch_event_bounds
+from nanoporemlv2.utils.benchmarking import measure, print_header, run_checks
+
+#%%
+
+def gen_indices(samples, trig_std, start_std, end_std, seed=0):
+    # White noise around a flat baseline of 0 with std of 1, dips
+    # Noisy enough that triggers are plentiful, which is what makes the walk slow
+    rng = np.random.default_rng(seed)
+    current = rng.standard_normal(samples)
+    trigger_indices = np.nonzero(current < -trig_std)[0]
+    start_indices = np.nonzero(current > -start_std)[0]
+    end_indices = np.nonzero(current > -end_std)[0]
+    return trigger_indices, start_indices, end_indices
+
+#%%
+
+def check_walk_batch_bounds():
+    # Plentiful and sparse triggers, and none at all
+    for samples, trig_std, seed in [(200_000, 2.0, 0), (200_000, 3.5, 1), (1_000, 10.0, 2)]:
+        indices = gen_indices(samples, trig_std, 0.75, 0.5, seed=seed)
+        walked = walk_event_bounds(*indices)
+        batched = batch_event_bounds(*indices)
+        assert walked == batched, f'Walk and batch bounds differ for {samples} samples, trig std {trig_std}'
+
+def check_walk_batch_bounds_edges():
+    # Trigger without a start before it, and an event still open at the end
+    indices = (np.array([0, 5, 9]), np.array([3, 4]), np.array([6]))
+    assert walk_event_bounds(*indices) == batch_event_bounds(*indices)
+
+CHECKS = [check_walk_batch_bounds, check_walk_batch_bounds_edges]
+
+#%%
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--samples", type=int, nargs='+', default=[1_000_000, 10_000_000])
+    parser.add_argument("--trig-std", type=float, default=2.0)
+    parser.add_argument("--start-std", type=float, default=0.75)
+    parser.add_argument("--end-std", type=float, default=0.5)
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    #%%
+
+    print_header('benchmark_identify_events.py', args)
+    passed = run_checks(CHECKS)
+    print()
+
+    #%%
+
+    for samples in args.samples:
+        indices = gen_indices(samples, args.trig_std, args.start_std, args.end_std)
+        print(f'Samples: {samples}, Triggers: {len(indices[0])}')
+
+        walked, walk_time, _ = measure(walk_event_bounds, *indices, repeats=args.repeats)
+        print(f'\tWalk:  {walk_time:.4f}s ({len(walked)} events)')
+
+        batched, batch_time, _ = measure(batch_event_bounds, *indices, repeats=args.repeats)
+        print(f'\tBatch: {batch_time:.4f}s ({len(batched)} events)')
+
+        print(f'\tSpeedup: {walk_time/batch_time:.1f}x')
+        print()
+
+    #%%
+
+    if not passed:
+        sys.exit(1)
+    sys.exit(0)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import sys
+
+import numpy as np
+
+from nanoporemlv2.dataloaders.synthetic import SyntheticTrace
+from nanoporemlv2.eventextraction.utils import centered_bn_move_median, centered_decimated_move_median, decimated_move_median_error
+from nanoporemlv2.utils.benchmarking import measure, print_header, run_checks, synthetic_params
+
+#%%
+
+def gen_current(samples, seed, noise_exponent):
+    # Drifting baseline with noise and events, as baselines are taken of
+    params = synthetic_params(samples=samples, seed=seed, noise_exponent=noise_exponent)
+    return SyntheticTrace(params).to_trace().current, params.noise_std
+
+#%%
+
+def check_decimated_move_median():
+    # Baseline error stays a small part of the noise, for white and 1/f noise
+    # Decimation as a numpy integer too, as it comes from arrays and json
+    for noise_exponent in [0.0, 1.0]:
+        current, noise_std = gen_current(2_000_000, 0, noise_exponent)
+        for decimation in [64, np.int64(64)]:
+            error = decimated_move_median_error(current, 30_001, decimation)
+            assert error['max_abs_error'] <= 0.25*noise_std, f'Noise exponent {noise_exponent}: {error}'
+            assert error['rms_error'] <= 0.1*noise_std, f'Noise exponent {noise_exponent}: {error}'
+
+CHECKS = [check_decimated_move_median]
+
+#%%
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--samples", type=int, default=10_000_000)
+    parser.add_argument("--windows", type=int, nargs='+', default=[5_001, 30_001])
+    parser.add_argument("--decimations", type=int, nargs='+', default=[16, 64])
+    parser.add_argument("--noise-exponent", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    #%%
+
+    print_header('benchmark_median.py', args)
+    passed = run_checks(CHECKS)
+    print()
+
+    #%%
+
+    current, noise_std = gen_current(args.samples, args.seed, args.noise_exponent)
+
+    for window in args.windows:
+        print(f'Window: {window}')
+        _, exact_time, _ = measure(centered_bn_move_median, current, window, repeats=args.repeats)
+        print(f'\tExact:             {exact_time:.4f}s')
+        for decimation in args.decimations:
+            _, decimated_time, _ = measure(centered_decimated_move_median, current, window, decimation, repeats=args.repeats)
+            error = decimated_move_median_error(current, window, decimation)
+            print(
+                f'\tDecimation {decimation:<6} {decimated_time:.4f}s, speedup {exact_time/decimated_time:.1f}x, '
+                f'max/rms error {error["max_abs_error"]/noise_std:.3f}/{error["rms_error"]/noise_std:.3f} noise std'
+                )
+        print()
+
+    #%%
+
+    if not passed:
+        sys.exit(1)
+    sys.exit(0)
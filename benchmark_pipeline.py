@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import tempfile
+import sys
+
+from pathlib import Path
+
+import numpy as np
+
+from nanoporemlv2.dataloaders.synthetic import SyntheticTrace, score_detection
+from nanoporemlv2.eventextraction.cleaners import ZapMasker, LowPassFilter
+from nanoporemlv2.eventextraction.extractors import FTRTExtractor
+from nanoporemlv2.eventextraction.event import PortableEvent
+from nanoporemlv2.eventextraction.events import Events, EVENTS_FORMATS, DEFAULT_EVENTS_FORMAT
+from nanoporemlv2.utils.benchmarking import measure, print_header, run_checks, synthetic_params, PIPELINE_CLEANERS
+
+#%%
+
+def report(stage, samples, dt, peak, extra=''):
+    line = f'\t{stage:<14} {dt:9.4f}s {samples/dt/1e6:9.2f}M samples/s'
+    if peak is not None:
+        line += f' {peak/1e6:9.1f}MB peak ({peak/samples:.1f}B/sample)'
+    if extra:
+        line += f'  {extra}'
+    print(line)
+
+def bounds(events):
+    # Bounds in the original trace, loaded events are portable
+    ret = []
+    for event in events:
+        if isinstance(event, PortableEvent):
+            ret.append([event.orig_start, event.orig_end])
+        else:
+            ret.append([event.start, event.end])
+    return np.array(ret, dtype=np.int64).reshape(-1, 2)
+
+def unmasked(truth, current):
+    # Truth events with no nan in them, those masked by cleaning cannot be detected
+    nan = np.isnan(current)
+    cum = np.concatenate([[0], np.cumsum(nan)])
+    return truth[cum[truth[:, 1]] == cum[truth[:, 0]]]
+
+def save_events(events, path, fmt):
+    events.save(path, overwrite=True, fmt=fmt)
+
+def cleaned_trace(synthetic, fc):
+    trace = synthetic.to_trace()
+    trace = LowPassFilter.run(trace, LowPassFilter.Params(fc=fc))
+    return ZapMasker.run(trace, ZapMasker.Params(roll_seconds=0.01, extra_collateral_damage_rolls=1))
+
+#%%
+
+def check_events_save_load():
+    # Events and signals come back the same from every format
+    synthetic = SyntheticTrace(synthetic_params(samples=500_000, seed=0, zap_rate=2.0))
+    events = FTRTExtractor(cleaned_trace(synthetic, 50_000)).run()
+    assert len(events) > 0, 'No events to check'
+    signals = events.to_signals()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for fmt in EVENTS_FORMATS:
+            path = Path(tmp_dir)/f'{fmt}.events.npz'
+            save_events(events, path, fmt)
+            loaded = Events.load(path)
+            assert np.array_equal(bounds(loaded), bounds(events)), f'{fmt}: loaded bounds differ'
+            loaded_signals = loaded.to_signals()
+            assert len(loaded_signals) == len(signals), f'{fmt}: different number of signals'
+            for signal, loaded_signal in zip(signals, loaded_signals):
+                assert np.array_equal(signal.values, loaded_signal.values), f'{fmt}: loaded signal values differ'
+
+def check_chunked_bounds():
+    # Chunked extraction finds the same events as in memory, also across zaps
+    # and with chunk edges falling inside events
+    synthetic = SyntheticTrace(synthetic_params(samples=1_000_000, seed=0, zap_rate=2.0))
+    trace = cleaned_trace(synthetic, 50_000)
+    assert np.isnan(trace.current).any(), 'No zaps to check'
+    ref = bounds(FTRTExtractor(trace).run())
+    assert len(ref) > 0, 'No events to check'
+    # Events are short, so the last chunk size makes sure one is split: its
+    # first chunk edge is in the middle of the middle event
+    middle = ref[len(ref)//2]
+    for chunk_size in [50_000, 100_000, 333_333, int(middle.sum()//2)]:
+        chunked = bounds(FTRTExtractor(trace, chunk_size=chunk_size).run())
+        assert np.array_equal(chunked, ref), f'Chunk size {chunk_size}: chunked bounds differ'
+
+CHECKS = [check_events_save_load, check_chunked_bounds]
+
+#%%
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--samples", type=int, nargs='+', default=[1_000_000, 10_000_000])
+    parser.add_argument("--sampling-rate", type=float, default=250_000)
+    parser.add_argument("--noise-exponent", type=float, default=1.0)
+    parser.add_argument("--line-noise", type=float, default=0.0)
+    parser.add_argument("--event-rate", type=float, default=20)
+    parser.add_argument("--zap-rate", type=float, default=1.0)
+    parser.add_argument("--peaks", action='store_true')
+    parser.add_argument("--dtype", default='float64')
+    parser.add_argument("--cleaners", nargs='*', choices=PIPELINE_CLEANERS, default=PIPELINE_CLEANERS)
+    parser.add_argument("--fc", type=float, default=50_000)
+    parser.add_argument("--format", choices=EVENTS_FORMATS, default=DEFAULT_EVENTS_FORMAT)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-r", "--repeats", type=int, default=1)
+    parser.add_argument("--no-memory", action='store_true')
+    args = parser.parse_args()
+
+    #%%
+
+    print_header('benchmark_pipeline.py', args)
+    passed = run_checks(CHECKS)
+    print()
+
+    #%%
+
+    memory = not args.no_memory
+    tmp_dir = tempfile.TemporaryDirectory()
+
+    for samples in args.samples:
+        params = synthetic_params(
+            sampling_rate=args.sampling_rate,
+            samples=samples,
+            seed=args.seed,
+            dtype=args.dtype,
+            noise_exponent=args.noise_exponent,
+            line_noise_amplitude=args.line_noise,
+            peaks_not_dips=args.peaks,
+            event_rate=args.event_rate,
+            zap_rate=args.zap_rate
+            )
+        synthetic, dt, peak = measure(SyntheticTrace, params, repeats=args.repeats, memory=memory)
+        print(f'Samples: {samples}, Events: {len(synthetic.events)}, Zaps: {len(synthetic.zaps)}')
+        report('generate', samples, dt, peak)
+
+        trace = synthetic.to_trace()
+
+        for cleaner in args.cleaners:
+            if cleaner == 'zapmasker':
+                zapmasker_params = ZapMasker.Params(roll_seconds=0.01, extra_collateral_damage_rolls=1)
+                trace, dt, peak = measure(ZapMasker.run, trace, zapmasker_params, repeats=args.repeats, memory=memory)
+                masked = np.isnan(trace.current)
+                zapped = np.zeros(samples, dtype=bool)
+                for start, end in synthetic.zaps:
+                    zapped[start:end] = True
+                zap_coverage = masked[zapped].mean() if zapped.any() else np.nan
+                collateral = masked[~zapped].mean()
+                report(cleaner, samples, dt, peak, f'zaps masked: {zap_coverage:.3f}, rest masked: {collateral:.3f}')
+            elif cleaner == 'lowpassfilter':
+                lowpass_params = LowPassFilter.Params(fc=args.fc)
+                trace, dt, peak = measure(LowPassFilter.run, trace, lowpass_params, repeats=args.repeats, memory=memory)
+                report(cleaner, samples, dt, peak)
+
+        extractor = FTRTExtractor(trace)
+        events, dt, peak = measure(extractor.run, repeats=args.repeats, memory=memory)
+        truth = unmasked(synthetic.events, trace.current)
+        score = score_detection(truth, bounds(events))
+        report(
+            'ftrtextractor', samples, dt, peak,
+            f'precision: {score["precision"]:.3f}, recall: {score["recall"]:.3f}, '
+            f'start/end error: {score["mean_abs_start_error"]:.2f}/{score["mean_abs_end_error"]:.2f} samples '
+            f'({len(truth)} unmasked events)'
+            )
+
+        path = Path(tmp_dir.name)/f'{samples}.events.npz'
+        _, dt, peak = measure(save_events, events, path, args.format, repeats=args.repeats, memory=memory)
+        report('events save', samples, dt, peak, f'{path.stat().st_size/1e6:.1f}MB on disk')
+
+        loaded, dt, peak = measure(Events.load, path, repeats=args.repeats, memory=memory)
+        report('events load', samples, dt, peak)
+
+        signals, dt, peak = measure(loaded.to_signals, repeats=args.repeats, memory=memory)
+        report('to signals', samples, dt, peak, f'{len(signals)} signals')
+        print()
+
+    tmp_dir.cleanup()
+
+    #%%
+
+    if not passed:
+        sys.exit(1)
+    sys.exit(0)
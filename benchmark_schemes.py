@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import sys
+
+import numpy as np
+
+from nanoporemlv2.featureeng.schemes import SCHEMES, BATCH_SCHEMES
+from nanoporemlv2.featureeng.datasetio import make_dataset
+from nanoporemlv2.utils.benchmarking import measure, print_header, run_checks, gen_signals
+
+#%%
+
+def check_batch_schemes():
+    # Every batched scheme against its per signal version, including
+    # single sample signals, plateaus and tied peaks, and lengths past 200
+    signals = gen_signals(400, 1, 250, seed=1, quantize=True)
+    for scheme in BATCH_SCHEMES:
+        X_loop, _ = make_dataset(signals, scheme, False)
+        X_batch, _ = make_dataset(signals, scheme, True)
+        assert X_loop.shape == X_batch.shape, f'{scheme}: shapes differ, {X_loop.shape}, {X_batch.shape}'
+        assert np.allclose(X_loop, X_batch, equal_nan=True), f'{scheme}: per signal and batch vectors differ'
+
+CHECKS = [check_batch_schemes]
+
+#%%
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--count", type=int, default=5_000)
+    parser.add_argument("--min-len", type=int, default=1)
+    parser.add_argument("--max-len", type=int, default=250)
+    parser.add_argument("--schemes", nargs='+', choices=SCHEMES.keys(), default=list(BATCH_SCHEMES.keys()))
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    #%%
+
+    print_header('benchmark_schemes.py', args)
+    passed = run_checks(CHECKS)
+    print()
+
+    #%%
+
+    signals = gen_signals(args.count, args.min_len, args.max_len, quantize=True)
+
+    for scheme in args.schemes:
+        print(f'Scheme: {scheme}')
+
+        (X_loop, _), loop_time, _ = measure(make_dataset, signals, scheme, False, repeats=args.repeats)
+        print(f'\tPer signal: {loop_time:.4f}s ({len(X_loop)} vectors)')
+
+        (X_batch, _), batch_time, _ = measure(make_dataset, signals, scheme, True, repeats=args.repeats)
+        print(f'\tBatch:      {batch_time:.4f}s ({len(X_batch)} vectors)')
+
+        print(f'\tSpeedup: {loop_time/batch_time:.1f}x')
+        print()
+
+    #%%
+
+    if not passed:
+        sys.exit(1)
+    sys.exit(0)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import sys
+
+import numpy as np
+
+from nanoporemlv2.signal.standards import STANDARDS, NONRAW_STANDARDS, BATCH_STANDARDS
+from nanoporemlv2.utils.benchmarking import measure, print_header, run_checks, gen_signals
+
+#%%
+
+def check_batch_standards():
+    # Every standard per signal and batched, on the same fixed signals,
+    # including single sample ones
+    missing = set(STANDARDS) - set(BATCH_STANDARDS)
+    assert not missing, f'Standards without a batch version: {sorted(missing)}'
+    for standard in NONRAW_STANDARDS:
+        loop_signals = gen_signals(300, 1, 250, seed=1)
+        batch_signals = gen_signals(300, 1, 250, seed=1)
+        loop_signals.standardize(standard, batch=False)
+        batch_signals.standardize(standard, batch=True)
+        for loop_signal, batch_signal in zip(loop_signals, batch_signals):
+            assert loop_signal.standard == batch_signal.standard, f'{standard}: standards differ'
+            assert np.array_equal(loop_signal.values, batch_signal.values, equal_nan=True), \
+                f'{standard}: per signal and batch values differ'
+
+CHECKS = [check_batch_standards]
+
+#%%
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--count", type=int, default=100_000)
+    parser.add_argument("--min-len", type=int, default=5)
+    parser.add_argument("--max-len", type=int, default=250)
+    parser.add_argument("--standards", nargs='+', choices=NONRAW_STANDARDS.keys(), default=list(NONRAW_STANDARDS.keys()))
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    #%%
+
+    print_header('benchmark_standards.py', args)
+    passed = run_checks(CHECKS)
+    print()
+
+    #%%
+
+    for standard in args.standards:
+        print(f'Standard: {standard}')
+
+        # Standardizing is one way, so one run on fresh signals per repeat
+        loop_time = batch_time = None
+        for _ in range(args.repeats):
+            loop_signals = gen_signals(args.count, args.min_len, args.max_len)
+            _, dt, _ = measure(loop_signals.standardize, standard, False)
+            loop_time = dt if loop_time is None else min(loop_time, dt)
+
+            batch_signals = gen_signals(args.count, args.min_len, args.max_len)
+            _, dt, _ = measure(batch_signals.standardize, standard, True)
+            batch_time = dt if batch_time is None else min(batch_time, dt)
+
+        print(f'\tPer signal: {loop_time:.4f}s')
+        print(f'\tBatch:      {batch_time:.4f}s')
+        print(f'\tSpeedup: {loop_time/batch_time:.1f}x')
+        print()
+
+    #%%
+
+    if not passed:
+        sys.exit(1)
+    sys.exit(0)
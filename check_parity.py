@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+'''
+Runs the parity checks of every benchmark_*.py script, without the benchmarks
+Exits 1 if any fails
+'''
+
+import sys
+
+from nanoporemlv2.utils.benchmarking import print_header, run_checks
+
+import benchmark_identify_events
+import benchmark_schemes
+import benchmark_pipeline
+import benchmark_standards
+import benchmark_centering
+import benchmark_dtype
+import benchmark_median
+import benchmark_filters
+
+#%%
+
+CHECKS = [
+    *benchmark_identify_events.CHECKS,
+    *benchmark_schemes.CHECKS,
+    *benchmark_pipeline.CHECKS,
+    *benchmark_standards.CHECKS,
+    *benchmark_centering.CHECKS,
+    *benchmark_dtype.CHECKS,
+    *benchmark_median.CHECKS,
+    *benchmark_filters.CHECKS,
+    ]
+
+#%%
+
+if __name__ == '__main__':
+    print_header('check_parity.py')
+    if not run_checks(CHECKS):
+        sys.exit(1)
+    sys.exit(0)
@@ -2,7 +2,7 @@
 
 __all__ = [
     "common", "pore_info",
-    "abf", "advantestdata"
+    "abf", "advantestdata", "rawbinary", "synthetic"
     ]
 
 #%%
@@ -28,6 +28,7 @@ input_label = make_input_opt(LABELS)
 #%%
 
 from .abf import ABF
+from .rawbinary import RawBinary
 
-DATALOADERS = [ABF]
+DATALOADERS = [ABF, RawBinary]
 DATALOADERS = {dataloader.name: dataloader for dataloader in DATALOADERS}
@@ -45,7 +45,7 @@ class ABF(pyabf.ABF):
             raise NotImplementedError('ABF sweep units is not nA')
         return Trace(
             self.sweepY,
-            time=self.sweepX,
+            time_offset=float(self.sweepX[0]), # sweepX is affine in the index, keep it implicit
             info=Info(
                 sampling_rate=self.dataRate
                 ),
@@ -21,11 +21,25 @@ from .poreinfo import PORE_INFO_DICT, reload_pore_info
 
 #%%
 
+# Working dtypes of trace current, and so of everything computed from it
+# (baseline, threshold lines, events, signals), applied by Trace.to_dtype
+# float32 halves memory and bandwidth, and still has more precision than
+# the ADCs the data comes from
+# Not bit identical to float64, see benchmark_dtype.check_float32_pipeline
+WORKING_DTYPES = ['float64', 'float32']
+
+#%%
+
 class Trace:
-    def __init__(self, current, time=None, info=None, raw=None):
+    def __init__(self, current, time=None, info=None, raw=None, time_offset=0.0):
         self.current = current
         self.info = info
         self.raw = raw
+        # Time is implicit, time_offset + index * sampling period, unless given
+        # Only generated when asked for and never kept, it is as large as current
+        self._time = None
+        self._time_start = 0 # Index of sample 0 in the trace this was sliced from, keeps implicit time of slices exact
+        self.time_offset = time_offset
         if time is not None:
             self.time = time
 
@@ -43,32 +57,81 @@ class Trace:
 
     @info.setter
     def info(self, obj):
-        obj = Info(obj)
-        self._info = obj
+        self._info = Info(obj)
 
     def __len__(self):
         return len(self.current)
 
+    @property
+    def time_offset(self):
+        # Time of sample 0 of the trace this is (sliced) from, for implicit time
+        return self._time_offset
+
+    @time_offset.setter
+    def time_offset(self, value):
+        check_numeric(value)
+        self._time_offset = float(value)
+
+    @property
+    def time_is_implicit(self):
+        return self._time is None
+
+    def _implicit_time(self, indices):
+        # Integer indices then scale by period to minimize floating point precision issues
+        return self.time_offset + (self._time_start + indices) * self.info.sampling_period
+
     @property
     def time(self):
         if self._time is None:
-            # Integer range then scale by period to minimize floating point precision issues
             # np.arange instead of range as it is more performant
-            time_ = np.arange(0, len(self), 1) * self.info.sample_period
-            self._time = time_
+            return self._implicit_time(np.arange(0, len(self), 1))
         return self._time
 
     @time.setter
     def time(self, array_like):
+        # None to go back to implicit time
+        if array_like is None:
+            self._time = None
+            return
         time_ = cast_1d_nonempty_numeric_array(array_like)
         check_eq_shape(self.current, time_)
         self._time = time_
 
+    def time_of(self, key):
+        # Same as time[key] for int, slice or int array key, only generating that part if implicit
+        if self._time is not None:
+            return self._time[key]
+        if isinstance(key, slice):
+            return self._implicit_time(np.arange(*key.indices(len(self))))
+        if np.ndim(key) == 0:
+            return self._implicit_time(range(len(self))[key])
+        key = np.asarray(key, dtype=np.int64)
+        if np.any((key < -len(self)) | (key >= len(self))):
+            raise IndexError('Index out of range')
+        return self._implicit_time(np.where(key < 0, key + len(self), key))
+
     def copy(self):
         new_trace = copy.copy(self)
         new_trace.current = self.current.copy()
         return new_trace
 
+    def to_dtype(self, dtype=None):
+        # Same trace with current in dtype (info.dtype if None), self if already
+        # in it or neither is set, the only place the working dtype is applied
+        if dtype is None:
+            dtype = self.info.dtype
+        if dtype is None or self.current.dtype == dtype:
+            return self
+        return self.with_current(self.current.astype(dtype))
+
+    def with_current(self, current):
+        # Same trace but with current replaced, without copying the old one
+        current = cast_1d_nonempty_numeric_array(current)
+        check_eq_shape(self.current, current)
+        new_trace = copy.copy(self)
+        new_trace.current = current
+        return new_trace
+
     def apply_mask(self, mask):
         self.current[mask] = np.nan
 
@@ -77,13 +140,30 @@ class Trace:
         new_trace.apply_mask(mask)
         return new_trace
 
+    def _sliced(self, key, current):
+        # New trace of slice key with the given current, time kept implicit where it can be
+        start, _, step = key.indices(len(self))
+        if self._time is None and step == 1:
+            time = None
+        else:
+            time = self.time_of(key) # Before current is replaced, else it would be for the slice
+        new_trace = copy.copy(self)
+        new_trace.current = current
+        new_trace.time = time
+        if time is None:
+            new_trace._time_start = self._time_start + start
+        return new_trace
+
     def __getitem__(self, key):
         if type(key) != slice:
             raise TypeError('Not subscriptable')
-        new_trace = self.copy()
-        new_trace.current = new_trace.current[key]
-        new_trace.time = new_trace.time[key]
-        return new_trace
+        return self._sliced(key, self.current[key].copy())
+
+    def view(self, key):
+        # Same as trace[key] but current is a view into this trace's, not a copy
+        if type(key) != slice:
+            raise TypeError('Not subscriptable')
+        return self._sliced(key, self.current[key])
 
     def interactive_fill_info(self):
         if self.raw is not None:
@@ -187,7 +267,8 @@ class Info(ParamContainer):
             pore_id=None,
             peaks_not_dips=None,
             max_event_width_seconds=None,
-            min_event_width_seconds=None
+            min_event_width_seconds=None,
+            dtype=None
             ):
         self.sampling_rate = sampling_rate
         self.label = label
@@ -196,6 +277,7 @@ class Info(ParamContainer):
         self.peaks_not_dips = peaks_not_dips
         self.max_event_width_seconds = max_event_width_seconds
         self.min_event_width_seconds = min_event_width_seconds
+        self.dtype = dtype
 
     @property
     def sampling_period(self):
@@ -330,6 +412,19 @@ class Info(ParamContainer):
         check_nonnegative_int(value)
         self._min_event_width_seconds = self.to_seconds(value)
 
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @dtype.setter
+    def dtype(self, value):
+        # Working dtype, see WORKING_DTYPES, None to keep the dtype data was loaded as
+        if value is not None:
+            value = np.dtype(value).name
+            if value not in WORKING_DTYPES:
+                raise ValueError(f'Not a working dtype: {value}')
+        self._dtype = value
+
     def to_dict(self):
         dic = {
             'sampling_rate': self.sampling_rate,
@@ -338,7 +433,8 @@ class Info(ParamContainer):
             'pore_id': self.pore_id,
             'peaks_not_dips': self.peaks_not_dips,
             'max_event_width_seconds': self.max_event_width_seconds,
-            'min_event_width_seconds': self.min_event_width_seconds
+            'min_event_width_seconds': self.min_event_width_seconds,
+            'dtype': self.dtype
             }
         return dic
 
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+
+from warnings import warn
+
+from pathlib import Path
+
+import numpy as np
+
+from ..utils.paramcontainer import ParamContainer
+from ..utils.validators import check_positive_numeric, check_nonnegative_int, check_positive_int
+
+from .common import Trace, Info, DataLoader
+
+#%%
+
+class RawBinary(DataLoader):
+    name = 'rawbinary'
+    '''
+    Interface for raw headerless binary recordings, e.g. straight dumps from
+    acquisition hardware
+
+    The binary file itself (*.bin) carries no information about its layout,
+    this is instead read from a JSON sidecar next to it, named by appending
+    .json to the full file name, i.e. "xyz.bin" -> "xyz.bin.json"
+    (Not "xyz.json", that is where pipeline settings go)
+    See RawBinary.Layout for the sidecar fields
+
+    The file is never read into memory up front, it is memory-mapped instead,
+    so loading is near instant regardless of file size and samples are only
+    paged in when used
+
+    For floating point files, Trace.current is the memmap itself
+    The memmap is copy-on-write, masking etc. never touches the file on disk
+
+    For integer files (raw ADC counts), samples must be scaled to nA and
+    cannot hold nan for masking, so the file is converted to a float32 array
+    in memory (in blocks, so only ever one block of float64 temporaries)
+    This is a full read of the file, store recordings as float32 if load time matters
+    '''
+
+    SUFFIX = '.bin'
+    SIDECAR_SUFFIX = '.json'
+    CONVERSION_BLOCK_SIZE = 10_000_000
+
+    def __init__(self, bin_file, layout=None):
+        bin_file = Path(bin_file)
+        if bin_file.suffix != self.SUFFIX:
+            raise ValueError('Not a raw binary file')
+        if not bin_file.is_file():
+            raise FileNotFoundError(f'File does not exist: {bin_file}')
+        self._path = bin_file
+
+        if layout is None:
+            layout = self.Layout.from_json_file(self.sidecar_path(bin_file))
+        else:
+            layout = self.Layout(layout)
+        layout.check_valid()
+        self.layout = layout
+
+        self._memmap = self._open_memmap()
+
+    @staticmethod
+    def sidecar_path(path):
+        path = Path(path)
+        return path.with_name(path.name + RawBinary.SIDECAR_SUFFIX)
+
+    def _open_memmap(self):
+        dtype = np.dtype(self.layout.dtype)
+        channels = self.layout.channels
+
+        file_size = self.path.stat().st_size
+        data_size = file_size - self.layout.offset
+        frame_size = dtype.itemsize * channels
+        if data_size <= 0:
+            raise ValueError(f'No data after offset: {self.layout.offset}')
+        if data_size % frame_size != 0:
+            warn(f'File size not a whole number of samples, ignoring trailing {data_size % frame_size} bytes')
+        n_frames = data_size // frame_size
+
+        memmap = np.memmap(
+            self.path,
+            dtype=dtype,
+            mode='c', # Copy-on-write
+            offset=self.layout.offset,
+            shape=(n_frames, channels)
+            )
+        return memmap
+
+    @property
+    def samples(self):
+        return self._memmap[:, self.layout.channel] # Strided view if multichannel, no copy
+
+    def to_trace(self):
+        samples = self.samples
+        scale = self.layout.scale
+
+        if samples.dtype.kind == 'f':
+            if scale != 1.0:
+                # Scaling is a full copy anyway
+                current = samples * samples.dtype.type(scale)
+            else:
+                current = samples
+        else:
+            current = np.empty(len(samples), dtype=np.float32)
+            block_size = self.CONVERSION_BLOCK_SIZE
+            for i in range(0, len(samples), block_size):
+                current[i:i+block_size] = samples[i:i+block_size] * scale
+
+        return Trace(
+            current,
+            info=Info(
+                sampling_rate=self.layout.sampling_rate
+                ),
+            raw=self
+            )
+
+    @property
+    def path(self):
+        return self._path
+
+    @staticmethod
+    def scan(path, recursive=True, ignore_sets=True):
+        scan_dir = Path(path)
+
+        if recursive:
+            glob_pattern = '**/*' + RawBinary.SUFFIX
+        else:
+            glob_pattern = '*' + RawBinary.SUFFIX
+
+        if ignore_sets:
+            ret = []
+            for path in scan_dir.glob(glob_pattern):
+                if not (path.parent/'this_is_a_set.txt').exists():
+                    ret.append(path)
+            return ret
+        else:
+            return list(scan_dir.glob(glob_pattern))
+
+    @staticmethod
+    def scan_sets(path, max_depth=4):
+        if type(max_depth) != int or max_depth < 0:
+            raise ValueError('Invalid max recurse depth')
+
+        scan_dir = Path(path)
+
+        datadirs = []
+        subdirs = []
+        for child in scan_dir.iterdir():
+            if RawBinary.is_set(child):
+                datadirs.append(child)
+            elif child.is_dir():
+                subdirs.append(child)
+        if max_depth > 0:
+            for subdir in subdirs:
+                datadirs.extend( RawBinary.scan_sets(subdir, max_depth=max_depth-1) )
+        return datadirs
+
+    @staticmethod
+    def is_set(path):
+        path = Path(path)
+        if not path.is_dir():
+            return False
+        if any(path.glob('*' + RawBinary.SUFFIX)) and (path/'this_is_a_set.txt').exists():
+            return True
+        else:
+            return False
+
+    @staticmethod
+    def set_members(path):
+        return list(Path(path).glob('*' + RawBinary.SUFFIX))
+
+    class Layout(ParamContainer):
+        def _init(
+                self,
+                dtype=None,
+                sampling_rate=None,
+                offset=0,
+                scale=1.0,
+                channels=1,
+                channel=0
+                ):
+            self.dtype = dtype # Any numpy dtype string e.g. "int16", "<f4"
+            self.sampling_rate = sampling_rate # Hz
+            self.offset = offset # Bytes to skip at start of file, e.g. a header
+            self.scale = scale # Multiplier to get from stored values to nA
+            self.channels = channels # Number of interleaved channels
+            self.channel = channel # Which channel is the current
+
+        @property
+        def dtype(self):
+            return self._dtype
+
+        @dtype.setter
+        def dtype(self, value):
+            if value is not None:
+                kind = np.dtype(value).kind # Dont catch this
+                if kind not in 'if':
+                    raise ValueError(f'Not an integer or float dtype: {value}')
+                value = str(value)
+            self._dtype = value
+
+        @property
+        def sampling_rate(self):
+            return self._sampling_rate
+
+        @sampling_rate.setter
+        def sampling_rate(self, value):
+            if value is not None:
+                check_positive_numeric(value)
+                value = float(value)
+            self._sampling_rate = value
+
+        @property
+        def offset(self):
+            return self._offset
+
+        @offset.setter
+        def offset(self, value):
+            check_nonnegative_int(value)
+            self._offset = int(value)
+
+        @property
+        def scale(self):
+            return self._scale
+
+        @scale.setter
+        def scale(self, value):
+            check_positive_numeric(value)
+            self._scale = float(value)
+
+        @property
+        def channels(self):
+            return self._channels
+
+        @channels.setter
+        def channels(self, value):
+            check_positive_int(value)
+            self._channels = int(value)
+
+        @property
+        def channel(self):
+            return self._channel
+
+        @channel.setter
+        def channel(self, value):
+            check_nonnegative_int(value)
+            self._channel = int(value)
+
+        def check_valid(self):
+            if self.dtype is None:
+                raise ValueError('Dtype not specified')
+            if self.channel >= self.channels:
+                raise ValueError(f'Channel out of range: {self.channel}, {self.channels}')
+
+        def to_dict(self):
+            dic = {
+                'dtype': self.dtype,
+                'sampling_rate': self.sampling_rate,
+                'offset': self.offset,
+                'scale': self.scale,
+                'channels': self.channels,
+                'channel': self.channel
+                }
+            return dic
@@ -0,0 +1,573 @@
+# -*- coding: utf-8 -*-
+
+from warnings import warn
+
+import numpy as np
+
+from ..utils.paramcontainer import ParamContainer
+from ..utils.validators import check_bool, check_numeric, check_positive_numeric, check_nonnegative, check_positive_int, check_nonnegative_int
+from ..utils.convenience import readonly_view
+
+from .common import Trace, Info, DataLoader
+
+#%%
+
+def place_intervals(rng, samples, count, min_width, max_width, min_gap):
+    '''
+    Up to count non-overlapping [start, end) intervals in range(samples),
+    sorted, with widths uniform in [min_width, max_width] and at least
+    min_gap samples between them (and from either end of the range)
+    Gaps on top of min_gap are exponential with the mean that spreads count
+    intervals over the whole range, so intervals arrive like a Poisson process
+
+    Returns starts, ends, int64 arrays
+    '''
+    if count == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty.copy()
+    widths = rng.integers(min_width, max_width+1, count)
+    spare = samples - count*min_gap - widths.sum()
+    mean_gap = max(spare, 0) / count
+    gaps = min_gap + rng.exponential(mean_gap, count).astype(np.int64)
+    starts = np.cumsum(gaps) + np.concatenate([[0], np.cumsum(widths[:-1])])
+    ends = starts + widths
+    keep = ends + min_gap <= samples # Those the exponential tail pushed off the end
+    return starts[keep], ends[keep]
+
+def colored_noise(rng, samples, exponent):
+    '''
+    Unit std gaussian noise with power spectral density ~ 1/f**exponent
+    0 is white, 1 pink (flicker), 2 brown (random walk)
+    '''
+    white = rng.standard_normal(samples)
+    if exponent == 0:
+        return white
+    spectrum = np.fft.rfft(white)
+    del white
+    freqs = np.fft.rfftfreq(samples)
+    freqs[0] = np.inf # No DC, else it blows up
+    spectrum *= freqs ** (-exponent/2)
+    del freqs
+    noise = np.fft.irfft(spectrum, n=samples)
+    noise /= np.std(noise)
+    return noise
+
+def score_detection(truth, detected):
+    '''
+    Match detected [start, end) bounds against ground truth ones
+    Both sorted and non-overlapping among themselves, as from SyntheticTrace
+    and extractors
+    A detected event matches the truth event it overlaps, one to one, first
+    come first served, later detections of the same truth event are false
+    positives
+
+    Returns dict of counts, precision, recall and the mean absolute start
+    and end errors of matches in samples
+    '''
+    truth = np.asarray(truth, dtype=np.int64).reshape(-1, 2)
+    detected = np.asarray(detected, dtype=np.int64).reshape(-1, 2)
+
+    # First truth event ending after the detected start is the only one that can overlap it
+    idx = np.searchsorted(truth[:, 1], detected[:, 0], side='right')
+    in_range = idx < len(truth)
+    overlaps = np.zeros(len(detected), dtype=bool)
+    overlaps[in_range] = truth[idx[in_range], 0] < detected[in_range, 1]
+
+    matched_idx, first = np.unique(idx[overlaps], return_index=True)
+    matched_detected = detected[overlaps][first]
+    matched_truth = truth[matched_idx]
+
+    tp = len(matched_idx)
+    fp = len(detected) - tp
+    fn = len(truth) - tp
+    if tp > 0:
+        start_error = float(np.mean(np.abs(matched_detected[:, 0] - matched_truth[:, 0])))
+        end_error = float(np.mean(np.abs(matched_detected[:, 1] - matched_truth[:, 1])))
+    else:
+        start_error = np.nan
+        end_error = np.nan
+    return {
+        'true_positives': tp,
+        'false_positives': fp,
+        'false_negatives': fn,
+        'precision': tp / len(detected) if len(detected) > 0 else np.nan,
+        'recall': tp / len(truth) if len(truth) > 0 else np.nan,
+        'mean_abs_start_error': start_error,
+        'mean_abs_end_error': end_error
+        }
+
+#%%
+
+class SyntheticTrace(DataLoader):
+    name = 'synthetic'
+    '''
+    Generated trace with known ground truth, for benchmarking and checking
+    the cleaners and extractors without needing real recordings
+
+    current = baseline + drift + noise + events, then zaps on top
+        Drift is a sine plus a linear slope
+        Noise is gaussian with a 1/f**noise_exponent spectrum, plus an
+        optional line noise tone
+        Events are trapezoidal dips (or peaks) of random width and depth,
+        placed like a Poisson process with a minimum gap between them
+        Zaps replace the current with zap_level, as when the amplifier
+        saturates
+
+    Ground truth [start, end) bounds are in events and zaps, the bounds of
+    an event include its sloped edges
+    Events that would overlap a zap (within event_min_gap_seconds) are not
+    generated, zapped events have no meaningful ground truth
+
+    Extractors estimate the noise from the current around each event, events
+    much denser than the defaults raise that estimate and get missed, which
+    is realistic but makes for a poor benchmark
+
+    Same params (with a seed) always give the same trace
+    Not a DATALOADERS entry, there is nothing on disk to scan for
+    '''
+
+    def __init__(self, params=None, **kwargs):
+        if params is None:
+            params = self.Params(**kwargs)
+        else:
+            params = self.Params(params, **kwargs)
+        params.check_valid()
+        self.params = params
+        self._current, self._events, self._zaps = self._generate()
+
+    def _generate(self):
+        p = self.params
+        rng = np.random.default_rng(p.seed)
+        n = p.samples
+        fs = p.sampling_rate
+        to_samples = lambda seconds: max(1, int(round(seconds * fs)))
+        duration = n / fs
+
+        t = np.arange(n) / fs
+        current = np.full(n, p.baseline)
+        if p.drift_amplitude != 0:
+            phase = rng.uniform(0, 2*np.pi)
+            current += p.drift_amplitude * np.sin(2*np.pi*t/p.drift_period_seconds + phase)
+        if p.drift_slope != 0:
+            current += p.drift_slope * t
+        if p.line_noise_amplitude != 0:
+            current += p.line_noise_amplitude * np.sin(2*np.pi*p.line_noise_frequency*t)
+        del t
+        if p.noise_std != 0:
+            noise = colored_noise(rng, n, p.noise_exponent)
+            noise *= p.noise_std
+            current += noise
+            del noise
+
+        min_gap = to_samples(p.event_min_gap_seconds)
+
+        zap_width = to_samples(p.zap_width_seconds)
+        zap_starts, zap_ends = place_intervals(
+            rng, n, rng.poisson(p.zap_rate*duration),
+            zap_width, zap_width, min_gap
+            )
+
+        # Sloped edges come from a moving average of rise samples over
+        # rectangles, so each event gets rise-1 samples longer
+        rise = to_samples(p.event_rise_seconds)
+        min_width = to_samples(p.event_min_width_seconds)
+        max_width = max(min_width, to_samples(p.event_max_width_seconds))
+        starts, ends = place_intervals(
+            rng, n - rise, rng.poisson(p.event_rate*duration),
+            min_width, max_width, min_gap
+            )
+        if len(zap_starts) > 0:
+            # Drop events within min_gap of a zap
+            idx = np.searchsorted(zap_ends + min_gap, starts, side='right')
+            near = np.zeros(len(starts), dtype=bool)
+            in_range = idx < len(zap_starts)
+            near[in_range] = zap_starts[idx[in_range]] - min_gap < ends[in_range] + rise - 1
+            starts = starts[~near]
+            ends = ends[~near]
+
+        depths = rng.uniform(p.event_min_depth, p.event_max_depth, len(starts))
+        if not p.peaks_not_dips:
+            depths = -depths
+        steps = np.zeros(n+1)
+        steps[starts] += depths
+        steps[ends] -= depths
+        rects = np.cumsum(steps[:-1])
+        del steps
+        if rise > 1:
+            cum = np.cumsum(rects)
+            rects[rise:] = cum[rise:] - cum[:-rise]
+            rects[:rise] = cum[:rise]
+            rects /= rise
+            del cum
+        current += rects
+        del rects
+
+        for zap_start, zap_end in zip(zap_starts, zap_ends):
+            current[zap_start:zap_end] = p.zap_level
+
+        current = current.astype(p.dtype, copy=False)
+        events = np.stack([starts, ends + rise - 1], axis=1)
+        zaps = np.stack([zap_starts, zap_ends], axis=1)
+        return current, events, zaps
+
+    def to_trace(self):
+        p = self.params
+        # Detected events come out wider than true ones, so some headroom on
+        # the width limits the extractors filter on
+        info = Info(
+            sampling_rate=p.sampling_rate,
+            label=p.label,
+            signed_voltage=p.signed_voltage,
+            pore_id=p.pore_id,
+            peaks_not_dips=p.peaks_not_dips,
+            max_event_width_seconds=2*(p.event_max_width_seconds + p.event_rise_seconds),
+            min_event_width_seconds=p.event_min_width_seconds/2
+            )
+        return Trace(self._current.copy(), info=info, raw=self)
+
+    @property
+    def events(self):
+        return readonly_view(self._events)
+
+    @property
+    def zaps(self):
+        return readonly_view(self._zaps)
+
+    @property
+    def path(self):
+        return None
+
+    class Params(ParamContainer):
+        def _init(
+                self,
+                sampling_rate=250_000,
+                samples=1_000_000,
+                seed=None,
+                dtype='float64',
+                baseline=10.0,
+                drift_amplitude=0.5,
+                drift_period_seconds=2.0,
+                drift_slope=0.0,
+                noise_std=0.1,
+                noise_exponent=0.0,
+                line_noise_amplitude=0.0,
+                line_noise_frequency=39_000,
+                peaks_not_dips=False,
+                event_rate=20,
+                event_min_width_seconds=0.000_020,
+                event_max_width_seconds=0.001,
+                event_min_depth=1.0,
+                event_max_depth=2.0,
+                event_rise_seconds=0.000_004,
+                event_min_gap_seconds=0.010,
+                zap_rate=0.0,
+                zap_level=-20.0,
+                zap_width_seconds=0.001,
+                label=None,
+                signed_voltage=None,
+                pore_id=None
+                ):
+            self.sampling_rate = sampling_rate # Hz
+            self.samples = samples
+            self.seed = seed
+            self.dtype = dtype
+            self.baseline = baseline # nA
+            self.drift_amplitude = drift_amplitude # nA
+            self.drift_period_seconds = drift_period_seconds
+            self.drift_slope = drift_slope # nA/s
+            self.noise_std = noise_std # nA
+            self.noise_exponent = noise_exponent # 0 white, 1 pink, 2 brown
+            self.line_noise_amplitude = line_noise_amplitude # nA
+            self.line_noise_frequency = line_noise_frequency # Hz
+            self.peaks_not_dips = peaks_not_dips
+            self.event_rate = event_rate # Per second, on average
+            self.event_min_width_seconds = event_min_width_seconds
+            self.event_max_width_seconds = event_max_width_seconds
+            self.event_min_depth = event_min_depth # nA
+            self.event_max_depth = event_max_depth # nA
+            self.event_rise_seconds = event_rise_seconds # Edge rise/fall time
+            self.event_min_gap_seconds = event_min_gap_seconds
+            self.zap_rate = zap_rate # Per second, on average
+            self.zap_level = zap_level # nA
+            self.zap_width_seconds = zap_width_seconds
+            # Passed through to trace info, for pipelines that need them
+            self.label = label
+            self.signed_voltage = signed_voltage
+            self.pore_id = pore_id
+
+        @property
+        def sampling_rate(self):
+            return self._sampling_rate
+
+        @sampling_rate.setter
+        def sampling_rate(self, value):
+            check_positive_numeric(value)
+            self._sampling_rate = float(value)
+
+        @property
+        def samples(self):
+            return self._samples
+
+        @samples.setter
+        def samples(self, value):
+            check_positive_int(value)
+            self._samples = int(value)
+
+        @property
+        def seed(self):
+            return self._seed
+
+        @seed.setter
+        def seed(self, value):
+            if value is not None:
+                check_nonnegative_int(value)
+                value = int(value)
+            self._seed = value
+
+        @property
+        def dtype(self):
+            return self._dtype
+
+        @dtype.setter
+        def dtype(self, value):
+            if np.dtype(value).kind != 'f': # Dont catch this
+                raise ValueError(f'Not a float dtype: {value}')
+            self._dtype = str(np.dtype(value))
+
+        @property
+        def baseline(self):
+            return self._baseline
+
+        @baseline.setter
+        def baseline(self, value):
+            check_numeric(value)
+            self._baseline = float(value)
+
+        @property
+        def drift_amplitude(self):
+            return self._drift_amplitude
+
+        @drift_amplitude.setter
+        def drift_amplitude(self, value):
+            check_nonnegative(value)
+            self._drift_amplitude = float(value)
+
+        @property
+        def drift_period_seconds(self):
+            return self._drift_period_seconds
+
+        @drift_period_seconds.setter
+        def drift_period_seconds(self, value):
+            check_positive_numeric(value)
+            self._drift_period_seconds = float(value)
+
+        @property
+        def drift_slope(self):
+            return self._drift_slope
+
+        @drift_slope.setter
+        def drift_slope(self, value):
+            check_numeric(value)
+            self._drift_slope = float(value)
+
+        @property
+        def noise_std(self):
+            return self._noise_std
+
+        @noise_std.setter
+        def noise_std(self, value):
+            check_nonnegative(value)
+            self._noise_std = float(value)
+
+        @property
+        def noise_exponent(self):
+            return self._noise_exponent
+
+        @noise_exponent.setter
+        def noise_exponent(self, value):
+            check_nonnegative(value)
+            if value > 2:
+                warn(f'Noise exponent above 2, noise will be dominated by the lowest frequencies: {value}')
+            self._noise_exponent = float(value)
+
+        @property
+        def line_noise_amplitude(self):
+            return self._line_noise_amplitude
+
+        @line_noise_amplitude.setter
+        def line_noise_amplitude(self, value):
+            check_nonnegative(value)
+            self._line_noise_amplitude = float(value)
+
+        @property
+        def line_noise_frequency(self):
+            return self._line_noise_frequency
+
+        @line_noise_frequency.setter
+        def line_noise_frequency(self, value):
+            check_positive_numeric(value)
+            self._line_noise_frequency = float(value)
+
+        @property
+        def peaks_not_dips(self):
+            return self._peaks_not_dips
+
+        @peaks_not_dips.setter
+        def peaks_not_dips(self, value):
+            check_bool(value)
+            self._peaks_not_dips = value
+
+        @property
+        def event_rate(self):
+            return self._event_rate
+
+        @event_rate.setter
+        def event_rate(self, value):
+            check_nonnegative(value)
+            self._event_rate = float(value)
+
+        @property
+        def event_min_width_seconds(self):
+            return self._event_min_width_seconds
+
+        @event_min_width_seconds.setter
+        def event_min_width_seconds(self, value):
+            check_positive_numeric(value)
+            self._event_min_width_seconds = float(value)
+
+        @property
+        def event_max_width_seconds(self):
+            return self._event_max_width_seconds
+
+        @event_max_width_seconds.setter
+        def event_max_width_seconds(self, value):
+            check_positive_numeric(value)
+            self._event_max_width_seconds = float(value)
+
+        @property
+        def event_min_depth(self):
+            return self._event_min_depth
+
+        @event_min_depth.setter
+        def event_min_depth(self, value):
+            check_positive_numeric(value)
+            self._event_min_depth = float(value)
+
+        @property
+        def event_max_depth(self):
+            return self._event_max_depth
+
+        @event_max_depth.setter
+        def event_max_depth(self, value):
+            check_positive_numeric(value)
+            self._event_max_depth = float(value)
+
+        @property
+        def event_rise_seconds(self):
+            return self._event_rise_seconds
+
+        @event_rise_seconds.setter
+        def event_rise_seconds(self, value):
+            check_nonnegative(value)
+            self._event_rise_seconds = float(value)
+
+        @property
+        def event_min_gap_seconds(self):
+            return self._event_min_gap_seconds
+
+        @event_min_gap_seconds.setter
+        def event_min_gap_seconds(self, value):
+            check_positive_numeric(value)
+            self._event_min_gap_seconds = float(value)
+
+        @property
+        def zap_rate(self):
+            return self._zap_rate
+
+        @zap_rate.setter
+        def zap_rate(self, value):
+            check_nonnegative(value)
+            self._zap_rate = float(value)
+
+        @property
+        def zap_level(self):
+            return self._zap_level
+
+        @zap_level.setter
+        def zap_level(self, value):
+            check_numeric(value)
+            self._zap_level = float(value)
+
+        @property
+        def zap_width_seconds(self):
+            return self._zap_width_seconds
+
+        @zap_width_seconds.setter
+        def zap_width_seconds(self, value):
+            check_positive_numeric(value)
+            self._zap_width_seconds = float(value)
+
+        @property
+        def label(self):
+            return self._label
+
+        @label.setter
+        def label(self, value):
+            self._label = value # Validated by Info
+
+        @property
+        def signed_voltage(self):
+            return self._signed_voltage
+
+        @signed_voltage.setter
+        def signed_voltage(self, value):
+            self._signed_voltage = value # Validated by Info
+
+        @property
+        def pore_id(self):
+            return self._pore_id
+
+        @pore_id.setter
+        def pore_id(self, value):
+            self._pore_id = value # Validated by Info
+
+        def check_valid(self):
+            if self.event_max_width_seconds < self.event_min_width_seconds:
+                raise ValueError(f'Max event width smaller than min event width: {self.event_max_width_seconds}, {self.event_min_width_seconds}')
+            if self.event_max_depth < self.event_min_depth:
+                raise ValueError(f'Max event depth smaller than min event depth: {self.event_max_depth}, {self.event_min_depth}')
+            if self.line_noise_frequency >= self.sampling_rate/2:
+                warn(f'Line noise frequency at or above Nyquist, it will alias: {self.line_noise_frequency}')
+            if self.event_min_width_seconds * self.sampling_rate < 2:
+                warn(f'Min event width less than 2 samples: {self.event_min_width_seconds}')
+
+        def to_dict(self):
+            dic = {
+                'sampling_rate': self.sampling_rate,
+                'samples': self.samples,
+                'seed': self.seed,
+                'dtype': self.dtype,
+                'baseline': self.baseline,
+                'drift_amplitude': self.drift_amplitude,
+                'drift_period_seconds': self.drift_period_seconds,
+                'drift_slope': self.drift_slope,
+                'noise_std': self.noise_std,
+                'noise_exponent': self.noise_exponent,
+                'line_noise_amplitude': self.line_noise_amplitude,
+                'line_noise_frequency': self.line_noise_frequency,
+                'peaks_not_dips': self.peaks_not_dips,
+                'event_rate': self.event_rate,
+                'event_min_width_seconds': self.event_min_width_seconds,
+                'event_max_width_seconds': self.event_max_width_seconds,
+                'event_min_depth': self.event_min_depth,
+                'event_max_depth': self.event_max_depth,
+                'event_rise_seconds': self.event_rise_seconds,
+                'event_min_gap_seconds': self.event_min_gap_seconds,
+                'zap_rate': self.zap_rate,
+                'zap_level': self.zap_level,
+                'zap_width_seconds': self.zap_width_seconds,
+                'label': self.label,
+                'signed_voltage': self.signed_voltage,
+                'pore_id': self.pore_id
+                }
+            return dic
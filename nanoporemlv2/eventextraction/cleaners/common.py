@@ -8,6 +8,7 @@ from ...utils.paramcontainer import ParamContainer
 
 class Cleaner:
     name = None
+    modifies_current = True # Changes values of current, False if it only selects from it
 
     def __init__(self):
         raise RuntimeError('Cleaners are not meant to be initialized')
@@ -28,6 +29,27 @@ class Cleaner:
     def _run(trace, params):
         raise NotImplementedError
 
+    @classmethod
+    def run_inplace(cls, trace, params=None, **kwargs):
+        '''
+        Same as run, but the current of trace may be changed in place and the
+        returned trace may share it
+        For cleaner chains that own their trace, see EventExtractionPipeline.clean
+        '''
+        assert issubclass(cls.Params, ParamContainer)
+
+        if params is None:
+            params = cls.Params(**kwargs)
+        else:
+            params = cls.Params(params, **kwargs)
+        params.check_valid()
+
+        return cls._run_inplace(trace, params)
+
+    @classmethod
+    def _run_inplace(cls, trace, params):
+        return cls._run(trace, params) # Cleaners without an in place version copy as usual
+
     class Params(ParamContainer):
         pass
 
@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 
 from warnings import warn
+from functools import lru_cache
+
+import concurrent.futures
+import os
 
 import numpy as np
 import scipy.signal as sig
@@ -28,6 +32,104 @@ def combine_sos(*soses):
 
 #%%
 
+# Filtering is done block by block, see blocked_sosfiltfilt
+FILTER_BLOCK_SIZE = 2**20
+FILTER_WORKERS = min(4, os.cpu_count() or 1)
+
+def sos_settle_samples(sos, tol=1e-12, max_samples=2**24):
+    '''
+    Samples after which the impulse response of sos stays below tol times
+    its peak, i.e. how far the effect of anything (such as a block edge)
+    reaches through one pass of the filter
+    Cached per sos, as finding it can take filtering up to max_samples
+    samples several times
+    '''
+    sos = np.ascontiguousarray(sos, dtype=np.float64)
+    return _sos_settle_samples(sos.tobytes(), sos.shape, tol, max_samples)
+
+@lru_cache(maxsize=64)
+def _sos_settle_samples(sos_bytes, shape, tol, max_samples):
+    sos = np.frombuffer(sos_bytes, dtype=np.float64).reshape(shape).copy() # sosfilt needs it writeable
+    length = 1024
+    while True:
+        impulse = np.zeros(length)
+        impulse[0] = 1
+        response = np.abs(sig.sosfilt(sos, impulse))
+        above = np.flatnonzero(response > tol*response.max())
+        settled = above[-1] + 1
+        if settled <= length//2 or length >= max_samples:
+            return int(settled)
+        length *= 2
+
+def blocked_sosfiltfilt(sos, x, out=None, block_size=None, margin=None, max_workers=None):
+    '''
+    sig.sosfiltfilt(sos, x) done block_size samples at a time, each block
+    filtered together with margin samples of x on either side that are then
+    dropped, blocks run across max_workers threads (scipy filters without
+    holding the GIL)
+
+    Matches sosfiltfilt within the tolerance margin was settled to, see
+    sos_settle_samples, exactly at the ends of x as those are padded and
+    initialized the same way
+    Exception is nan, which the passes spread over every sample they run
+    over after it: over the whole block it is in (and the block beside it if
+    within margin of their boundary) instead of over all of x
+
+    out: array of x's shape to write to, can be x itself, new if None (of
+        x's dtype if float, the blocks are filtered in float64 regardless)
+    Memory is a few blocks per worker instead of several times all of x
+    '''
+    x = np.asarray(x)
+    if block_size is None:
+        block_size = FILTER_BLOCK_SIZE
+    if margin is None:
+        margin = 2*sos_settle_samples(sos) # Generous, cheap compared to block_size
+    margin = max(margin, 3*(2*len(sos)+1)) # Blocks need to be longer than sosfiltfilt's padding
+    if max_workers is None:
+        max_workers = FILTER_WORKERS
+    if out is None:
+        out = np.empty(x.shape, dtype=x.dtype if x.dtype.kind == 'f' else np.float64) # Keeps working dtype
+    elif out.shape != x.shape:
+        raise ValueError(f'Output shape {out.shape} not same as input shape {x.shape}')
+
+    n = len(x)
+    if n <= block_size + 2*margin:
+        out[...] = sig.sosfiltfilt(sos, x)
+        return out
+
+    bounds = list(range(0, n, block_size)) + [n]
+    # Samples around every boundary between blocks, read by the blocks either
+    # side of it, copied first so that blocks can be written back to x
+    edges = {
+        b: x[max(0, b-margin):min(n, b+margin)].copy() for b in bounds[1:-1]
+        }
+
+    def filter_block(i):
+        start, end = bounds[i], bounds[i+1]
+        parts = []
+        if i > 0:
+            parts.append(edges[start][:start-max(0, start-margin)])
+        parts.append(x[start:end])
+        if i < len(bounds)-2:
+            parts.append(edges[end][end-max(0, end-margin):])
+        padded = np.concatenate(parts)
+        offset = len(parts[0]) if i > 0 else 0
+        out[start:end] = sig.sosfiltfilt(sos, padded)[offset:offset+end-start]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for _ in executor.map(filter_block, range(len(bounds)-1)):
+            pass # Raise any errors
+    return out
+
+def filter_inplace(sos, trace):
+    # Filtered into trace's own current where it can hold the result
+    if trace.current.dtype.kind == 'f' and trace.current.flags.writeable:
+        blocked_sosfiltfilt(sos, trace.current, out=trace.current)
+        return trace
+    return trace.with_current(blocked_sosfiltfilt(sos, trace.current))
+
+#%%
+
 PRESETS = {
     'Elements200kHz_Custom35kLPF': combine_sos(
         sig.butter(8, fs=200_000, Wn=35000, btype='lowpass', output='sos'), # Basic 35kHz fc LPF
@@ -87,11 +189,13 @@ class PresetFilter(Cleaner):
     @staticmethod
     def _run(trace, params):
         sos = PRESETS[params.preset]
-        filtered = sig.sosfiltfilt(sos, trace.current)
+        filtered = blocked_sosfiltfilt(sos, trace.current)
         # filtered = sig.sosfilt(sos, trace.current)
-        new_trace = trace.copy()
-        new_trace.current = filtered
-        return new_trace
+        return trace.with_current(filtered)
+
+    @staticmethod
+    def _run_inplace(trace, params):
+        return filter_inplace(PRESETS[params.preset], trace)
 
     @classmethod
     def _interactive_gen_params(cls, trace, params):
@@ -151,11 +255,14 @@ class LowPassFilter(Cleaner):
     @staticmethod
     def _run(trace, params):
         sos = sig.butter(params.N, params.fc, btype='low', output='sos', fs=trace.info.sampling_rate)
-        filtered = sig.sosfiltfilt(sos, trace.current)
+        filtered = blocked_sosfiltfilt(sos, trace.current)
         # filtered = sig.sosfilt(sos, trace.current)
-        new_trace = trace.copy()
-        new_trace.current = filtered
-        return new_trace
+        return trace.with_current(filtered)
+
+    @staticmethod
+    def _run_inplace(trace, params):
+        sos = sig.butter(params.N, params.fc, btype='low', output='sos', fs=trace.info.sampling_rate)
+        return filter_inplace(sos, trace)
 
     @classmethod
     def _interactive_gen_params(cls, trace, params):
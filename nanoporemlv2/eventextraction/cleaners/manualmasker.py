@@ -60,10 +60,15 @@ class ManualMasker(Cleaner):
     @staticmethod
     def _run(trace, params):
         new_trace = trace.copy()
-        for slice_start, slice_end in params.slices:
-            new_trace.apply_mask(slice(slice_start, slice_end))
+        ManualMasker._run_inplace(new_trace, params)
         return new_trace
 
+    @staticmethod
+    def _run_inplace(trace, params):
+        for slice_start, slice_end in params.slices:
+            trace.apply_mask(slice(slice_start, slice_end))
+        return trace
+
     @classmethod
     def _interactive_gen_params(cls, trace, params):
         sfig_orig = ScrollableFig()
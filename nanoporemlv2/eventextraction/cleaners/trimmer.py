@@ -16,6 +16,7 @@ from .common import Cleaner
 
 class Trimmer(Cleaner):
     name = 'trimmer'
+    modifies_current = False
 
     class Params(ParamContainer):
         def _init(
@@ -62,6 +63,10 @@ class Trimmer(Cleaner):
     def _run(trace, params):
         return trace[params.slice_start:params.slice_end]
 
+    @staticmethod
+    def _run_inplace(trace, params):
+        return trace.view(slice(params.slice_start, params.slice_end))
+
     @classmethod
     def _interactive_gen_params(cls, trace, params):
         sfig1 = ScrollableFig()
@@ -15,6 +15,7 @@ from ...interactiveutils.scrollablefig import ScrollableFig
 from ...interactiveutils.input_funcs import input_float, input_1_safe, input_1, input_int_strict
 
 from .common import Cleaner
+from ..utils import threshold_runs, merged_intervals
 
 #%%
 
@@ -91,30 +92,34 @@ class ZapMasker(Cleaner):
 
     @staticmethod
     def _run(trace, params):
+        new_trace = trace.copy()
+        ZapMasker._run_inplace(new_trace, params)
+        return new_trace
+
+    @staticmethod
+    def _run_inplace(trace, params):
         roll_samples = trace.info.to_samples(params.roll_seconds)
         shift = int(roll_samples) # Margin of "safety" to gurantee overlap
 
-        pos = None
-        if params.positive_zap_threshold:
-            pos = trace.current > params.positive_zap_threshold
-
-        neg = None
-        if params.negative_zap_threshold:
-            neg = trace.current < params.negative_zap_threshold
-
-        if pos is not None and neg is not None:
-            mask = pos | neg
-        elif neg is None:
-            mask = pos
-        else:
-            mask = neg
-
-        for _ in range(params.extra_collateral_damage_rolls):
-            rolled_left = np.roll(mask, -shift)
-            rolled_right = np.roll(mask, shift)
-            mask = rolled_left | mask | rolled_right
-
-        return trace.masked(mask)
+        # Each roll ORs the mask with itself shifted by shift either way, so
+        # for zaps longer than the shift, the rolls grow each zap by shift on
+        # both sides, done here directly on the zap bounds
+        # Unlike rolling, zaps shorter than the shift are grown without gaps,
+        # and growth stops at the ends of the trace instead of wrapping around
+        zap_starts, zap_ends = threshold_runs(
+            trace.current,
+            lower=params.negative_zap_threshold,
+            upper=params.positive_zap_threshold
+            )
+        starts, ends = merged_intervals(
+            zap_starts, zap_ends,
+            margin=shift*params.extra_collateral_damage_rolls,
+            length=len(trace)
+            )
+
+        for start, end in zip(starts, ends):
+            trace.apply_mask(slice(start, end))
+        return trace
 
     @classmethod
     def _interactive_gen_params(cls, trace, params):
@@ -9,7 +9,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 from ..utils.casting import cast_1d_nonempty_numeric_array
-from ..utils.validators import check_nonnegative_int, check_eq_shape
+from ..utils.validators import check_nonnegative_int, check_eq_shape, check_numeric
 from ..utils.convenience import readonly_view
 
 from ..dataloaders.common import Trace, Info
@@ -29,6 +29,16 @@ class Event:
         self.baseline = baseline
         self.set_start_end(start, end)
 
+    @classmethod
+    def _init_nocheck(cls, trace, baseline, start, end):
+        # For events materialized from an EventTable, which checked them all at once
+        event = cls.__new__(cls)
+        event._trace = trace
+        event._baseline = baseline
+        event._start = start
+        event._end = end
+        return event
+
     @property
     def trace_info(self):
         return self._trace.info
@@ -41,6 +51,10 @@ class Event:
     def time(self):
         return self._trace.time
 
+    def _time_of(self, key):
+        # Time of int or slice key, without generating all of it if implicit
+        return self._trace.time_of(key)
+
     def __getitem__(self, key):
         if key == 0:
             return self.start
@@ -99,11 +113,11 @@ class Event:
 
     @property
     def start_time(self):
-        return self.time[self._start]
+        return self._time_of(self._start)
 
     @property
     def end_time(self):
-        return self.time[self._end-1]
+        return self._time_of(self._end-1)
 
     def _calc_expanded_start_end(self, expand):
         start = max(0, self.start-expand)
@@ -125,7 +139,9 @@ class Event:
         return self._gen_view(self.baseline, expand=expand, readonly=False)
 
     def view_time(self, expand=0):
-        return self._gen_view(self.time, expand=expand, readonly=True)
+        check_nonnegative_int(expand)
+        start, end = self._calc_expanded_start_end(expand)
+        return readonly_view(self._time_of(slice(start, end)))
 
     def __len__(self):
         return self.end - self.start
@@ -164,16 +180,23 @@ class Event:
         capture_start, capture_end = self._calc_expanded_start_end(expand)
         rel_event_start = self.start - capture_start
         rel_event_end = self.end - capture_start
+        if self._trace.time_is_implicit:
+            time = None
+            time_start = self._trace.time_of(capture_start)
+        else:
+            time = self.view_time(expand)
+            time_start = None
         return PortableEvent(
             self.trace_info,
             self.view_current(expand),
-            self.view_time(expand),
+            time,
             self.view_baseline(expand),
             rel_event_start,
             rel_event_end,
             self.start,
             self.end,
-            no_check=True
+            no_check=True,
+            time_start=time_start
             )
 
 #%%
@@ -188,21 +211,29 @@ class PortableEvent(Event):
                  rel_end,
                  orig_start,
                  orig_end,
-                 no_check=False
+                 no_check=False,
+                 time_start=None
                  ):
+        # time None for implicit time, time_start + index * sampling period
         if not no_check:
             trace_info = Info(trace_info)
             trace_info.check_valid()
             current = cast_1d_nonempty_numeric_array(current)
-            time = cast_1d_nonempty_numeric_array(time)
+            if (time is None) == (time_start is None):
+                raise ValueError('Need exactly one of time and time_start')
+            if time is not None:
+                time = cast_1d_nonempty_numeric_array(time)
+                check_eq_shape(current, time)
+            else:
+                check_numeric(time_start)
             baseline = cast_1d_nonempty_numeric_array(baseline)
-            check_eq_shape(current, time)
             check_eq_shape(current, baseline)
 
         self._trace_info = trace_info
 
         self._current = current
         self._time = time
+        self._time_start = None if time_start is None else float(time_start)
         self._baseline = baseline
 
         self.set_start_end(orig_start, orig_end) # Check them only
@@ -223,7 +254,23 @@ class PortableEvent(Event):
 
     @property
     def time(self):
-        return readonly_view(self._time)
+        return readonly_view(self._time_of(slice(None)))
+
+    @property
+    def time_is_implicit(self):
+        return self._time is None
+
+    @property
+    def time_start(self):
+        # Time of the first captured sample
+        if self._time is None:
+            return self._time_start
+        return self._time[0]
+
+    def _time_of(self, key):
+        if self._time is not None:
+            return self._time[key]
+        return self._time_start + np.arange(len(self._current))[key] * self._trace_info.sampling_period
 
     @property
     def baseline(self):
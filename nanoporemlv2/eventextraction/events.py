@@ -3,6 +3,7 @@
 from warnings import warn
 
 from collections import UserList
+from collections.abc import Sequence
 from pathlib import Path
 from zipfile import ZipFile
 import json
@@ -10,30 +11,424 @@ import json
 import numpy as np
 
 from ..utils import npztools
+from ..utils.validators import check_eq_shape
+from ..utils.casting import cast_1d_nonempty_numeric_array
 
 from ..dataloaders.common import Trace, Info
 
 from .event import Event, PortableEvent
+from .filters import min_max_filt
+from .utils import merged_intervals
 
 from ..signal.signal import Signals
 
 #%%
 
+EVENTS_FORMATS = ['legacy', 'columnar', 'segments']
+DEFAULT_EVENTS_FORMAT = 'columnar'
+
+# legacy:
+#   One arr_N member per event, each a 3xN stack of current, time, baseline
+#   Plus bounds.csv with one row of rel_start,rel_end,orig_start,orig_end per event
+# columnar:
+#   current, time, baseline members, each all events concatenated
+#   offsets member, event i is [offsets[i]:offsets[i+1]] of the above
+#   If time is implicit (see PortableEvent), time_starts member with the time
+#   of the first captured sample of each event instead of time
+#   bounds member, int array with one row of rel_start,rel_end,orig_start,orig_end per event
+#   format.txt member saying "columnar"
+# segments:
+#   As columnar, but current, baseline (and time if explicit) hold the union
+#   of all events' captured regions, each sample once, regions concatenated
+#   windows member instead of offsets, event i is [windows[i, 0]:windows[i, 1]]
+#   of the above, overlapping where the captured regions of events do
+#   Size goes with the samples covered instead of the sum of capture lengths,
+#   which counts samples many times over when events are dense
+#   format.txt member saying "segments"
+# All have trace_info.json and meta.json and share the .events.npz suffix
+
+def ragged_gather_indices(starts, ends):
+    # Indices of [starts[i]:ends[i]] for every i concatenated, and where each
+    # one begins in that, i.e. a[idx][offsets[i]:offsets[i+1]] is a[starts[i]:ends[i]]
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(ends, dtype=np.int64) - starts
+    offsets = np.zeros(len(lengths)+1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    idx = np.arange(offsets[-1], dtype=np.int64) - np.repeat(offsets[:-1] - starts, lengths)
+    return idx, offsets
+
+def union_regions(starts, ends):
+    '''
+    Union of intervals [starts[i], ends[i]) as sorted, separate regions, and
+    where each interval begins in the regions concatenated
+    Returns region starts, region ends, positions
+    '''
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    order = np.argsort(starts, kind='stable')
+    # Running max of ends, else an interval inside a longer one before it would split the region
+    region_starts, region_ends = merged_intervals(starts[order], np.maximum.accumulate(ends[order]))
+    region = np.searchsorted(region_starts, starts, side='right') - 1
+    region_offsets = np.zeros(len(region_starts), dtype=np.int64)
+    np.cumsum((region_ends - region_starts)[:-1], out=region_offsets[1:])
+    positions = region_offsets[region] + starts - region_starts[region]
+    return region_starts, region_ends, positions
+
+class PortableEventsColumns(Sequence):
+    '''
+    Read-only sequence of PortableEvent backed by concatenated columns
+
+    PortableEvent objects are only created when indexed, as views into the columns
+    time is None for implicit time, with time_starts giving each event's instead
+    Event i is [offsets[i]:offsets[i+1]] of the columns, or with offsets None,
+    [windows[i, 0]:windows[i, 1]], which can overlap (see segmented)
+    '''
+    def __init__(self, trace_info, current, time, baseline, offsets, bounds, time_starts=None, windows=None):
+        self.trace_info = trace_info
+        self.current = current
+        self.time = time
+        self.baseline = baseline
+        self.offsets = offsets
+        self.bounds = bounds
+        self.time_starts = time_starts
+        if windows is None:
+            windows = np.stack([offsets[:-1], offsets[1:]], axis=1)
+        self.windows = windows
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('Index out of range')
+        start, end = self.windows[key]
+        rel_start, rel_end, orig_start, orig_end = self.bounds[key]
+        if self.time is None:
+            time = None
+            time_start = float(self.time_starts[key])
+        else:
+            time = self.time[start:end]
+            time_start = None
+        return PortableEvent(
+            self.trace_info,
+            self.current[start:end],
+            time,
+            self.baseline[start:end],
+            rel_start,
+            rel_end,
+            orig_start,
+            orig_end,
+            no_check=True, # Checked all at once on load
+            time_start=time_start
+            )
+
+    def check_valid(self):
+        n = len(self.bounds)
+        if self.bounds.ndim != 2 or self.bounds.shape[1] != 4:
+            raise ValueError(f'Bounds not of shape (N, 4): {self.bounds.shape}')
+        if self.offsets is not None and self.offsets.shape != (n+1, ):
+            raise ValueError(f'Offsets and bounds mismatch: {self.offsets.shape}, {self.bounds.shape}')
+        if self.windows.shape != (n, 2):
+            raise ValueError(f'Windows and bounds mismatch: {self.windows.shape}, {self.bounds.shape}')
+        if self.time is None:
+            if self.time_starts is None or self.time_starts.shape != (n, ):
+                raise ValueError('Implicit time without a time start for every event')
+        else:
+            check_eq_shape(self.current, self.time)
+        check_eq_shape(self.current, self.baseline)
+        if self.offsets is not None and (self.offsets[0] != 0 or self.offsets[-1] != len(self.current)):
+            raise ValueError('Offsets do not span the columns')
+        if np.any(self.windows < 0) or np.any(self.windows[:, 1] > len(self.current)):
+            raise ValueError('Windows past the columns')
+        lengths = self.windows[:, 1] - self.windows[:, 0]
+        if np.any(lengths <= 0):
+            raise ValueError('Empty or negative length event')
+        if np.any(self.bounds < 0):
+            raise ValueError('Negative bound')
+        if np.any(self.bounds[:, 0] >= self.bounds[:, 1]) or np.any(self.bounds[:, 2] >= self.bounds[:, 3]):
+            raise ValueError('Start same as or after end')
+        if np.any(self.bounds[:, 1] > lengths):
+            raise ValueError('Relative end past end of captured region')
+
+    def gather(self):
+        # Current and baseline of all events (without the captured surroundings)
+        # concatenated, plus offsets of each event in them
+        starts = self.windows[:, 0] + self.bounds[:, 0]
+        ends = self.windows[:, 0] + self.bounds[:, 1]
+        idx, offsets = ragged_gather_indices(starts, ends)
+        return self.current[idx], self.baseline[idx], offsets
+
+    def segmented(self):
+        '''
+        Same events with the union of their captured regions stored once,
+        each event a window into the regions concatenated
+        Events must all be from one trace, so overlapping regions hold the
+        same samples
+        '''
+        lengths = self.windows[:, 1] - self.windows[:, 0]
+        capture_starts = self.bounds[:, 2] - self.bounds[:, 0] # In trace samples
+        region_starts, region_ends, positions = union_regions(capture_starts, capture_starts + lengths)
+        size = int(np.sum(region_ends - region_starts))
+        dest, _ = ragged_gather_indices(positions, positions + lengths)
+        src, _ = ragged_gather_indices(self.windows[:, 0], self.windows[:, 1])
+        def fill(column):
+            # Every sample of the regions is in some window, later windows overwrite earlier
+            out = np.empty(size, dtype=column.dtype)
+            out[dest] = column[src]
+            if not np.array_equal(out[dest], column[src], equal_nan=True):
+                raise ValueError('Events differ where their captured regions overlap, not all from one trace')
+            return out
+        return self.__class__(
+            self.trace_info,
+            fill(self.current),
+            None if self.time is None else fill(self.time),
+            fill(self.baseline),
+            None,
+            self.bounds,
+            time_starts=self.time_starts,
+            windows=np.stack([positions, positions + lengths], axis=1)
+            )
+
+    @classmethod
+    def from_portable_events(cls, trace_info, portable_events):
+        lengths = np.array([len(portable_event.current) for portable_event in portable_events], dtype=np.int64)
+        offsets = np.zeros(len(lengths)+1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        bounds = np.array(
+            [
+                [portable_event.start, portable_event.end, portable_event.orig_start, portable_event.orig_end] \
+                for portable_event in portable_events
+                ],
+            dtype=np.int64
+            ).reshape(-1, 4)
+        time_starts = None
+        if len(portable_events) == 0:
+            current = baseline = np.array([], dtype=np.float64)
+            time = None
+            time_starts = np.array([], dtype=np.float64)
+        else:
+            current = np.concatenate([portable_event.current for portable_event in portable_events])
+            baseline = np.concatenate([portable_event.baseline for portable_event in portable_events])
+            if all(portable_event.time_is_implicit for portable_event in portable_events):
+                time = None
+                time_starts = np.array([portable_event.time_start for portable_event in portable_events], dtype=np.float64)
+            else: # Any explicit, so all are to keep them in one column
+                time = np.concatenate([portable_event.time for portable_event in portable_events])
+        return cls(trace_info, current, time, baseline, offsets, bounds, time_starts=time_starts)
+
+class EventTable(Sequence):
+    '''
+    Read-only sequence of Event backed by start and end arrays, all sharing
+    one trace and baseline
+
+    Event objects are only created when indexed
+    Slicing, boolean masks and index arrays give another EventTable, so
+    filtering and selecting never touch individual events
+    '''
+    def __init__(self, trace, baseline, starts, ends, no_check=False):
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        if not no_check:
+            if not isinstance(trace, Trace):
+                raise ValueError(f'Not a trace: {trace}')
+            baseline = cast_1d_nonempty_numeric_array(baseline)
+            check_eq_shape(starts, ends)
+            if starts.ndim != 1:
+                raise ValueError(f'Starts and ends not 1D: {starts.shape}')
+            if np.any(starts < 0):
+                raise ValueError('Negative start')
+            if np.any(starts >= ends):
+                raise ValueError('Start same as or after end')
+            if np.any(ends > len(trace)):
+                raise ValueError('End past end of trace')
+        self.trace = trace
+        self.baseline = baseline
+        self.starts = starts
+        self.ends = ends
+
+    @classmethod
+    def from_bounds(cls, trace, baseline, bounds):
+        bounds = np.asarray(bounds, dtype=np.int64).reshape(-1, 2)
+        return cls(trace, baseline, bounds[:, 0], bounds[:, 1])
+
+    def _new(self, key):
+        return self.__class__(self.trace, self.baseline, self.starts[key], self.ends[key], no_check=True)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, key):
+        if isinstance(key, (slice, np.ndarray, list)):
+            return self._new(key)
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('Index out of range')
+        return Event._init_nocheck(self.trace, self.baseline, int(self.starts[key]), int(self.ends[key]))
+
+    @property
+    def widths(self):
+        return self.ends - self.starts
+
+    @property
+    def bounds(self):
+        return np.stack([self.starts, self.ends], axis=1)
+
+    def masked(self, mask):
+        # Only events where mask is True
+        mask = np.asarray(mask, dtype=bool)
+        check_eq_shape(mask, self.starts)
+        return self._new(mask)
+
+    def filtered_by_width(self, min_width_samples, max_width_samples):
+        # Same criteria as filters.min_max_filt
+        widths = self.widths
+        return self._new((widths > min_width_samples) & (widths <= max_width_samples))
+
+    def gather(self):
+        # Current and baseline of all events concatenated, plus offsets of each event in them
+        idx, offsets = ragged_gather_indices(self.starts, self.ends)
+        return self.trace.current[idx], self.baseline[idx], offsets
+
+    def capture_windows(self):
+        # Captured region [start, end) of each event in the trace, as Event.to_portable takes
+        expand = np.maximum(2*self.widths, 2*self.trace.info.min_event_width_samples)
+        return np.maximum(self.starts - expand, 0), np.minimum(self.ends + expand, len(self.trace))
+
+    def to_segmented_columns(self):
+        # Same as PortableEventsColumns.segmented of the portable events, straight from the trace
+        trace_info = self.trace.info
+        trace_info.check_valid() # Enforce complete and valid trace info before saving
+        capture_starts, capture_ends = self.capture_windows()
+        region_starts, region_ends, positions = union_regions(capture_starts, capture_ends)
+        idx, _ = ragged_gather_indices(region_starts, region_ends)
+        if self.trace.time_is_implicit:
+            time = None
+            time_starts = np.asarray(self.trace.time_of(capture_starts), dtype=np.float64)
+        else:
+            time = self.trace.time[idx]
+            time_starts = None
+        bounds = np.stack([self.starts - capture_starts, self.ends - capture_starts, self.starts, self.ends], axis=1)
+        return PortableEventsColumns(
+            trace_info,
+            self.trace.current[idx],
+            time,
+            self.baseline[idx],
+            None,
+            bounds,
+            time_starts=time_starts,
+            windows=np.stack([positions, positions + capture_ends - capture_starts], axis=1)
+            )
+
+    def __repr__(self):
+        return repr(list(self))
+
+#%%
+
 class Events(UserList):
     def __init__(self, events):
-        for event in events:
-            if not isinstance(event, Event):
-                raise ValueError(f'Not an Event object: {event}')
+        if not isinstance(events, EventTable): # Known to hold only events
+            for event in events:
+                if not isinstance(event, Event):
+                    raise ValueError(f'Not an Event object: {event}')
         self.data = events
         self._loaded_from = None
         self._loaded_trace_info = None
         self._loaded_meta = None
         self._extracted_from = None
 
+    @classmethod
+    def _init_nocheck(cls, events):
+        # For sequences known to contain only Event objects, e.g. lazy ones
+        # where checking would defeat the point
+        new_events = cls([])
+        new_events.data = events
+        return new_events
+
     @property
     def events(self):
         return self.data
 
+    @property
+    def table(self):
+        # Backing EventTable, None if not (or no longer) backed by one
+        if isinstance(self.data, EventTable):
+            return self.data
+        return None
+
+    def _materialize(self):
+        # Lazy sequences are read-only, turn into a plain list before any change
+        if not isinstance(self.data, list):
+            self.data = list(self.data)
+
+    # Everything that changes events, or builds a new list from them,
+    # materializes first
+
+    def __setitem__(self, i, item):
+        self._materialize()
+        super().__setitem__(i, item)
+
+    def __delitem__(self, i):
+        self._materialize()
+        super().__delitem__(i)
+
+    def __iadd__(self, other):
+        self._materialize()
+        return super().__iadd__(other)
+
+    def __imul__(self, n):
+        self._materialize()
+        return super().__imul__(n)
+
+    def __add__(self, other):
+        self._materialize()
+        return super().__add__(other)
+
+    def __radd__(self, other):
+        self._materialize()
+        return super().__radd__(other)
+
+    def __mul__(self, n):
+        self._materialize()
+        return super().__mul__(n)
+
+    __rmul__ = __mul__
+
+    def append(self, item):
+        self._materialize()
+        super().append(item)
+
+    def insert(self, i, item):
+        self._materialize()
+        super().insert(i, item)
+
+    def pop(self, i=-1):
+        self._materialize()
+        return super().pop(i)
+
+    def remove(self, item):
+        self._materialize()
+        super().remove(item)
+
+    def clear(self):
+        self._materialize()
+        super().clear()
+
+    def reverse(self):
+        self._materialize()
+        super().reverse()
+
+    def sort(self, /, *args, **kwds):
+        self._materialize()
+        super().sort(*args, **kwds)
+
+    def extend(self, other):
+        self._materialize()
+        super().extend(other)
 
     def filtered(self, *filters):
         good = Events([])
@@ -45,16 +440,19 @@ class Events(UserList):
         good._extracted_from = self._extracted_from
         return good
 
+    def filtered_by_width(self, min_width_samples, max_width_samples):
+        # Same as filtered with filters.min_max_filt, without going event by event if possible
+        if self.table is None:
+            return self.filtered(lambda event: min_max_filt(event, min_width_samples, max_width_samples))
+        good = self.__class__(self.table.filtered_by_width(min_width_samples, max_width_samples))
+        good._loaded_from = self._loaded_from
+        good._extracted_from = self._extracted_from
+        return good
 
     @classmethod
     def init_from_extractor(cls, extractor):
-        events = []
-        trace = extractor.trace
-        baseline = extractor.baseline
-        for start, end in extractor.raw_events:
-            event = Event(trace, baseline, start, end)
-            events.append(event)
-        events = Events(events)
+        events = EventTable.from_bounds(extractor.trace, extractor.baseline, extractor.raw_events)
+        events = cls(events)
         events._extracted_from = extractor
         return events
 
@@ -74,6 +472,8 @@ class Events(UserList):
             return self.events[0].trace_info
 
     def check_consistent(self):
+        if isinstance(self.data, (EventTable, PortableEventsColumns)):
+            return # One trace info shared by all, consistent by construction
         ref_trace_info_dic = self.trace_info.to_dict()
         for event in self.events:
             if event.trace_info.to_dict() != ref_trace_info_dic:
@@ -146,7 +546,7 @@ class Events(UserList):
         return dic
 
     @staticmethod
-    def save_(path, events, overwrite=False):
+    def save_(path, events, overwrite=False, fmt=None):
         # WARNING:
         #   MANUAL CHANGES WILL _NOT_ BE REFLECTED IN SAVED METADATA
         #   e.g.
@@ -157,6 +557,11 @@ class Events(UserList):
 
         path = Path(path)
 
+        if fmt is None:
+            fmt = DEFAULT_EVENTS_FORMAT
+        if fmt not in EVENTS_FORMATS:
+            raise ValueError(f'Invalid events format: {fmt}; Valid formats are {EVENTS_FORMATS}')
+
         if path.suffixes[-2:] != ['.events', '.npz']:
             path = path.with_suffix(path.suffix + '.events.npz')
 
@@ -164,48 +569,85 @@ class Events(UserList):
 
         events.check_consistent()
 
-        portable_events = []
-        for event in events:
-            if not isinstance(event, PortableEvent):
-                portable_event = event.to_portable()
-            else:
-                portable_event = event
-            portable_events.append(portable_event)
+        portable_events = None
+        if fmt == 'segments' and isinstance(events.data, EventTable):
+            columns = events.data.to_segmented_columns() # No per event copies at all
+        elif fmt == 'segments' and isinstance(events.data, PortableEventsColumns):
+            columns = events.data.segmented()
+        elif fmt == 'columnar' and isinstance(events.data, PortableEventsColumns) and events.data.offsets is not None:
+            columns = events.data # Loaded columnar and not modified, no need to rebuild
+        else:
+            portable_events = []
+            for event in events:
+                if not isinstance(event, PortableEvent):
+                    portable_event = event.to_portable()
+                else:
+                    portable_event = event
+                portable_events.append(portable_event)
 
         mode = 'xb'
         if overwrite:
             mode = 'wb'
 
-        arrs = []
-        bounds = ''
-        for portable_event in portable_events:
-            arr = np.array([
-                portable_event.current,
-                portable_event.time,
-                portable_event.baseline
-                ])
-            arrs.append(arr)
-            bounds += f'{portable_event.start},{portable_event.end},{portable_event.orig_start},{portable_event.orig_end}\n'
-
-        with open(path, mode) as f:
-            np.savez_compressed(f, *arrs)
+        if fmt != 'legacy':
+            if portable_events is not None:
+                columns = PortableEventsColumns.from_portable_events(events.trace_info, portable_events)
+                if fmt == 'segments':
+                    columns = columns.segmented()
+            if columns.time is None:
+                time = {'time_starts': columns.time_starts}
+            else:
+                time = {'time': columns.time}
+            if fmt == 'segments':
+                windows = {'windows': columns.windows}
+            else:
+                windows = {'offsets': columns.offsets}
+            with open(path, mode) as f:
+                np.savez_compressed(
+                    f,
+                    current=columns.current,
+                    baseline=columns.baseline,
+                    bounds=columns.bounds,
+                    **windows,
+                    **time
+                    )
+        else:
+            arrs = []
+            bounds = ''
+            for portable_event in portable_events:
+                arr = np.array([
+                    portable_event.current,
+                    portable_event.time,
+                    portable_event.baseline
+                    ])
+                arrs.append(arr)
+                bounds += f'{portable_event.start},{portable_event.end},{portable_event.orig_start},{portable_event.orig_end}\n'
+
+            with open(path, mode) as f:
+                np.savez_compressed(f, *arrs)
 
         with ZipFile(path, 'a') as zf:
             zf.writestr(
                 'trace_info.json',
                 events.trace_info.to_json()
                 )
-            zf.writestr(
-                'bounds.csv',
-                bounds
-                )
+            if fmt != 'legacy':
+                zf.writestr(
+                    'format.txt',
+                    fmt
+                    )
+            else:
+                zf.writestr(
+                    'bounds.csv',
+                    bounds
+                    )
             zf.writestr(
                 'meta.json',
                 json.dumps(meta, indent=2)
                 )
 
-    def save(self, path, overwrite=False):
-        self.__class__.save_(path, self, overwrite=overwrite)
+    def save(self, path, overwrite=False, fmt=None):
+        self.__class__.save_(path, self, overwrite=overwrite, fmt=fmt)
 
     @classmethod
     def load(cls, path):
@@ -221,6 +663,49 @@ class Events(UserList):
         except Exception:
             warn('Trace info not (fully) valid')
 
+        if 'format.txt' in npzf.files:
+            fmt = npztools.readstr(npzf, 'format.txt')
+        else:
+            fmt = 'legacy'
+        if fmt not in EVENTS_FORMATS:
+            raise ValueError(f'Unrecognized events format: {fmt}')
+
+        if fmt != 'legacy':
+            if 'time' in npzf.files:
+                time = npzf['time']
+                time_starts = None
+            else:
+                time = None
+                time_starts = npzf['time_starts']
+            if fmt == 'segments':
+                offsets = None
+                windows = npzf['windows']
+            else:
+                offsets = npzf['offsets']
+                windows = None
+            events = PortableEventsColumns(
+                trace_info,
+                npzf['current'],
+                time,
+                npzf['baseline'],
+                offsets,
+                npzf['bounds'],
+                time_starts=time_starts,
+                windows=windows
+                )
+            events.check_valid()
+            events = cls._init_nocheck(events)
+        else:
+            events = cls(cls._load_legacy_events(npzf, trace_info))
+
+        events._loaded_from = path
+        events._loaded_meta = meta
+        events._loaded_trace_info = trace_info
+
+        return events
+
+    @staticmethod
+    def _load_legacy_events(npzf, trace_info):
         bounds = [
             [int(row[i]) for i in range(4)] \
             for row in npztools.csv_reader_bstr(npzf['bounds.csv'])
@@ -255,12 +740,6 @@ class Events(UserList):
                 )
 
             events.append(event)
-
-        events = cls(events)
-        events._loaded_from = path
-        events._loaded_meta = meta
-        events._loaded_trace_info = trace_info
-
         return events
 
     @staticmethod
@@ -275,6 +754,8 @@ class Events(UserList):
         return list(scan_dir.glob(glob_pattern))
 
     def to_signals(self):
+        if isinstance(self.data, (EventTable, PortableEventsColumns)):
+            return self._to_signals_batch()
         signals = []
         for event in self.events:
             signal = event.to_signal()
@@ -290,3 +771,35 @@ class Events(UserList):
         signals = Signals(signals)
         signals._extracted_from = self
         return signals
+
+    def _to_signals_batch(self):
+        # Same as to_signals, all events at once
+        # Every event shares one trace info, the one from the trace or file
+        if len(self.data) == 0:
+            signals = Signals([])
+            signals._extracted_from = self
+            return signals
+
+        current, baseline, offsets = self.data.gather()
+        trace_info = self.trace_info
+        if trace_info.peaks_not_dips:
+            values = current - baseline
+        else:
+            values = baseline - current
+        del current
+
+        starts = offsets[:-1]
+        has_nan = np.add.reduceat(np.isnan(values), starts) > 0
+        diffs = np.maximum.reduceat(baseline, starts) - np.minimum.reduceat(baseline, starts)
+        with np.errstate(invalid='ignore'): # Those with nan baseline are rejected by has_nan anyway
+            accepted = ~has_nan & ~(np.abs(diffs) > 0.05)
+        del baseline
+
+        lengths = np.diff(offsets)
+        values = values[np.repeat(accepted, lengths)]
+        new_offsets = np.zeros(np.count_nonzero(accepted)+1, dtype=np.int64)
+        np.cumsum(lengths[accepted], out=new_offsets[1:])
+
+        signals = Signals.from_ragged(values, new_offsets, trace_info, 'raw')
+        signals._extracted_from = self
+        return signals
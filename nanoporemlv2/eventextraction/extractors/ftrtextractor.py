@@ -4,6 +4,8 @@ from warnings import warn
 
 from pprint import pp
 
+import tempfile
+
 import numpy as np
 import bottleneck as bn
 
@@ -18,9 +20,10 @@ from ...interactiveutils.scrollablefig import ScrollableFig
 
 
 from ..utils import make_odd, centered_bn_move_median
+from ..utils import centered_decimated_move_median, decimated_move_median_error
 from ..utils import next_i_after_j_in_indices, last_i_before_j_in_indices
+from ..utils import batch_event_bounds
 
-from ..filters import min_max_filt
 
 from ..events import Events
 
@@ -68,8 +71,29 @@ class FTRTExtractor(EventExtractor):
     def baseline_window_size(self):
         return make_odd(int(self.params.baseline_window_scale*self.trace.info.max_event_width_samples))
 
+    def _centered_move_median(self, a, window):
+        if self.params.median_decimation is None:
+            return centered_bn_move_median(a, window)
+        return centered_decimated_move_median(a, window, self.params.median_decimation)
+
+    def _calc_baseline(self, current):
+        return self._centered_move_median(current, self.baseline_window_size)
+
+    def baseline_decimation_error(self, max_samples=2_000_000):
+        '''
+        How far the decimated baseline is from the exact one, over the start of the trace
+        '''
+        if self.params.median_decimation is None:
+            raise ValueError('Median decimation not in use')
+        return decimated_move_median_error(
+            self.trace.current,
+            self.baseline_window_size,
+            self.params.median_decimation,
+            max_samples=max_samples
+            )
+
     def gen_baseline(self):
-        self._baseline = centered_bn_move_median(self.trace.current, self.baseline_window_size)
+        self._baseline = self._calc_baseline(self.trace.current)
 
     @property
     def baseline(self):
@@ -83,11 +107,17 @@ class FTRTExtractor(EventExtractor):
     def std_smoothing_window_size(self):
         return make_odd(int(self.params.std_smoothing_scale_factor*self.std_window_size))
 
+    def _calc_presmoothing_std(self, current, baseline):
+        return bn.move_std(current - baseline, self.std_window_size)
+
+    def _calc_std(self, presmoothing_std):
+        return self._centered_move_median(presmoothing_std, self.std_smoothing_window_size)
+
     def gen_std(self):
         if self.baseline is None:
             self.gen_baseline()
-        self._presmoothing_std = bn.move_std(self.trace.current - self.baseline, self.std_window_size)
-        self._std = centered_bn_move_median(self._presmoothing_std, self.std_smoothing_window_size)
+        self._presmoothing_std = self._calc_presmoothing_std(self.trace.current, self.baseline)
+        self._std = self._calc_std(self._presmoothing_std)
         self._std_line = self.shift_base(self.baseline, self.std)
 
     @property
@@ -152,31 +182,7 @@ class FTRTExtractor(EventExtractor):
         self._start_indices = start_indices
         self._end_indices = end_indices
 
-        i = 0
-        triggered = False
-        events = []
-        event = None
-        while True:
-            if not triggered:
-                i = next_i_after_j_in_indices(trigger_indices, i)
-                if i is None:
-                    break
-                triggered = True
-                start = last_i_before_j_in_indices(start_indices, i)
-                if start is None: # Unlikely to occur but just in case e.g. huge jump in 1 sample or something
-                    triggered = False
-                    continue
-                event = [start]
-
-            if triggered:
-                i_ = next_i_after_j_in_indices(end_indices, i)
-                if i_ is not None:
-                    i = i_
-                    end = i+1
-                    event.append(end)
-                    events.append(event)
-                triggered = False
-                event = None
+        events = batch_event_bounds(trigger_indices, start_indices, end_indices)
         self._raw_events = events
         self._events = Events.init_from_extractor(self)
         # self._events = Events([Event(self.trace, self.baseline, start, end) for start, end in events])
@@ -213,19 +219,124 @@ class FTRTExtractor(EventExtractor):
         '''
         Safety net filtering
         '''
-        self._events = self._events.filtered(
-            lambda event: min_max_filt(
-                event,
-                self.trace.info.min_event_width_samples,
-                self.trace.info.max_event_width_samples
-                )
+        self._events = self._events.filtered_by_width(
+            self.trace.info.min_event_width_samples,
+            self.trace.info.max_event_width_samples
             )
 
     @property
     def events(self):
         return self._events
 
+    @property
+    def chunk_overlap(self):
+        # Samples of context needed on each side of a chunk for its baseline
+        # and std to come out the same as when computed over the whole trace
+        # Baseline window reaches ~half its size each way, the (uncentered)
+        # std window reaches fully back on top of that, and the std smoothing
+        # window reaches ~half its size each way on top of both
+        return self.baseline_window_size + self.std_window_size + self.std_smoothing_window_size
+
+    def _run_chunked(self):
+        '''
+        Streaming equivalent of running gen_baseline through identify_events
+
+        The trace is processed in chunks of params.chunk_size samples, each
+        padded on both sides by chunk_overlap samples of context so that the
+        baseline, std and threshold lines inside the chunk match the in-memory
+        path. Only the baseline is kept at full length (events need it), and
+        it is a memmap over an anonymous temporary file, so it pages out to
+        disk instead of holding the trace's length in RAM. Everything else
+        lives for one chunk only, so memory is the chunk temporaries plus
+        whatever of the baseline the OS keeps cached.
+
+        Event identification is the same trigger -> start -> end walk as in
+        identify_events, with its position carried from chunk to chunk so that
+        events crossing chunk edges are stitched together.
+
+        With params.median_decimation the blocks fall differently at chunk
+        edges, so results are as close to the in-memory path as the decimated
+        medians are to each other, not identical.
+        '''
+        current = self.trace.current
+        n = len(current)
+        chunk_size = self.params.chunk_size
+        overlap = self.chunk_overlap
+        if chunk_size < overlap:
+            warn(f'Chunk size smaller than chunk overlap, most of each chunk will be recomputed context: {chunk_size}, {overlap}')
+
+        baseline = None
+
+        i = 0
+        triggered = False
+        event = None
+        last_start = None # Last start index of all previous chunks
+        events = []
+        for chunk_start in range(0, n, chunk_size):
+            chunk_end = min(chunk_start + chunk_size, n)
+            padded_start = max(0, chunk_start - overlap)
+            padded_end = min(n, chunk_end + overlap)
+            core = slice(chunk_start - padded_start, chunk_end - padded_start)
+
+            padded_current = current[padded_start:padded_end]
+            padded_baseline = self._calc_baseline(padded_current)
+            padded_std = self._calc_std(self._calc_presmoothing_std(padded_current, padded_baseline))
+
+            chunk_current = padded_current[core]
+            chunk_baseline = padded_baseline[core]
+            chunk_std = padded_std[core]
+            del padded_current, padded_baseline, padded_std
+
+            if baseline is None:
+                # Mapping stays valid after the file object is gone, the file is deleted with it
+                baseline = np.memmap(tempfile.TemporaryFile(), dtype=chunk_baseline.dtype, mode='w+', shape=(n, ))
+            baseline[chunk_start:chunk_end] = chunk_baseline
+
+            trig_line = self.shift_base(chunk_baseline, self.params.trig_std*chunk_std)
+            start_line = self.shift_base(chunk_baseline, self.params.start_std*chunk_std)
+            end_line = self.shift_base(chunk_baseline, self.params.end_std*chunk_std)
+
+            trigger_indices = np.nonzero(self.above_threshold(chunk_current, trig_line))[0] + chunk_start
+            start_indices = np.nonzero(self.below_threshold(chunk_current, start_line))[0] + chunk_start
+            end_indices = np.nonzero(self.below_threshold(chunk_current, end_line))[0] + chunk_start
+
+            while True:
+                if not triggered:
+                    i_ = next_i_after_j_in_indices(trigger_indices, i)
+                    if i_ is None: # No more triggers in this chunk
+                        break
+                    i = i_
+                    start = last_i_before_j_in_indices(start_indices, i)
+                    if start is None:
+                        start = last_start
+                    if start is None:
+                        continue
+                    triggered = True
+                    event = [start]
+
+                i_ = next_i_after_j_in_indices(end_indices, i)
+                if i_ is None: # Event continues into next chunk
+                    break
+                i = i_
+                end = i+1
+                event.append(end)
+                events.append(event)
+                triggered = False
+                event = None
+
+            if len(start_indices) != 0:
+                last_start = start_indices[-1]
+        # An event still triggered here never ended, same as in-memory path it is dropped
+
+        self._baseline = baseline
+        self._raw_events = events
+        self._events = Events.init_from_extractor(self)
+        self.filter_events()
+        return self.events
+
     def _run(self):
+        if self.params.chunk_size is not None:
+            return self._run_chunked()
         self.gen_baseline()
         self.gen_std()
         self.gen_trig_line()
@@ -266,7 +377,9 @@ class FTRTExtractor(EventExtractor):
                 std_smoothing_scale_factor=2,
                 trig_std=6,
                 start_std=0.75,
-                end_std=0.5
+                end_std=0.5,
+                chunk_size=None,
+                median_decimation=None
                 ):
 
             self.baseline_window_scale = baseline_window_scale
@@ -275,6 +388,8 @@ class FTRTExtractor(EventExtractor):
             self.trig_std = trig_std
             self.start_std = start_std
             self.end_std = end_std
+            self.chunk_size = chunk_size
+            self.median_decimation = median_decimation
 
         @property
         def baseline_window_scale(self):
@@ -338,6 +453,34 @@ class FTRTExtractor(EventExtractor):
                 warn(f'Event end crossing line is set to above 3 stdevs: {value}')
             self._end_std = value
 
+        @property
+        def chunk_size(self):
+            return self._chunk_size
+
+        @chunk_size.setter
+        def chunk_size(self, value):
+            # None for processing the whole trace in memory
+            if value is not None:
+                check_positive_int(value)
+                value = int(value)
+            self._chunk_size = value
+
+        @property
+        def median_decimation(self):
+            return self._median_decimation
+
+        @median_decimation.setter
+        def median_decimation(self, value):
+            # None for exact moving medians
+            # Otherwise block size in samples for the decimated approximation,
+            # something around a hundredth of the baseline window works well
+            if value is not None:
+                check_positive_int(value)
+                value = int(value)
+                if value == 1:
+                    value = None # Same thing
+            self._median_decimation = value
+
         def check_valid(self):
             pass
 
@@ -348,7 +491,9 @@ class FTRTExtractor(EventExtractor):
                 'std_smoothing_scale_factor': self.std_smoothing_scale_factor,
                 'trig_std': self.trig_std,
                 'start_std': self.start_std,
-                'end_std': self.end_std
+                'end_std': self.end_std,
+                'chunk_size': self.chunk_size,
+                'median_decimation': self.median_decimation
                 }
             return dic
 
@@ -368,6 +513,8 @@ class FTRTExtractor(EventExtractor):
                     )
                 print(f'Baseline window size is {extractor.baseline_window_size} samples')
                 extractor.gen_baseline()
+                if extractor.params.median_decimation is not None:
+                    print(f'Decimated baseline error against exact: {extractor.baseline_decimation_error()}')
                 sfig.plot(trace.time, extractor.baseline, color='blue', alpha=0.75, label='Baseline')
                 if input_1_safe(f'Accept baseline?'):
                     break
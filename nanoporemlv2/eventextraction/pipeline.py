@@ -52,22 +52,49 @@ class EventExtractionPipeline:
         # if self._settings.trace_info is not None:
         #     self.trace.info = self._settings.trace_info
 
-    def run(self):
+    def run(self, copy_on_write=True, preserve_orig=True):
         self.settings.check_valid()
         if self.settings.trace_info is not None:
             self.trace.info = self.settings.trace_info
         else:
             self.trace.info.check_valid()
-        self.clean()
+        self.clean(copy_on_write=copy_on_write, preserve_orig=preserve_orig)
         self.extract()
 
-    def clean(self):
+    def clean(self, copy_on_write=True, preserve_orig=True):
+        '''
+        copy_on_write: The cleaners work on one buffer the pipeline owns,
+            trims are views into it and masks and filters change it in place
+            The trace is copied (only as much of it as is left after any
+            trims before) just before the first cleaner that changes values,
+            and only if it cannot be changed in place, see preserve_orig
+            False to run each cleaner as is, each making its own copy
+        preserve_orig: Leave orig_trace untouched, else it can be cleaned in
+            place when copy_on_write, e.g. when it will not be used again
+        Current is first cast into trace info's working dtype if one is set,
+        see Trace.to_dtype, that copy is then the buffer the pipeline owns
+        '''
         self._orig_trace = self.trace
+        trace = self._trace.to_dtype() # Into the working dtype of trace info, if any
+        if not copy_on_write:
+            for cleaner in self.settings.cleaners:
+                trace = CLEANERS[cleaner].run(
+                    trace,
+                    self.settings.cleaner_params[cleaner]
+                    )
+            self._trace = trace
+            return
+
+        # A cast into the working dtype is already a copy the pipeline owns
+        owned = (trace is not self._trace or not preserve_orig) and trace.current.flags.writeable
         for cleaner in self.settings.cleaners:
-            self._trace = CLEANERS[cleaner].run(
-                self._trace,
-                self.settings.cleaner_params[cleaner]
-                )
+            cleaner = CLEANERS[cleaner]
+            params = self.settings.cleaner_params[cleaner.name]
+            if cleaner.modifies_current and not owned:
+                trace = trace.copy()
+                owned = True
+            trace = cleaner.run_inplace(trace, params)
+        self._trace = trace
 
     @property
     def orig_trace(self):
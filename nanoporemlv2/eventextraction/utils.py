@@ -78,6 +78,133 @@ def last_i_before_j_in_indices(indices, j):
 
 #%%
 
+def walk_event_bounds(trigger_indices, start_indices, end_indices):
+    # Reference implementation, one event at a time
+    # From the current position, take the next trigger, go back to the last
+    # start before it and forward to the next end after it
+    # Then carry on looking for triggers from that end
+    # Note position starts at 0 so a trigger on the very first sample is never used
+
+    i = 0
+    triggered = False
+    events = []
+    event = None
+    while True:
+        if not triggered:
+            i = next_i_after_j_in_indices(trigger_indices, i)
+            if i is None:
+                break
+            triggered = True
+            start = last_i_before_j_in_indices(start_indices, i)
+            if start is None: # Unlikely to occur but just in case e.g. huge jump in 1 sample or something
+                triggered = False
+                continue
+            event = [start]
+
+        if triggered:
+            i_ = next_i_after_j_in_indices(end_indices, i)
+            if i_ is not None:
+                i = i_
+                end = i+1
+                event.append(end)
+                events.append(event)
+            triggered = False
+            event = None
+    return events
+
+def batch_event_bounds(trigger_indices, start_indices, end_indices):
+    # Same result as walk_event_bounds, for all events at once
+
+    # Triggers with no start before them can only be a prefix of the triggers
+    # (once any start exists every later trigger has one), the walk steps over
+    # them one by one, as it does over a trigger on sample 0
+
+    # For every other trigger, the end it would resolve to is the first end
+    # after it, i.e. end_indices[searchsorted(end_indices, trigger, 'right')]
+    # Consecutive triggers with the same such end form a run and the walk only
+    # ever lands on the first of each run:
+    #   The event from the first trigger of a run ends at the shared end, and
+    #   every other trigger of that run comes before it so is skipped over
+    #   The first trigger of the next run comes after the shared end (there is
+    #   an end between it and the previous trigger) so is where the walk resumes
+    # This relies on no trigger also being an end, else resuming from an end
+    # that is also a trigger would skip it, so fall back to the walk in that case
+
+    trigger_indices = np.asarray(trigger_indices)
+    start_indices = np.asarray(start_indices)
+    end_indices = np.asarray(end_indices)
+
+    end_idx_right = np.searchsorted(end_indices, trigger_indices, side='right')
+    end_idx_left = np.searchsorted(end_indices, trigger_indices, side='left')
+    if np.any(end_idx_right != end_idx_left):
+        return walk_event_bounds(trigger_indices, start_indices, end_indices)
+
+    start_idx = np.searchsorted(start_indices, trigger_indices, side='left') - 1
+
+    usable = (trigger_indices > 0) & (start_idx != -1)
+    end_idx = end_idx_right[usable]
+    start_idx = start_idx[usable]
+
+    run_firsts = np.ones(len(end_idx), dtype=bool)
+    run_firsts[1:] = end_idx[1:] != end_idx[:-1]
+    run_firsts &= end_idx != len(end_indices) # No end, event (and everything after) dropped
+
+    starts = start_indices[start_idx[run_firsts]]
+    ends = end_indices[end_idx[run_firsts]] + 1
+
+    return np.stack([starts, ends], axis=1).tolist()
+
+def threshold_runs(a, lower=None, upper=None, chunk_size=2**22):
+    '''
+    Bounds [start, end) of every run of samples of a below lower or above
+    upper (either can be None), nan is neither
+    Done chunk_size samples at a time, so temporaries are only chunk sized
+    Returns starts, ends
+    '''
+    if lower is None and upper is None:
+        raise ValueError('Neither lower nor upper threshold given')
+    changes = [] # Where samples go from in a run to not or the other way
+    inside = False # Whether the last sample of the previous chunk was in a run
+    for chunk_start in range(0, len(a), chunk_size):
+        chunk = a[chunk_start:chunk_start+chunk_size]
+        if lower is not None:
+            mask = chunk < lower
+            if upper is not None:
+                mask |= chunk > upper
+        else:
+            mask = chunk > upper
+        if mask[0] != inside:
+            changes.append(np.array([chunk_start]))
+        changes.append(np.flatnonzero(mask[1:] != mask[:-1]) + (chunk_start + 1))
+        inside = bool(mask[-1])
+    if inside:
+        changes.append(np.array([len(a)]))
+    changes = np.concatenate(changes).astype(np.int64) if changes else np.empty(0, dtype=np.int64)
+    return changes[0::2], changes[1::2]
+
+def merged_intervals(starts, ends, margin=0, length=None):
+    '''
+    Sorted, non overlapping intervals [start, end) widened by margin on both
+    sides (clipped to 0 and length if given), overlapping or touching ones
+    then merged
+    Returns starts, ends
+    '''
+    starts = np.asarray(starts, dtype=np.int64) - margin
+    ends = np.asarray(ends, dtype=np.int64) + margin
+    np.maximum(starts, 0, out=starts)
+    if length is not None:
+        np.minimum(ends, length, out=ends)
+    if len(starts) == 0:
+        return starts, ends
+    # Widening by the same margin keeps starts and ends sorted, an interval
+    # is separate from the one before only if it starts after that one ends
+    separate = np.flatnonzero(starts[1:] > ends[:-1]) + 1
+    firsts = np.concatenate([[0], separate])
+    lasts = np.concatenate([separate - 1, [len(starts) - 1]])
+    return starts[firsts], ends[lasts]
+
+#%%
+
 def make_odd(num):
     if type(num) != int:
         raise ValueError('Number must be integer')
@@ -104,3 +231,91 @@ def centered_bn_move_std(a, window, min_count=None, axis=-1, ddof=0):
     if window % 2 == 0:
         raise ValueError('Window size must be odd')
     return center_bn_move_result(bn.move_std(a, window, min_count=None, axis=-1, ddof=0), window)
+
+#%%
+
+def centered_decimated_move_median(a, window, decimation):
+    '''
+    Approximation of centered_bn_move_median for long windows
+
+    The median is taken of each block of decimation samples, then a moving
+    median of (window/decimation) blocks is taken over those block medians,
+    and the result is linearly interpolated back to full resolution.
+    The moving median hence runs on decimation times fewer samples with a
+    window decimation times smaller.
+
+    NaN handling follows centered_bn_move_median in spirit: any NaN in a block
+    makes the block median NaN, any NaN block median in the window makes the
+    result NaN, and the ends of the result where the window does not fit are NaN.
+    NaN regions are however rounded out to whole blocks.
+
+    Use decimated_move_median_error to see how far off this is for given data.
+    '''
+    if window % 2 == 0:
+        raise ValueError('Window size must be odd')
+    if not isinstance(decimation, (int, np.integer)) or decimation < 1:
+        raise ValueError(f'Decimation must be a positive integer: {decimation}')
+    decimation = int(decimation)
+
+    a = np.asarray(a)
+    n = len(a)
+    n_blocks = n // decimation # Any leftover partial block at the end is not used
+
+    if decimation == 1 or n_blocks < 2:
+        return centered_bn_move_median(a, window)
+
+    # Partition for the middle element instead of a full median, much faster
+    # for many small rows (upper middle for even sized blocks, close enough)
+    blocks = a[:n_blocks*decimation].reshape(n_blocks, decimation)
+    block_medians = np.partition(blocks, decimation//2, axis=1)[:, decimation//2]
+    block_medians[bn.anynan(blocks, axis=1)] = np.nan # Partition sorts nan last instead of propagating it
+    del blocks
+
+    decimated_window = make_odd(max(1, window // decimation))
+    half = decimated_window // 2
+    decimated = np.full(n_blocks, np.nan, dtype=block_medians.dtype)
+    if decimated_window <= n_blocks:
+        moved = bn.move_median(block_medians, decimated_window)
+        decimated[:n_blocks-half] = moved[half:] # Center it
+        # Unlike centered_bn_move_median no roll, the wrapped part would be nan anyway
+
+    # Linear interpolation between block centers, which are evenly spaced so
+    # this is just a ramp per block
+    # Centers are taken on whole samples, i.e. k*decimation + decimation//2
+    # centered_bn_move_median's window for index i is centered on i+1, so the
+    # value at center c goes to index c-1
+    ramp = np.arange(decimation, dtype=decimated.dtype) / decimation
+    first = decimation//2 - 1
+    last = first + (n_blocks-1)*decimation
+    ret = np.empty(n, dtype=decimated.dtype)
+    ramps = ret[first:last].reshape(n_blocks-1, decimation)
+    np.multiply(np.diff(decimated)[:, None], ramp[None, :], out=ramps)
+    ramps += decimated[:-1, None]
+    ret[:first] = decimated[0]
+    ret[last:] = decimated[-1]
+
+    # Same nan ends as centered_bn_move_median
+    ret[:max(0, (window-3)//2)] = np.nan
+    ret[max(0, n - (window+1)//2):] = np.nan
+    return ret
+
+def decimated_move_median_error(a, window, decimation, max_samples=2_000_000):
+    '''
+    Error of centered_decimated_move_median against the exact
+    centered_bn_move_median, over (up to) the first max_samples of a
+
+    Returns dict of max absolute error, rms error and the 99th percentile
+    absolute error, ignoring positions where either is nan
+    '''
+    a = np.asarray(a)[:max_samples]
+    exact = centered_bn_move_median(a, window)
+    approx = centered_decimated_move_median(a, window, decimation)
+    err = np.abs(approx - exact)
+    err = err[~np.isnan(err)]
+    if len(err) == 0:
+        raise ValueError('Not enough samples to compare, nan everywhere')
+    return {
+        'max_abs_error': float(np.max(err)),
+        'rms_error': float(np.sqrt(np.mean(err**2))),
+        'p99_abs_error': float(np.percentile(err, 99))
+        }
@@ -1,3 +1,3 @@
 #
 
-__all__ = ["datasetio", "schemes"]
+__all__ = ["datasetio", "schemes", "catalog"]
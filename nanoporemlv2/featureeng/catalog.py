@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+'''
+Persistent index of dataset files, so picking datasets by meta, scheme,
+standard or labels does not need every dataset loaded
+
+Kept in a local SQLite file, one row per dataset with its
+    path (absolute), size and mtime (to tell when the entry is stale),
+    shape of X, scheme, standard and format,
+plus its label counts and its meta flattened to one row per key
+
+Flattened meta keeps every key at every depth, with the dotted path to it,
+the value as JSON and the key's position in a depth first walk of the meta,
+so the first match by position is what datasetio.recursive_find_key finds
+
+The catalog only stores and queries, filling it from the files is done by
+datasetio.update_catalog
+'''
+
+from pathlib import Path
+import sqlite3
+import json
+import os
+
+#%%
+
+CATALOG_VERSION = 1
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS info (
+        key TEXT PRIMARY KEY,
+        value TEXT
+        )''',
+    '''CREATE TABLE IF NOT EXISTS datasets (
+        path TEXT PRIMARY KEY,
+        size INTEGER,
+        mtime_ns INTEGER,
+        n_rows INTEGER,
+        n_cols INTEGER,
+        scheme TEXT,
+        standard TEXT,
+        fmt TEXT
+        )''',
+    '''CREATE TABLE IF NOT EXISTS labels (
+        path TEXT,
+        label TEXT,
+        count INTEGER,
+        PRIMARY KEY (path, label)
+        )''',
+    '''CREATE TABLE IF NOT EXISTS meta (
+        path TEXT,
+        position INTEGER,
+        dotted TEXT,
+        key TEXT,
+        value TEXT,
+        PRIMARY KEY (path, position)
+        )''',
+    'CREATE INDEX IF NOT EXISTS meta_key ON meta (key)'
+    ]
+
+def flatten_meta(dic):
+    '''
+    Every key of nested dict dic, in depth first order
+    Returns list of (position, dotted path, key, value as JSON)
+    '''
+    rows = []
+    def walk(dic, prefix):
+        for k, v in dic.items():
+            dotted = f'{prefix}.{k}' if prefix else str(k)
+            rows.append((len(rows), dotted, str(k), json.dumps(v)))
+            if isinstance(v, dict):
+                walk(v, dotted)
+    walk(dic, '')
+    return rows
+
+def file_stat(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+#%%
+
+class DatasetCatalog:
+    def __init__(self, path):
+        self._path = Path(path)
+        self._conn = sqlite3.connect(self._path)
+        version = None
+        try:
+            row = self._conn.execute("SELECT value FROM info WHERE key = 'version'").fetchone()
+            if row is not None:
+                version = int(row[0])
+        except sqlite3.OperationalError: # New file
+            pass
+        if version is not None and version != CATALOG_VERSION:
+            # Only an index, nothing lost by starting over
+            self._conn.close()
+            os.remove(self._path)
+            self._conn = sqlite3.connect(self._path)
+        with self._conn:
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO info VALUES ('version', ?)",
+                (str(CATALOG_VERSION), )
+                )
+
+    @property
+    def path(self):
+        return self._path
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def _key(path):
+        return Path(path).absolute().as_posix()
+
+    #%%
+
+    def is_current(self, path):
+        # Recorded and unchanged since
+        row = self._conn.execute(
+            'SELECT size, mtime_ns FROM datasets WHERE path = ?',
+            (self._key(path), )
+            ).fetchone()
+        if row is None:
+            return False
+        try:
+            return tuple(row) == file_stat(path)
+        except FileNotFoundError:
+            return False
+
+    def record(self, path, header, label_counts):
+        '''
+        header is as from datasetio.read_dataset_header
+        label_counts is dict of label: count
+        '''
+        key = self._key(path)
+        size, mtime_ns = file_stat(path)
+        X_shape = header['X_shape']
+        n_rows = X_shape[0] if len(X_shape) > 0 else 0
+        n_cols = X_shape[1] if len(X_shape) > 1 else None
+        with self._conn:
+            self._forget(key)
+            self._conn.execute(
+                'INSERT INTO datasets VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, size, mtime_ns, n_rows, n_cols, header['scheme'], header['standard'], header['fmt'])
+                )
+            self._conn.executemany(
+                'INSERT INTO labels VALUES (?, ?, ?)',
+                [(key, str(label), int(count)) for label, count in label_counts.items()]
+                )
+            self._conn.executemany(
+                'INSERT INTO meta VALUES (?, ?, ?, ?, ?)',
+                [(key, *row) for row in flatten_meta(header['meta'])]
+                )
+
+    def _forget(self, key):
+        for table in ['datasets', 'labels', 'meta']:
+            self._conn.execute(f'DELETE FROM {table} WHERE path = ?', (key, ))
+
+    def forget(self, path):
+        with self._conn:
+            self._forget(self._key(path))
+
+    def forget_missing(self, under=None):
+        # Drop entries of files that no longer exist, only those under directory under if given
+        removed = []
+        for path in self.paths(under=under):
+            if not Path(path).exists():
+                removed.append(path)
+        with self._conn:
+            for path in removed:
+                self._forget(path)
+        return removed
+
+    #%%
+
+    def paths(self, scheme=None, standard=None, under=None):
+        query = 'SELECT path FROM datasets WHERE 1'
+        args = []
+        if scheme is not None:
+            query += ' AND scheme = ?'
+            args.append(scheme)
+        if standard is not None:
+            query += ' AND standard = ?'
+            args.append(standard)
+        if under is not None:
+            query += ' AND path LIKE ? ESCAPE ?'
+            prefix = Path(under).absolute().as_posix().rstrip('/') + '/'
+            args += [prefix.replace('!', '!!').replace('%', '!%').replace('_', '!_') + '%', '!']
+        query += ' ORDER BY path'
+        return [row[0] for row in self._conn.execute(query, args)]
+
+    def _path_filter(self, paths):
+        # SQL condition restricting to paths, via a temporary table as there can be many
+        if paths is None:
+            return '1'
+        self._conn.execute('CREATE TEMP TABLE IF NOT EXISTS selected (path TEXT PRIMARY KEY)')
+        self._conn.execute('DELETE FROM selected')
+        self._conn.executemany(
+            'INSERT OR IGNORE INTO selected VALUES (?)',
+            [(self._key(path), ) for path in paths]
+            )
+        return 'path IN (SELECT path FROM selected)'
+
+    def meta_values(self, meta_key, paths=None):
+        '''
+        Value of the first meta_key in the meta of each dataset, as
+        datasetio.recursive_find_key would find it
+        Returns dict of path: value, datasets without meta_key are left out
+        '''
+        condition = self._path_filter(paths)
+        rows = self._conn.execute(
+            f'''SELECT path, value FROM meta
+                WHERE key = ? AND {condition}
+                AND position = (
+                    SELECT MIN(position) FROM meta AS m
+                    WHERE m.path = meta.path AND m.key = meta.key
+                    )''',
+            (meta_key, )
+            )
+        return {path: json.loads(value) for path, value in rows}
+
+    def group_paths(self, meta_key, paths=None):
+        # Dict of value of meta_key: paths, see meta_values
+        grouped = {}
+        for path, value in sorted(self.meta_values(meta_key, paths).items()):
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value) # Unhashable, group by its JSON
+            grouped.setdefault(value, []).append(path)
+        return grouped
+
+    def label_counts(self, paths=None):
+        # Total count of each label over datasets, as mltools.datasettools.summarize_datasets gives
+        condition = self._path_filter(paths)
+        rows = self._conn.execute(
+            f'SELECT label, SUM(count) FROM labels WHERE {condition} GROUP BY label ORDER BY label'
+            )
+        return {label: count for label, count in rows}
+
+    def summary(self, paths=None):
+        # Dict of path: dict of n_rows, n_cols, scheme, standard, fmt
+        condition = self._path_filter(paths)
+        rows = self._conn.execute(
+            f'SELECT path, n_rows, n_cols, scheme, standard, fmt FROM datasets WHERE {condition} ORDER BY path'
+            )
+        return {
+            row[0]: dict(zip(['n_rows', 'n_cols', 'scheme', 'standard', 'fmt'], row[1:])) \
+            for row in rows
+            }
@@ -12,12 +12,28 @@ import numpy as np
 from ..utils import npztools
 
 from ..signal.standards import STANDARDS
-from .schemes import SCHEMES, check_scheme
+from .schemes import SCHEMES, BATCH_SCHEMES, check_scheme
+from .catalog import DatasetCatalog
 
-def make_dataset(signals, scheme):
+def make_dataset(signals, scheme, batch=True):
     check_scheme(scheme)
     signals.check_consistent()
 
+    if batch and scheme in BATCH_SCHEMES and len(signals.signals) > 0:
+        X, accepted = BATCH_SCHEMES[scheme](signals.signals)
+        X = X[accepted]
+    else:
+        X = make_vectors(signals, scheme)
+
+    y = np.full(
+        (len(X), ),
+        signals.trace_info.label
+        )
+
+    return X, y
+
+def make_vectors(signals, scheme):
+    # One signal at a time, for schemes without a batched version
     scheme_func = SCHEMES[scheme]
 
     any_fails = False
@@ -30,15 +46,19 @@ def make_dataset(signals, scheme):
             continue
         vectors.append(vector)
 
-    X = np.array(vectors)
-    y = np.full(
-        (len(vectors), ),
-        signals.trace_info.label
-        )
+    return np.array(vectors)
 
-    return X, y
+DATASET_FORMATS = ['compressed', 'stored']
+DEFAULT_DATASET_FORMAT = 'stored'
+
+# compressed:
+#   X and y members compressed (np.savez_compressed), must be read whole
+# stored:
+#   X and y members uncompressed (np.savez), so can be memory-mapped straight
+#   out of the npz file, see load_dataset(mmap=True)
+# Both have scheme.txt, standard.txt and meta.json, and are read the same by np.load
 
-def save_dataset(path, X, y, scheme=None, standard=None, meta=None, overwrite=False):
+def save_dataset(path, X, y, scheme=None, standard=None, meta=None, overwrite=False, fmt=None):
     '''
     As dataset may be manipulated heavily in ML scripts,
     There will be no strict requirements for any metadata
@@ -58,6 +78,11 @@ def save_dataset(path, X, y, scheme=None, standard=None, meta=None, overwrite=Fa
     '''
     path = Path(path)
 
+    if fmt is None:
+        fmt = DEFAULT_DATASET_FORMAT
+    if fmt not in DATASET_FORMATS:
+        raise ValueError(f'Invalid dataset format: {fmt}; Valid formats are {DATASET_FORMATS}')
+
     if path.suffixes[-2:] != ['.dataset', '.npz']:
         path = path.with_suffix(path.suffix + '.dataset.npz')
 
@@ -87,8 +112,9 @@ def save_dataset(path, X, y, scheme=None, standard=None, meta=None, overwrite=Fa
     mode = 'xb'
     if overwrite:
         mode = 'wb'
+    savez = np.savez_compressed if fmt == 'compressed' else np.savez
     with open(path, mode) as npzf:
-        np.savez_compressed(npzf, X=X, y=y)
+        savez(npzf, X=X, y=y)
 
     with ZipFile(path, 'a') as zf:
         zf.writestr(
@@ -120,35 +146,107 @@ def make_and_save_dataset(signals, scheme, path, overwrite=False):
     meta = gen_dataset_meta(signals)
     save_dataset(path, *dataset, scheme=scheme, standard=standard, meta=meta, overwrite=overwrite)
 
-def load_dataset(path, return_dataset_only=True):
+def load_dataset(path, return_dataset_only=True, mmap=False):
+    '''
+    mmap: Memory-map X and y instead of reading them, read-only, rows are
+    only read from disk when used
+    Only for stored format datasets, compressed ones are read whole (with a warning)
+    '''
     path = Path(path)
 
-    npzf = np.load(path)
+    X = y = None
+    if mmap:
+        try:
+            X = npztools.memmap_npy_member(path, 'X')
+            y = npztools.memmap_npy_member(path, 'y')
+        except ValueError:
+            warn(f'Dataset cannot be memory-mapped, reading whole: {path}')
+            X = y = None
 
-    X = npzf['X']
-    y = npzf['y']
+    if X is None:
+        npzf = np.load(path)
+        X = npzf['X']
+        y = npzf['y']
 
     if return_dataset_only:
         return X, y
     else:
-        scheme = npztools.readstr(npzf, 'scheme.txt')
-        standard = npztools.readstr(npzf, 'standard.txt')
-        meta = json.loads(npzf['meta.json'])
+        scheme = read_scheme(path)
+        standard = read_standard(path)
+        meta = read_meta(path)
         return X, y, scheme, standard, meta
 
+# These only read the one small member, not X or y
+
 def read_scheme(path):
-    path = Path(path)
-    npzf = np.load(path)
-    scheme = npztools.readstr(npzf, 'scheme.txt')
-    return scheme
+    return npztools.readstr_zip(path, 'scheme.txt')
 
 def read_standard(path):
-    path = Path(path)
-    npzf = np.load(path)
-    standard = npztools.readstr(npzf, 'standard.txt')
-    return standard
+    return npztools.readstr_zip(path, 'standard.txt')
 
-def scan_for_datasets(path, recursive=True):
+def read_meta(path):
+    return json.loads(npztools.readstr_zip(path, 'meta.json'))
+
+def read_dataset_header(path):
+    '''
+    Everything about a dataset but X and y themselves
+    Returns dict of scheme, standard, meta, fmt, X_shape, X_dtype, y_shape, y_dtype
+    '''
+    X_shape, _, X_dtype, X_offset = npztools.read_npy_member_header(path, 'X')
+    y_shape, _, y_dtype, _ = npztools.read_npy_member_header(path, 'y')
+    return {
+        'scheme': read_scheme(path),
+        'standard': read_standard(path),
+        'meta': read_meta(path),
+        'fmt': 'compressed' if X_offset is None else 'stored',
+        'X_shape': X_shape,
+        'X_dtype': X_dtype,
+        'y_shape': y_shape,
+        'y_dtype': y_dtype
+        }
+
+DEFAULT_CATALOG_FILENAME = '.dataset_catalog.sqlite'
+
+def open_catalog(catalog):
+    # Path to catalog file or DatasetCatalog, returns DatasetCatalog and whether it was opened here
+    if isinstance(catalog, DatasetCatalog):
+        return catalog, False
+    return DatasetCatalog(catalog), True
+
+def read_label_counts(path):
+    # Only y is read, memory-mapped if possible
+    try:
+        y = npztools.memmap_npy_member(path, 'y')
+    except ValueError:
+        y = np.load(path)['y']
+    labels, counts = np.unique(y, return_counts=True)
+    return dict(zip(labels.tolist(), counts.tolist()))
+
+def update_catalog(catalog, paths):
+    '''
+    Record datasets at paths that are not in the catalog or changed since
+    catalog is a path to the catalog file or a DatasetCatalog
+    Returns list of paths (re-)recorded
+    '''
+    catalog, opened = open_catalog(catalog)
+    updated = []
+    try:
+        for path in paths:
+            if catalog.is_current(path):
+                continue
+            catalog.record(path, read_dataset_header(path), read_label_counts(path))
+            updated.append(path)
+    finally:
+        if opened:
+            catalog.close()
+    return updated
+
+def scan_for_datasets(path, recursive=True, catalog=None):
+    '''
+    catalog: Path to catalog file or DatasetCatalog to bring up to date
+    with the datasets found, entries of datasets that are gone from under
+    path are dropped
+    '''
     scan_dir = Path(path)
 
     if recursive:
@@ -156,7 +254,28 @@ def scan_for_datasets(path, recursive=True):
     else:
         glob_pattern = '*.dataset.npz'
 
-    return list(scan_dir.glob(glob_pattern))
+    paths = list(scan_dir.glob(glob_pattern))
+
+    if catalog is not None:
+        catalog, opened = open_catalog(catalog)
+        try:
+            update_catalog(catalog, paths)
+            catalog.forget_missing(under=scan_dir)
+        finally:
+            if opened:
+                catalog.close()
+
+    return paths
+
+def summarize_dataset_files(*paths, catalog):
+    # Label counts over dataset files, from the catalog, as summarize_datasets on the loaded datasets gives
+    catalog, opened = open_catalog(catalog)
+    try:
+        update_catalog(catalog, paths)
+        return catalog.label_counts(paths)
+    finally:
+        if opened:
+            catalog.close()
 
 def recursive_find_key(dic, key):
     for k, v in dic.items():
@@ -173,26 +292,56 @@ def get_meta_value(meta, key):
     '''Alias for recursive_find_key'''
     return recursive_find_key(meta, key)
 
-def load_separated_by_meta(meta_key, *paths):
+def group_by_meta(meta_key, *paths, catalog=None):
+    '''
+    Dict of value of meta_key: paths of datasets with that value, datasets
+    without meta_key are left out (with a warning)
+    catalog: Path to catalog file or DatasetCatalog to look meta up in
+    instead of reading it from every file
+    '''
+    paths = [Path(path) for path in paths]
+    if catalog is not None:
+        catalog, opened = open_catalog(catalog)
+        try:
+            update_catalog(catalog, paths)
+            values = catalog.meta_values(meta_key, paths)
+        finally:
+            if opened:
+                catalog.close()
+        values = {path: values.get(DatasetCatalog._key(path), KeyError) for path in paths}
+    else:
+        values = {}
+        for path in paths:
+            try:
+                values[path] = get_meta_value(read_meta(path), meta_key)
+            except KeyError:
+                values[path] = KeyError
+
+    grouped = {}
+    for path, group in values.items():
+        if group is KeyError:
+            warn(f'Meta key "{meta_key}" not found in the meta of "{path}", excluding this dataset')
+            continue
+        grouped.setdefault(group, []).append(path)
+    return grouped
+
+def load_separated_by_meta(meta_key, *paths, mmap=False, catalog=None, groups=None):
+    '''
+    groups: Only load the datasets of these values of meta_key
+    catalog: See group_by_meta
+    '''
     if meta_key not in ['signed_voltage', 'pore_id']:
         warn(f'Not a recommended meta key to use for separation: {meta_key}')
 
+    grouped_paths = group_by_meta(meta_key, *paths, catalog=catalog) # Before loading, excluded datasets are never loaded
+
     separated = {}
     separated_paths = {}
-    for path in paths:
-        X, y, _, _, meta = load_dataset(path, return_dataset_only=False)
-        dataset = X, y
-        try:
-            group = get_meta_value(meta, meta_key)
-        except KeyError:
-            warn(f'Meta key "{meta_key}" not found in the meta of "{path}", excluding this dataset')
+    for group, group_paths in grouped_paths.items():
+        if groups is not None and group not in groups:
             continue
-        if group not in separated:
-            separated[group] = [dataset]
-            separated_paths[group] = [path.as_posix()]
-        else:
-            separated[group].append(dataset)
-            separated_paths[group].append(path.as_posix())
+        separated[group] = [load_dataset(path, mmap=mmap) for path in group_paths]
+        separated_paths[group] = [path.as_posix() for path in group_paths]
 
     print('Separated - group paths:')
     pp(separated_paths, indent=2)
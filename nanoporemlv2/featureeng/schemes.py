@@ -138,6 +138,263 @@ SCHEMES = {
     'full_res_20000_wgeometricplus': full_res_20000_wgeometricplus
     }
 
+#%%
+# Batched versions of the schemes above, for all signals at once
+# Signals are passed as one ragged batch, the values of all signals
+# concatenated, plus offsets, signal i being values[offsets[i]:offsets[i+1]]
+# Each returns X and a bool mask of which signals it accepted, in place of the
+# exceptions the per signal functions use to reject a signal
+
+def ragged_batch(signals):
+    lengths = np.fromiter((len(signal) for signal in signals), dtype=np.int64, count=len(signals))
+    offsets = np.zeros(len(lengths)+1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    values = np.concatenate([signal.values for signal in signals]).astype(np.float64, copy=False)
+    return values, offsets
+
+def segment_reduce(ufunc, values, starts, stops):
+    # ufunc.reduceat over arbitrary [start, stop) ranges, which may be empty or
+    # go up to the very end
+    # Result for empty ranges is garbage, caller must deal with those
+    padded = np.empty(len(values)+1, dtype=values.dtype)
+    padded[:-1] = values
+    padded[-1] = 0
+    indices = np.empty(2*len(starts), dtype=np.int64)
+    indices[0::2] = starts
+    indices[1::2] = stops
+    return ufunc.reduceat(padded, indices)[0::2]
+
+def segment_ids(offsets):
+    return np.repeat(np.arange(len(offsets)-1), np.diff(offsets))
+
+#%%
+
+def highest_peaks_batch(values, offsets):
+    # Same peaks as scipy.signal.find_peaks, i.e. local maxima excluding the ends,
+    # taking the middle (rounded down) of flat peaks
+    # Then the highest per signal, the first one if tied, -1 if no peaks
+    n = len(offsets)-1
+    starts = offsets[:-1]
+    ends = offsets[1:]
+
+    # Runs of equal values, never crossing signals
+    new_run = np.ones(len(values), dtype=bool)
+    new_run[1:] = values[1:] != values[:-1]
+    new_run[starts] = True
+    run_lefts = np.flatnonzero(new_run)
+    run_rights = np.empty_like(run_lefts)
+    run_rights[:-1] = run_lefts[1:] - 1
+    run_rights[-1] = len(values) - 1
+    run_segments = segment_ids(offsets)[run_lefts]
+
+    inner = (run_lefts > starts[run_segments]) & (run_rights < ends[run_segments] - 1)
+    run_lefts = run_lefts[inner]
+    run_rights = run_rights[inner]
+    run_segments = run_segments[inner]
+    is_peak = (values[run_lefts-1] < values[run_lefts]) & (values[run_rights+1] < values[run_rights])
+    peaks = (run_lefts[is_peak] + run_rights[is_peak]) // 2
+    peak_segments = run_segments[is_peak]
+
+    highest = np.full(n, -1, dtype=np.int64)
+    if len(peaks) == 0:
+        return highest
+    peak_values = values[peaks]
+    group_starts = np.flatnonzero(np.r_[True, peak_segments[1:] != peak_segments[:-1]])
+    group_maxes = np.maximum.reduceat(peak_values, group_starts)
+    group_lengths = np.diff(np.r_[group_starts, len(peaks)])
+    is_max = peak_values == np.repeat(group_maxes, group_lengths)
+    # First max of each group, peaks are in order
+    first_max = np.minimum.reduceat(np.where(is_max, np.arange(len(peaks)), len(peaks)), group_starts)
+    highest[peak_segments[group_starts]] = peaks[first_max]
+    return highest
+
+def geometric_features_batch__(values, offsets, sample_period):
+    # Same as geometric_features__, prominence and width of the highest peak
+    # following scipy.signal.peak_prominences and peak_widths
+    n = len(offsets)-1
+    starts = offsets[:-1]
+    ends = offsets[1:]
+    lengths = np.diff(offsets)
+
+    area = np.add.reduceat(values, starts) * sample_period
+
+    X = np.full((n, 4), np.nan)
+    X[:, 3] = area
+
+    highest = highest_peaks_batch(values, offsets)
+    has_peak = highest != -1
+    if not np.any(has_peak):
+        return X, np.ones(n, dtype=bool)
+
+    idx = np.arange(len(values))
+    peak = np.repeat(highest, lengths)
+    height = np.where(has_peak, values[highest], np.inf)
+    height_ = np.repeat(height, lengths)
+
+    # Bases, lowest point on each side before anything higher than the peak
+    higher = ~(values <= height_)
+    left_stop = np.maximum.reduceat(np.where(higher & (idx < peak), idx, -1), starts)
+    right_stop = np.minimum.reduceat(np.where(higher & (idx > peak), idx, len(values)), starts)
+    left_stop_ = np.repeat(left_stop, lengths)
+    right_stop_ = np.repeat(right_stop, lengths)
+    left_min = np.minimum.reduceat(np.where((idx > left_stop_) & (idx <= peak), values, np.inf), starts)
+    right_min = np.minimum.reduceat(np.where((idx >= peak) & (idx < right_stop_), values, np.inf), starts)
+    with np.errstate(invalid='ignore'): # inf - inf for signals without peaks
+        prominence = height - np.maximum(left_min, right_min)
+        width_height = height - prominence * 0.5
+    width_height_ = np.repeat(width_height, lengths)
+
+    # Width, first point at or below width height on either side
+    at_or_below = ~(width_height_ < values)
+    left = np.maximum.reduceat(np.where(at_or_below & (idx > left_stop_) & (idx <= peak), idx, -1), starts)
+    right = np.minimum.reduceat(np.where(at_or_below & (idx >= peak) & (idx < right_stop_), idx, len(values)), starts)
+
+    left = left[has_peak]
+    right = right[has_peak]
+    width_height = width_height[has_peak]
+    left_ip = left.astype(np.float64)
+    interp = values[left] < width_height
+    l = left[interp]
+    left_ip[interp] += (width_height[interp] - values[l]) / (values[l+1] - values[l])
+    right_ip = right.astype(np.float64)
+    interp = values[right] < width_height
+    r = right[interp]
+    right_ip[interp] -= (width_height[interp] - values[r]) / (values[r-1] - values[r])
+
+    X[has_peak, 0] = height[has_peak]
+    X[has_peak, 1] = (right_ip - left_ip) * sample_period
+    X[has_peak, 2] = width_height
+    return X, np.ones(n, dtype=bool)
+
+def geometric_features_batch(signals):
+    return geometric_features_batch__(*ragged_batch(signals), signals[0].trace_info.sampling_period)
+
+#%%
+
+def skew_kurtosis_batch(values, offsets):
+    # Same as scipy.stats.skew and kurtosis with defaults
+    starts = offsets[:-1]
+    lengths = np.diff(offsets)
+    mean = np.add.reduceat(values, starts) / lengths
+    dev = values - np.repeat(mean, lengths)
+    sq = dev**2
+    m2 = np.add.reduceat(sq, starts) / lengths
+    m3 = np.add.reduceat(sq*dev, starts) / lengths
+    m4 = np.add.reduceat(sq**2, starts) / lengths
+    with np.errstate(all='ignore'):
+        zero = m2 <= (np.finfo(m2.dtype).eps * mean)**2
+        skew = np.where(zero, np.nan, m3 / m2**1.5)
+        kurt = np.where(zero, np.nan, m4 / m2**2.0) - 3
+    return skew, kurt
+
+def geometric_features_plus_batch__(values, offsets, sample_period):
+    X, accepted = geometric_features_batch__(values, offsets, sample_period)
+    skew, kurt = skew_kurtosis_batch(values, offsets)
+    basewidth = np.diff(offsets) * sample_period
+    X = np.column_stack([X, basewidth, skew, kurt])
+    return X, accepted
+
+def geometric_features_plus_batch(signals):
+    return geometric_features_plus_batch__(*ragged_batch(signals), signals[0].trace_info.sampling_period)
+
+#%%
+
+def averaging_sample_batch__(values, offsets, samples=10, return_pts_per_slice=False):
+    # Same slicing as averaging_sample__, i.e. equal slices with the last one
+    # also taking half (rounded down) of the left over points
+    n = len(offsets)-1
+    lengths = np.diff(offsets)
+    pts_per_slice = lengths // samples
+    extras_in_last = (lengths % samples) // 2
+
+    slice_starts = offsets[:-1, None] + np.arange(samples)[None, :] * pts_per_slice[:, None]
+    slice_stops = slice_starts + pts_per_slice[:, None]
+    slice_stops[:, -1] += extras_in_last
+    slice_starts = slice_starts.ravel()
+    slice_stops = slice_stops.ravel()
+
+    counts = slice_stops - slice_starts
+    sums = segment_reduce(np.add, values, slice_starts, slice_stops)
+    with np.errstate(all='ignore'):
+        averages = np.where(counts > 0, sums / counts, np.nan) # np.average of empty slice is nan
+    X = averages.reshape(n, samples)
+
+    if return_pts_per_slice:
+        X = np.column_stack([X, pts_per_slice])
+    return X, np.ones(n, dtype=bool)
+
+def averaging_sample_batch_(signals, samples=10):
+    values, offsets = ragged_batch(signals)
+    return averaging_sample_batch__(values, offsets, samples=samples)
+
+def averaging_sample_10_batch(signals):
+    return averaging_sample_batch_(signals, 10)
+
+def averaging_sample_50_batch(signals):
+    return averaging_sample_batch_(signals, 50)
+
+def averaging_sample_10_wslicesize_batch(signals):
+    values, offsets = ragged_batch(signals)
+    return averaging_sample_batch__(values, offsets, samples=10, return_pts_per_slice=True)
+
+#%%
+
+def averaging_10_wslicesize_wgeometricplus_batch(signals):
+    values, offsets = ragged_batch(signals)
+    sample_period = signals[0].trace_info.sampling_period
+    X1, accepted1 = averaging_sample_batch__(values, offsets, samples=10, return_pts_per_slice=True)
+    X2, accepted2 = geometric_features_plus_batch__(values, offsets, sample_period)
+    return np.hstack([X1, X2]), accepted1 & accepted2
+
+#%%
+
+def full_res_batch__(values, offsets, max_size=200):
+    # Signals longer than max_size do not fit and are rejected, as in full_res__
+    lengths = np.diff(offsets)
+    accepted = lengths <= max_size
+    X = np.zeros((len(lengths), max_size))
+    rows = segment_ids(offsets)
+    cols = np.arange(len(values)) - np.repeat(offsets[:-1], lengths)
+    fits = np.repeat(accepted, lengths)
+    X[rows[fits], cols[fits]] = values[fits]
+    return X, accepted
+
+def full_res_200_batch(signals):
+    return full_res_batch__(*ragged_batch(signals), 200)
+
+def full_res_20000_batch(signals):
+    return full_res_batch__(*ragged_batch(signals), 20_000)
+
+#%%
+
+def full_res_wgeometricplus_batch_(signals, max_size):
+    values, offsets = ragged_batch(signals)
+    sample_period = signals[0].trace_info.sampling_period
+    X1, accepted1 = full_res_batch__(values, offsets, max_size)
+    X2, accepted2 = geometric_features_plus_batch__(values, offsets, sample_period)
+    return np.hstack([X1, X2]), accepted1 & accepted2
+
+def full_res_200_wgeometricplus_batch(signals):
+    return full_res_wgeometricplus_batch_(signals, 200)
+
+def full_res_20000_wgeometricplus_batch(signals):
+    return full_res_wgeometricplus_batch_(signals, 20_000)
+
+#%%
+
+BATCH_SCHEMES = {
+    'geometric_features': geometric_features_batch,
+    'geometric_features_plus': geometric_features_plus_batch,
+    'averaging_sample_10': averaging_sample_10_batch,
+    'averaging_sample_50': averaging_sample_50_batch,
+    'averaging_sample_10_wslicesize': averaging_sample_10_wslicesize_batch,
+    'averaging_10_wslicesize_wgeometricplus': averaging_10_wslicesize_wgeometricplus_batch,
+    'full_res_200': full_res_200_batch,
+    'full_res_20000': full_res_20000_batch,
+    'full_res_200_wgeometricplus': full_res_200_wgeometricplus_batch,
+    'full_res_20000_wgeometricplus': full_res_20000_wgeometricplus_batch
+    }
+
 def check_scheme(scheme):
     if scheme not in SCHEMES:
         raise ValueError(f'Invalid scheme: {scheme}; Valid schemes are {list(SCHEMES.keys())}')
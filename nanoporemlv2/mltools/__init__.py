@@ -1,3 +1,3 @@
 #
 
-__all__ = ["datasettools"]
+__all__ = ["datasettools", "experiments", "clustering"]
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+'''
+K-means over a descending sweep of numbers of clusters, as done to pick
+out the main cluster of a dataset
+
+Every step after the first starts from the centers of the step before,
+with the most similar pair of centers merged into one (weighted by cluster
+sizes), so each fit only has to refine instead of starting over
+
+Similarity of centers is their Pearson correlation, all pairs at once
+'''
+
+import numpy as np
+
+from sklearn.cluster import KMeans, MiniBatchKMeans
+
+#%%
+
+def center_similarities(centers):
+    # Pearson correlation of every pair of centers, nan for constant centers
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.atleast_2d(np.corrcoef(centers))
+
+def max_similarity(similarities):
+    # Of the most similar pair of different centers, 0.0 if there are no pairs
+    # Pairs with constant centers (nan) are left out
+    pairs = similarities[np.triu_indices(len(similarities), k=1)]
+    pairs = pairs[~np.isnan(pairs)]
+    return float(pairs.max()) if len(pairs) > 0 else 0.0
+
+def merged_centers(centers, sizes, similarities):
+    '''
+    centers with the most similar pair replaced by their mean weighted by
+    sizes, i.e. one fewer
+    '''
+    k = len(centers)
+    i, j = np.triu_indices(k, k=1)
+    pairs = np.nan_to_num(similarities[i, j], nan=-np.inf)
+    best = int(np.argmax(pairs))
+    a, b = i[best], j[best]
+    weights = np.array([sizes[a], sizes[b]], dtype=np.float64)
+    if weights.sum() == 0:
+        weights[:] = 1
+    merged = np.average(centers[[a, b]], axis=0, weights=weights)
+    keep = np.ones(k, dtype=bool)
+    keep[[a, b]] = False
+    return np.concatenate([centers[keep], merged[np.newaxis, :]])
+
+#%%
+
+class KSweepStep:
+    '''
+    Result of one number of clusters of the sweep
+
+    n_clusters, centers, labels
+    sizes: count of each cluster
+    order: clusters by size, largest first, ties by index
+    similarities: similarity matrix of the centers
+    max_similarity: see max_similarity
+    delta_max_similarity: max_similarity of the step before minus this one's
+        (the step before is taken as 0.0 for the first step)
+    '''
+    def __init__(self, n_clusters, centers, labels, last_max_similarity):
+        self.n_clusters = n_clusters
+        self.centers = centers
+        self.labels = labels
+        self.sizes = np.bincount(labels, minlength=n_clusters)
+        self.order = np.argsort(-self.sizes, kind='stable')
+        self.similarities = center_similarities(centers)
+        self.max_similarity = max_similarity(self.similarities)
+        self.delta_max_similarity = last_max_similarity - self.max_similarity
+
+    def selected(self, wanted=0, n_extra=0):
+        '''
+        Indices of the rows in the wanted-th largest cluster (0 for the
+        largest), then of those in each of the n_extra next largest after it
+        '''
+        if wanted + n_extra >= self.n_clusters:
+            raise ValueError(f'Only {self.n_clusters} clusters, cannot select {wanted} and {n_extra} extra')
+        return np.concatenate([
+            np.flatnonzero(self.labels == cluster) for cluster in self.order[wanted:wanted+1+n_extra]
+            ])
+
+def ksweep(X,
+           start,
+           stop=1,
+           random_state=None,
+           batch_size=None,
+           warm_start=True,
+           until=None):
+    '''
+    Fits k-means to X for n_clusters from start down to stop (inclusive),
+    yielding a KSweepStep for each
+
+    batch_size: fit with MiniBatchKMeans in batches of this many rows,
+        for large (e.g. full res) X, None for KMeans on all of X
+    warm_start: start every step after the first from the merged centers of
+        the step before, False to start every step from scratch
+    until: function of a KSweepStep, stops the sweep after the step it
+        returns True for
+    '''
+    if start < stop or stop < 1:
+        raise ValueError(f'Invalid n_clusters sweep: {start} to {stop}')
+    if isinstance(random_state, (int, np.integer)) or random_state is None:
+        random_state = np.random.RandomState(random_state) # Same stream over all steps
+
+    last = None
+    for n_clusters in range(start, stop-1, -1):
+        init = 'k-means++'
+        n_init = 'auto'
+        if warm_start and last is not None:
+            init = merged_centers(last.centers, last.sizes, last.similarities)
+            n_init = 1
+        if batch_size is None:
+            kmeans = KMeans(n_clusters=n_clusters, init=init, n_init=n_init, random_state=random_state)
+        else:
+            kmeans = MiniBatchKMeans(
+                n_clusters=n_clusters, init=init, n_init=n_init,
+                batch_size=batch_size, random_state=random_state
+                )
+        kmeans.fit(X)
+        step = KSweepStep(
+            n_clusters,
+            kmeans.cluster_centers_,
+            kmeans.labels_,
+            0.0 if last is None else last.max_similarity
+            )
+        yield step
+        last = step
+        if until is not None and until(step):
+            break
@@ -23,6 +23,11 @@ def specific_rows_deleted(X, y, rows):
     y = np.delete(y, rows, axis=0)
     return X, y
 
+def slice_dataset(X, y, start, stop, step):
+    # Same rows of X and y, as X[start:stop:step]
+    ind = slice(start, stop, step)
+    return X[ind], y[ind]
+
 def combine_datasets_Xy(*Xys):
     if len(Xys) % 2 != 0:
         raise ValueError(f'One or more datasets missing X or y')
@@ -94,7 +99,73 @@ def summarize_datasets(*datasets):
     grouped = group_by_label(*datasets)
     return summarize_grouped(grouped)
 
-def expand_and_center(X):
+def highest_peaks(X):
+    '''
+    Index of the highest peak of each row of X, as the highest of
+    scipy.signal.find_peaks(row) picked by max, or -1 for rows without peaks
+    '''
+    # Peaks as find_peaks finds them: a rise onto a plateau (possibly of one
+    # sample) followed by a fall, the peak being the middle of the plateau
+    # rounded down, the first and last samples can never be peaks
+    rows, cols = X.shape
+    ret = np.full(rows, -1, dtype=np.int64)
+    if cols < 3:
+        return ret
+    # Index of the next sample differing from the previous, after each sample
+    changes = np.empty((rows, cols), dtype=bool)
+    changes[:, 0] = True
+    np.not_equal(X[:, 1:], X[:, :-1], out=changes[:, 1:]) # nan never equal, as in find_peaks
+    next_change = np.where(changes, np.arange(cols), cols)
+    next_change = np.minimum.accumulate(next_change[:, ::-1], axis=1)[:, ::-1]
+    # Candidates are samples 1 to cols-2, ahead[:, i-1] is the first sample
+    # after i differing from it, and the plateau starting at i ends before it
+    ahead = np.minimum(next_change[:, 2:], cols-1) # Plateau search stops at the last sample
+    middle = X[:, 1:-1]
+    is_peak = (X[:, :-2] < middle) & (np.take_along_axis(X, ahead, axis=1) < middle)
+    heights = np.where(is_peak, middle, -np.inf)
+    highest = np.argmax(heights, axis=1) # First of equally high ones, as max does
+    has_peak = is_peak.any(axis=1)
+    start = highest[has_peak] + 1
+    ret[has_peak] = (start + ahead[has_peak, highest[has_peak]] - 1) // 2
+    return ret
+
+def expand_and_center(X, batch=True, dtype=np.float64, out=None, chunk_rows=4096):
+    '''
+    Rows of X placed in rows twice as wide, shifted so that their highest
+    peak is at the center, or the middle of the row if it has no peaks
+
+    dtype is of the returned array, ignored if out is given
+    out is an array of shape (rows, 2*cols) to fill, it is zeroed first
+    Rows are done chunk_rows at a time to bound temporary memory
+    batch=False does it row by row, for checking against
+    '''
+    if not batch:
+        centered_X = _expand_and_center_loop(X)
+        if out is not None:
+            out[...] = centered_X
+            return out
+        return centered_X.astype(dtype, copy=False)
+
+    rows, cols = X.shape
+    if out is None:
+        out = np.zeros((rows, 2*cols), dtype=dtype) # Need to expand X by 2x min to accomodate centering
+    else:
+        if out.shape != (rows, 2*cols):
+            raise ValueError(f'out should be of shape {(rows, 2*cols)}, not: {out.shape}')
+        out[...] = 0
+    # Center of the odd width 2*cols+1 is cols, see _expand_and_center_loop
+    default_shift = math.floor(cols - (cols-1)/2)
+    cols_range = np.arange(cols)
+    for chunk_start in range(0, rows, chunk_rows):
+        chunk = slice(chunk_start, min(chunk_start+chunk_rows, rows))
+        peaks = highest_peaks(X[chunk])
+        shifts = np.where(peaks >= 0, cols - peaks, default_shift)
+        row_ind = np.arange(chunk.start, chunk.stop)[:, np.newaxis]
+        out[row_ind, shifts[:, np.newaxis] + cols_range] = X[chunk]
+    return out
+
+def _expand_and_center_loop(X):
+    # Row by row reference for expand_and_center
 
     #       |
     # 0 1 2 3 4 5 6
@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+'''
+Repeated grid search experiments run over a pool of worker processes
+
+An experiment is one train/val set and test set, an estimator and a grid of
+its params, searched again with each of a number of repeats as
+GridSearchCV(estimator, param_grid, cv=cv, scoring=scoring) would, then the
+best params refit and scored on the test set
+
+All experiments are split into tasks, one per (repeat, params, fold) fit,
+plus one refit per repeat once all its folds are done, so the pool is kept
+busy across repeats and experiments instead of one GridSearchCV at a time
+
+Nested parallelism is controlled with
+    max_workers: worker processes
+    inner_jobs: n_jobs of the estimator in each task, and the limit on BLAS
+        and OpenMP threads of each worker
+so at most max_workers*inner_jobs cores are used
+
+Datasets are put in shared memory once per experiment, tasks only carry
+their names, workers attach to them instead of being sent copies
+
+Results are yielded as they complete and written to a log, one JSON object
+per line:
+    event 'repeat': the GridSearchCV like results of a repeat, best params
+        and test score and confusion matrix of the best model
+    event 'experiment': summary of the test scores of all repeats
+'''
+
+from multiprocessing import shared_memory
+from collections import OrderedDict, deque
+import concurrent.futures
+import time
+import json
+import os
+
+import numpy as np
+import scipy.stats as stats
+
+from sklearn.base import clone
+from sklearn.metrics import check_scoring, confusion_matrix
+from sklearn.model_selection import ParameterGrid
+
+#%%
+
+class SharedArrays:
+    '''
+    Copies of arrays in shared memory, for workers to attach to with
+    attach_arrays(shared.spec)
+    Unlink with close once no more tasks use them
+    '''
+    def __init__(self, **arrays):
+        self._shms = []
+        self.spec = {}
+        try:
+            for name, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                if array.dtype.hasobject:
+                    raise ValueError(f'Cannot share array of objects: {name}')
+                shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+                self._shms.append(shm)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+                self.spec[name] = (shm.name, array.shape, array.dtype.str)
+        except:
+            self.close()
+            raise
+
+    def close(self):
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+        self._shms = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# Worker side, attached shared arrays of the most recently used specs
+_attached = OrderedDict()
+MAX_ATTACHED = 4
+
+def _spec_key(spec):
+    return tuple(sorted((name, shm_name) for name, (shm_name, _, _) in spec.items()))
+
+def attach_arrays(spec):
+    '''
+    Arrays of a SharedArrays spec, read only
+    Attachments are cached, the least recently used closed past MAX_ATTACHED
+    '''
+    key = _spec_key(spec)
+    if key in _attached:
+        _attached.move_to_end(key)
+        return _attached[key][1]
+    shms = []
+    arrays = {}
+    for name, (shm_name, shape, dtype) in spec.items():
+        # Workers share the resource tracker of the process that created
+        # the pool, so attaching does not make it unlink anything twice
+        shm = shared_memory.SharedMemory(name=shm_name)
+        shms.append(shm)
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        array.flags.writeable = False
+        arrays[name] = array
+    _attached[key] = (shms, arrays)
+    while len(_attached) > MAX_ATTACHED:
+        _, (old_shms, old_arrays) = _attached.popitem(last=False)
+        old_arrays.clear() # Views must go before their buffers can close
+        for shm in old_shms:
+            shm.close()
+    return arrays
+
+#%%
+
+_inner_jobs = 1
+_thread_limits = None
+
+def _init_worker(inner_jobs):
+    global _inner_jobs, _thread_limits
+    _inner_jobs = inner_jobs
+    try:
+        from threadpoolctl import threadpool_limits # Dependency of sklearn
+        _thread_limits = threadpool_limits(limits=inner_jobs)
+    except ImportError:
+        pass
+
+def _make_estimator(estimator, params, seed):
+    estimator = clone(estimator)
+    available = estimator.get_params()
+    if 'random_state' in available:
+        estimator.set_params(random_state=seed)
+    if 'n_jobs' in available:
+        estimator.set_params(n_jobs=_inner_jobs)
+    return estimator.set_params(**params)
+
+_splits = OrderedDict()
+
+def _get_split(spec, cv, fold):
+    # Folds of the trainval set, split once per worker per experiment
+    key = _spec_key(spec)
+    if key not in _splits:
+        arrays = attach_arrays(spec)
+        _splits[key] = list(cv.split(arrays['trainval_X'], arrays['trainval_y']))
+        while len(_splits) > MAX_ATTACHED:
+            _splits.popitem(last=False)
+    return _splits[key][fold]
+
+def fold_task(spec, estimator, params, seed, cv, fold, scoring):
+    # Fit on all but one fold and score on it, as GridSearchCV does
+    arrays = attach_arrays(spec)
+    X, y = arrays['trainval_X'], arrays['trainval_y']
+    train, val = _get_split(spec, cv, fold)
+    model = _make_estimator(estimator, params, seed)
+    t0 = time.perf_counter()
+    model.fit(X[train], y[train])
+    t1 = time.perf_counter()
+    score = check_scoring(model, scoring)(model, X[val], y[val])
+    t2 = time.perf_counter()
+    return {'score': score, 'fit_time': t1-t0, 'score_time': t2-t1}
+
+def refit_task(spec, estimator, params, seed, scoring, labels):
+    # Fit on all of trainval and score on test
+    arrays = attach_arrays(spec)
+    model = _make_estimator(estimator, params, seed)
+    t0 = time.perf_counter()
+    model.fit(arrays['trainval_X'], arrays['trainval_y'])
+    refit_time = time.perf_counter() - t0
+    test_X, test_y = arrays['test_X'], arrays['test_y']
+    test_score = check_scoring(model, scoring)(model, test_X, test_y)
+    confmat = confusion_matrix(test_y, model.predict(test_X), labels=labels)
+    return {'test_score': test_score, 'confmat': confmat, 'refit_time': refit_time}
+
+#%%
+
+def gridsearch_results(candidates, fold_results):
+    '''
+    cv_results_, best_index_, best_params_ and best_score_ as GridSearchCV
+    gives them, from fold_results[candidate][fold] of fold_task
+    '''
+    n_folds = len(fold_results[0])
+    scores = np.array([[r['score'] for r in row] for row in fold_results], dtype=np.float64)
+    fit_times = np.array([[r['fit_time'] for r in row] for row in fold_results])
+    score_times = np.array([[r['score_time'] for r in row] for row in fold_results])
+
+    cv_results = {
+        'mean_fit_time': fit_times.mean(axis=1),
+        'std_fit_time': fit_times.std(axis=1),
+        'mean_score_time': score_times.mean(axis=1),
+        'std_score_time': score_times.std(axis=1),
+        }
+    for name in sorted({name for params in candidates for name in params}):
+        cv_results[f'param_{name}'] = np.ma.MaskedArray(
+            [params.get(name) for params in candidates],
+            mask=[name not in params for params in candidates],
+            dtype=object
+            )
+    cv_results['params'] = candidates
+    for fold in range(n_folds):
+        cv_results[f'split{fold}_test_score'] = scores[:, fold]
+    mean = scores.mean(axis=1)
+    cv_results['mean_test_score'] = mean
+    cv_results['std_test_score'] = scores.std(axis=1)
+    # Ranked as GridSearchCV does, ties share the best rank, nan ranked last
+    if np.isnan(mean).all():
+        rank = np.ones(len(mean), dtype=np.int32)
+    else:
+        ranked = np.nan_to_num(mean, nan=np.nanmin(mean)-1)
+        rank = stats.rankdata(-ranked, method='min').astype(np.int32)
+    cv_results['rank_test_score'] = rank
+
+    best_index = int(rank.argmin())
+    return {
+        'cv_results': cv_results,
+        'best_index': best_index,
+        'best_params': candidates[best_index],
+        'best_score': float(mean[best_index])
+        }
+
+def summarize_test_scores(test_scores, confmats):
+    best_repeat = int(np.argmax(test_scores)) # First of the highest
+    return {
+        'test_scores': list(test_scores),
+        'highest': float(np.max(test_scores)),
+        'lowest': float(np.min(test_scores)),
+        'average': float(np.average(test_scores)),
+        'std': float(np.std(test_scores)),
+        'best_repeat': best_repeat,
+        'best_confmat': confmats[best_repeat]
+        }
+
+#%%
+
+def _to_jsonable(obj):
+    if isinstance(obj, np.ma.MaskedArray):
+        return [None if m else v for v, m in zip(obj.data.tolist(), np.ma.getmaskarray(obj).tolist())]
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (tuple, set)):
+        return list(obj)
+    return str(obj)
+
+class ExperimentLog:
+    '''
+    Results written as they come, one JSON object per line, each with the
+    time it was written at
+    Opened with mode 'x' by default, i.e. never overwrites an old log
+    '''
+    def __init__(self, path, mode='x'):
+        self._f = open(path, mode)
+
+    def write(self, record):
+        record = {'time': time.time(), **record}
+        self._f.write(json.dumps(record, default=_to_jsonable) + '\n')
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+#%%
+
+class _Experiment:
+    def __init__(self, key, shared, estimator, candidates, cv, scoring, seeds, labels):
+        self.key = key
+        self.shared = shared
+        self.estimator = estimator
+        self.candidates = candidates
+        self.cv = cv
+        self.scoring = scoring
+        self.seeds = seeds
+        self.labels = labels
+        self.n_folds = cv.get_n_splits()
+        self.fold_results = [
+            [[None]*self.n_folds for _ in candidates] for _ in seeds
+            ]
+        self.folds_left = [len(candidates)*self.n_folds for _ in seeds]
+        self.repeat_results = [None for _ in seeds]
+        self.repeats_left = len(seeds)
+
+class ExperimentRunner:
+    '''
+    Collects experiments with add, then runs them all with run
+
+    max_workers: worker processes, by default as many as there are cores
+        for inner_jobs each
+    inner_jobs: n_jobs of the estimators, and threads of each worker
+    log: path of the JSON lines log, or an ExperimentLog, or None for no log
+    '''
+    def __init__(self, max_workers=None, inner_jobs=1, log=None):
+        if inner_jobs < 1:
+            raise ValueError(f'Invalid inner jobs: {inner_jobs}')
+        if max_workers is None:
+            max_workers = max(1, os.cpu_count()//inner_jobs)
+        if max_workers < 1:
+            raise ValueError(f'Invalid max workers: {max_workers}')
+        self._max_workers = max_workers
+        self._inner_jobs = inner_jobs
+        if log is not None and not isinstance(log, ExperimentLog):
+            log = ExperimentLog(log)
+        self._log = log
+        self._experiments = []
+
+    def add(self,
+            key,
+            trainval, test,
+            estimator, param_grid,
+            cv, scoring=None,
+            repeats=10, seeds=None,
+            labels=None
+            ):
+        '''
+        key: identifies the experiment in results and the log, e.g. (voltage, combination)
+        trainval, test: (X, y) datasets, copied into shared memory now
+        estimator, param_grid, cv, scoring: as for GridSearchCV, cv must not
+            be randomly shuffled as folds are split again in every worker
+        seeds: random_state of the estimators of each repeat, one per repeat,
+            random by default, they are in the results so repeats can be redone
+        labels: order of the confusion matrix rows and columns
+        '''
+        if seeds is None:
+            seeds = np.random.default_rng().integers(0, 1_000_000_000, repeats).tolist()
+        if len(seeds) != repeats:
+            raise ValueError(f'Need one seed per repeat, got {len(seeds)} for {repeats} repeats')
+        trainval_X, trainval_y = trainval
+        test_X, test_y = test
+        shared = SharedArrays(
+            trainval_X=trainval_X, trainval_y=trainval_y,
+            test_X=test_X, test_y=test_y
+            )
+        self._experiments.append(_Experiment(
+            key, shared, estimator, list(ParameterGrid(param_grid)), cv, scoring, list(seeds), labels
+            ))
+
+    def _close_all(self):
+        for experiment in self._experiments:
+            experiment.shared.close()
+        self._experiments = []
+
+    def run(self):
+        '''
+        Yields result dicts as they complete, see the module docstring
+        Refits are run ahead of the remaining fold fits, so each repeat's
+        result comes as soon as its folds are done
+        '''
+        folds = deque()
+        for experiment in self._experiments:
+            for repeat in range(len(experiment.seeds)):
+                for candidate in range(len(experiment.candidates)):
+                    for fold in range(experiment.n_folds):
+                        folds.append((experiment, repeat, candidate, fold))
+        refits = deque()
+        max_in_flight = 2*self._max_workers # Enough queued to keep workers busy
+
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self._max_workers,
+            initializer=_init_worker,
+            initargs=(self._inner_jobs,)
+            )
+        futures = {}
+        try:
+            def submit_next():
+                if refits:
+                    experiment, repeat, best = refits.popleft()
+                    future = executor.submit(
+                        refit_task,
+                        experiment.shared.spec, experiment.estimator,
+                        experiment.candidates[best], experiment.seeds[repeat],
+                        experiment.scoring, experiment.labels
+                        )
+                    futures[future] = ('refit', experiment, repeat)
+                elif folds:
+                    experiment, repeat, candidate, fold = folds.popleft()
+                    future = executor.submit(
+                        fold_task,
+                        experiment.shared.spec, experiment.estimator,
+                        experiment.candidates[candidate], experiment.seeds[repeat],
+                        experiment.cv, fold, experiment.scoring
+                        )
+                    futures[future] = ('fold', experiment, repeat, candidate, fold)
+
+            def fill():
+                while len(futures) < max_in_flight and (refits or folds):
+                    submit_next()
+
+            fill()
+            while futures:
+                done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    task = futures.pop(future)
+                    result = future.result()
+                    if task[0] == 'fold':
+                        _, experiment, repeat, candidate, fold = task
+                        experiment.fold_results[repeat][candidate][fold] = result
+                        experiment.folds_left[repeat] -= 1
+                        if experiment.folds_left[repeat] == 0:
+                            search = gridsearch_results(experiment.candidates, experiment.fold_results[repeat])
+                            experiment.repeat_results[repeat] = search
+                            refits.append((experiment, repeat, search['best_index']))
+                    else:
+                        _, experiment, repeat = task
+                        repeat_result = experiment.repeat_results[repeat]
+                        repeat_result.update(result)
+                        record = {
+                            'event': 'repeat',
+                            'key': experiment.key,
+                            'repeat': repeat,
+                            'seed': experiment.seeds[repeat],
+                            **repeat_result
+                            }
+                        self._write(record)
+                        yield record
+                        experiment.repeats_left -= 1
+                        if experiment.repeats_left == 0:
+                            experiment.shared.close() # Nothing else reads it
+                            record = {
+                                'event': 'experiment',
+                                'key': experiment.key,
+                                **summarize_test_scores(
+                                    [r['test_score'] for r in experiment.repeat_results],
+                                    [r['confmat'] for r in experiment.repeat_results]
+                                    )
+                                }
+                            self._write(record)
+                            yield record
+                fill()
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+            self._close_all()
+
+    def _write(self, record):
+        if self._log is not None:
+            self._log.write(record)
+
+    def close(self):
+        self._close_all()
+        if self._log is not None:
+            self._log.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+'''
+Make-like record of what every artifact of the processing stages was built
+from, so unchanged ones need not be built again
+
+Every artifact gets a key, a hash of
+    the stage,
+    the key of its input, and
+    the parameters of the stage (settings, standard, scheme, see stage_params)
+The key of an input that is itself a recorded artifact is its recorded key,
+otherwise (data files, or artifacts changed outside of this) it is the hash
+of its content
+Keys hence chain, the key of a dataset is the same whether built stage by
+stage or fused, and changing anything upstream changes the keys of
+everything downstream of it, and only that
+
+An artifact is up to date if it was recorded with the key it would be built
+with now and the file has not changed since (same size and mtime)
+
+Only changes to inputs and parameters are detected, not changes to the code
+Bump CACHE_VERSION (or delete the cache file) when stage outputs change
+'''
+
+from warnings import warn
+
+from pathlib import Path
+import hashlib
+import json
+import os
+
+from ..dataloaders import poreinfo
+from ..dataloaders.rawbinary import RawBinary
+
+from ..eventextraction.pipeline import Settings
+
+from .stages import STAGES, STAGES_IDX
+
+#%%
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_FILENAME = '.build_cache.json'
+
+HASH_BLOCK_SIZE = 2**24
+
+def hash_json(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True).encode()).hexdigest()
+
+def file_stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def stage_params(stage, path=None, f=None, settings=None, standard=None, scheme=None):
+    '''
+    Parameters that go into the key of the output of stage
+    path is the data file, and settings the path to the pipeline settings
+    json, for the event stage
+    '''
+    if stage == 'event':
+        settings = Settings.from_json_file(settings) # Parsed, formatting and comments do not matter
+        params = {'format': f, 'settings': settings.to_dict()}
+        if f == RawBinary.name:
+            # Layout is read from the sidecar, not the data file, a fixed scale or sampling rate must count
+            params['layout'] = RawBinary.Layout.from_json_file(RawBinary.sidecar_path(path)).to_dict()
+        return params
+    elif stage == 'rawsignal':
+        return {}
+    elif stage == 'stdsignal':
+        # Standards can use pore info, any change to the database counts
+        return {'standard': standard, 'pore_info': pore_info_hash()}
+    elif stage == 'dataset':
+        return {'scheme': scheme}
+    else:
+        raise ValueError(f'Invalid stage: {stage}')
+
+def stages_params(start, end, path=None, f=None, settings=None, standard=None, scheme=None):
+    # stage_params for every stage after start up to end, as chain_keys wants
+    params = {}
+    for stage in STAGES[STAGES_IDX[start]+1:STAGES_IDX[end]+1]:
+        params[stage] = stage_params(stage, path=path, f=f, settings=settings, standard=standard, scheme=scheme)
+    return params
+
+def pore_info_hash():
+    dic = {pore_id: info.to_dict() for pore_id, info in poreinfo.PORE_INFO_DICT.items()}
+    return hash_json(dic)
+
+#%%
+
+class BuildCache:
+    def __init__(self, path):
+        self._path = Path(path)
+        self.artifacts = {} # Absolute path: {stage, key, stat}
+        self.files = {} # Absolute path: {stat, sha256}, content hashes of inputs
+        if self._path.exists():
+            try:
+                with open(self._path, 'r') as f:
+                    dic = json.load(f)
+                if dic.get('version') == CACHE_VERSION:
+                    self.artifacts = dic['artifacts']
+                    self.files = dic['files']
+                else:
+                    warn(f'Build cache from different version, ignoring: {self._path}')
+            except Exception:
+                warn(f'Failed to read build cache, ignoring: {self._path}')
+
+    @property
+    def path(self):
+        return self._path
+
+    def save(self):
+        dic = {
+            'version': CACHE_VERSION,
+            'artifacts': self.artifacts,
+            'files': self.files
+            }
+        tmp_path = self._path.with_name(self._path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(dic, f, indent=1)
+        os.replace(tmp_path, self._path)
+
+    @staticmethod
+    def _key(path):
+        return str(Path(path).absolute())
+
+    def file_hash(self, path):
+        # Content hash, only read again if size or mtime changed
+        key = self._key(path)
+        stat = file_stat(path)
+        entry = self.files.get(key)
+        if entry is not None and entry['stat'] == stat:
+            return entry['sha256']
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(HASH_BLOCK_SIZE)
+                if not block:
+                    break
+                h.update(block)
+        sha256 = h.hexdigest()
+        self.files[key] = {'stat': stat, 'sha256': sha256}
+        return sha256
+
+    def recorded_key(self, path):
+        # Key of artifact as recorded, None if not recorded or changed since
+        entry = self.artifacts.get(self._key(path))
+        if entry is None:
+            return None
+        try:
+            if file_stat(path) != entry['stat']:
+                return None
+        except FileNotFoundError:
+            return None
+        return entry['key']
+
+    def input_key(self, path):
+        key = self.recorded_key(path)
+        if key is None:
+            key = self.file_hash(path)
+        return key
+
+    @staticmethod
+    def stage_key(stage, input_key, params):
+        return hash_json({
+            'version': CACHE_VERSION,
+            'stage': stage,
+            'input': input_key,
+            'params': params
+            })
+
+    def chain_keys(self, path, start, end, params):
+        '''
+        Keys of the outputs of every stage after start up to end, for input
+        path of the start stage
+        params is dict of stage: stage params, for those stages
+
+        Returns dict of stage: key
+        '''
+        key = self.input_key(path)
+        keys = {}
+        for stage in STAGES[STAGES_IDX[start]+1:STAGES_IDX[end]+1]:
+            key = self.stage_key(stage, key, params[stage])
+            keys[stage] = key
+        return keys
+
+    def is_up_to_date(self, path, key):
+        return key is not None and self.recorded_key(path) == key
+
+    def is_recorded(self, path):
+        return self._key(path) in self.artifacts
+
+    def record(self, path, stage, key):
+        self.artifacts[self._key(path)] = {
+            'stage': stage,
+            'key': key,
+            'stat': file_stat(path)
+            }
+
+    def forget(self, path):
+        self.artifacts.pop(self._key(path), None)
@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+'''
+In-process versions of the stage scripts
+(run_pipeline.py, events_to_signals.py, signals_to_std_signals.py, make_dataset.py)
+
+Each job does exactly what its script does, same steps and same exit codes,
+but returns a result dict instead of exiting:
+    path: input path
+    out: output path
+    retcode: exit code the script would have exited with, 0 on success
+    message: what failed, empty on success
+    traceback: of the exception behind the failure, empty if none
+    timings: seconds taken by each step that ran, e.g. load, process, save
+    total: seconds taken by the whole job
+
+fused_job instead runs several stages back to back in memory, e.g. data file
+straight to dataset, saving only the final output and optionally some of
+the intermediate ones
+
+These are meant to be run in a persistent worker pool, see make_worker_pool,
+so the heavy imports and the pore info database read are paid once per
+worker instead of once per file
+'''
+
+from warnings import warn
+
+from pathlib import Path
+import time
+import os
+import traceback
+import concurrent.futures
+
+from contextlib import contextmanager
+
+from ..dataloaders import DATALOADERS
+from ..dataloaders import poreinfo # Pore info database is read on import, i.e. once per worker
+
+from ..eventextraction.pipeline import EventExtractionPipeline, Settings
+from ..eventextraction.events import Events
+
+from ..signal.signal import Signals
+
+from ..featureeng.datasetio import make_dataset, gen_dataset_meta, save_dataset
+
+#%%
+
+class JobFailed(Exception):
+    def __init__(self, retcode, message):
+        super().__init__(message)
+        self.retcode = retcode
+        self.message = message
+
+@contextmanager
+def job(path, out):
+    result = {
+        'path': str(path),
+        'out': str(out),
+        'retcode': None,
+        'message': '',
+        'traceback': '',
+        'timings': {},
+        'total': None
+        }
+    t0 = time.perf_counter()
+    try:
+        yield result
+        result['retcode'] = 0
+    except JobFailed as e:
+        result['retcode'] = e.retcode
+        result['message'] = e.message
+        if e.__cause__ is not None: # Workers cannot send the exception itself back
+            result['traceback'] = ''.join(traceback.format_exception(e.__cause__))
+    finally:
+        result['total'] = time.perf_counter() - t0
+
+@contextmanager
+def timed(result, step):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        result['timings'][step] = result['timings'].get(step, 0) + time.perf_counter() - t0
+
+def step(retcode, message, func, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    except Exception as e:
+        raise JobFailed(retcode, message) from e
+
+def check_out_path(out_path, overwrite):
+    if out_path.is_dir():
+        raise JobFailed(1, 'Invalid output destination (must not be a directory)')
+    if out_path.exists() and not overwrite:
+        raise JobFailed(1, 'Existing file at output destination and overwrite not set')
+
+def save_with_retries(save, max_attempts_retcode, other_retcode, message,
+                      base_delay=15, max_attempts=3):
+    # Same as the stage scripts, retry on file locked etc., fail on anything else
+    attempt = 1
+    while True:
+        try:
+            save()
+            return
+        except Exception as e:
+            if isinstance(e, (BlockingIOError, PermissionError)):
+                if attempt > max_attempts:
+                    raise JobFailed(max_attempts_retcode, 'Failed to save file and max attempts exceeded') from e
+                time.sleep(base_delay * attempt)
+                attempt += 1
+            else:
+                raise JobFailed(other_retcode, message) from e
+
+def replace_suffixes(path, old_suffixes, new_suffix):
+    for old_suffix in old_suffixes:
+        if path.name.endswith(old_suffix):
+            return path.with_name(path.name[:-len(old_suffix)] + new_suffix)
+    return path.with_suffix(path.suffix + new_suffix)
+
+def with_suffixes(path, suffix):
+    # e.g. suffix='.events.npz', as the scripts do for --out
+    if ''.join(path.suffixes[-2:]) != suffix:
+        return path.with_suffix(path.suffix + suffix)
+    return path
+
+def find_settings(path, settings=None):
+    if settings is not None:
+        settings_path = Path(settings)
+    else:
+        settings_path = path.with_suffix('.json')
+    if not settings_path.is_file():
+        raise JobFailed(1, 'Settings file not found')
+    return settings_path
+
+#%%
+# The stages themselves, shared by the single stage jobs and fused_job
+
+def load_data(f, path, settings_path):
+    settings = step(3, 'Failed to load or parse settings file', Settings.from_json_file, settings_path)
+    step(4, 'Settings file invalid', settings.check_valid)
+    data = step(5, 'Failed to load data', DATALOADERS[f], path)
+    trace = step(101, 'Failed to convert loaded data to trace', data.to_trace)
+    return trace, settings
+
+def extract_events(trace, settings):
+    pipeline = step(102, 'Failed to initialize pipeline', EventExtractionPipeline, trace, settings)
+    step(103, 'Pipeline run failed', pipeline.run, preserve_orig=False) # Loaded trace is not used again
+    events = pipeline.events
+    if events is None:
+        raise JobFailed(104, 'Error in event extractor')
+    return events
+
+def extract_signals(events):
+    return step(101, 'Failed to extract signals from events', events.to_signals)
+
+def standardize_signals(signals, standard):
+    if signals.standard != 'raw':
+        raise JobFailed(4, 'Signals are not raw')
+    step(5, 'Failed to standardize signals', signals.standardize, standard) # Most likely cause: Missing pore info
+    return signals
+
+def make_dataset_from_signals(signals, scheme):
+    if signals.standard is None:
+        warn('Signal standardization status and standard unknown')
+    if signals.standard == 'raw':
+        warn('Signals are raw')
+    meta = step(101, 'Error generating meta from signals', gen_dataset_meta, signals)
+    X, y = step(4, 'Failed to make dataset', make_dataset, signals, scheme)
+    return X, y, meta
+
+def save_events(events, out_path, max_attempts_retcode=6):
+    save_with_retries(
+        lambda: events.save(out_path, overwrite=True),
+        max_attempts_retcode, 105, 'Non-OS error saving events'
+        )
+
+def save_signals(signals, out_path, max_attempts_retcode):
+    save_with_retries(
+        lambda: signals.save(out_path, overwrite=True),
+        max_attempts_retcode, 102, 'Non-OS error saving signals'
+        )
+
+def save_dataset_(dataset, out_path, scheme, standard, max_attempts_retcode=5):
+    X, y, meta = dataset
+    save_with_retries(
+        lambda: save_dataset(
+            out_path,
+            X, y,
+            scheme=scheme,
+            standard=standard,
+            meta=meta,
+            overwrite=True
+            ),
+        max_attempts_retcode, 102, 'Non-OS error saving datset'
+        )
+
+#%%
+
+def run_pipeline_job(f, path, settings=None, o=None, overwrite=False):
+    path = Path(path)
+    if o is not None:
+        out_path = with_suffixes(Path(o), '.events.npz')
+    else:
+        out_path = path.with_suffix('.events.npz')
+
+    with job(path, out_path) as result:
+        if not path.exists():
+            raise JobFailed(1, 'Data not found')
+        settings_path = find_settings(path, settings)
+        check_out_path(out_path, overwrite)
+
+        with timed(result, 'load'):
+            trace, settings = load_data(f, path, settings_path)
+
+        with timed(result, 'process'):
+            events = extract_events(trace, settings)
+
+        with timed(result, 'save'):
+            save_events(events, out_path)
+
+    return result
+
+def events_to_signals_job(path, o=None, overwrite=False):
+    path = Path(path)
+    if o is not None:
+        out_path = with_suffixes(Path(o), '.rawsignals.npz')
+    else:
+        out_path = replace_suffixes(path, ['.events.npz'], '.rawsignals.npz')
+
+    with job(path, out_path) as result:
+        if not path.exists():
+            raise JobFailed(1, 'Events file not found')
+        check_out_path(out_path, overwrite)
+
+        with timed(result, 'load'):
+            events = step(3, 'Failed to load from events file', Events.load, path)
+
+        with timed(result, 'process'):
+            signals = extract_signals(events)
+
+        with timed(result, 'save'):
+            save_signals(signals, out_path, 4)
+
+    return result
+
+def signals_to_std_signals_job(path, o=None, standard=None, overwrite=False):
+    assert standard is not None
+
+    path = Path(path)
+    if o is not None:
+        out_path = with_suffixes(Path(o), '.stdsignals.npz')
+    else:
+        out_path = replace_suffixes(path, ['.rawsignals.npz', '.signals.npz'], '.stdsignals.npz')
+
+    with job(path, out_path) as result:
+        if not path.exists():
+            raise JobFailed(1, 'Signals file not found')
+        check_out_path(out_path, overwrite)
+
+        with timed(result, 'load'):
+            signals = step(3, 'Failed to load from signals file', Signals.load, path)
+
+        with timed(result, 'process'):
+            standardize_signals(signals, standard)
+
+        with timed(result, 'save'):
+            save_signals(signals, out_path, 6)
+
+    return result
+
+def make_dataset_job(path, o=None, scheme=None, overwrite=False):
+    assert scheme is not None
+
+    path = Path(path)
+    if o is not None:
+        out_path = with_suffixes(Path(o), '.dataset.npz')
+    else:
+        out_path = replace_suffixes(path, ['.stdsignals.npz', '.rawsignals.npz', '.signals.npz'], '.dataset.npz')
+
+    with job(path, out_path) as result:
+        if not path.exists():
+            raise JobFailed(1, 'Signals file not found')
+        check_out_path(out_path, overwrite)
+
+        with timed(result, 'load'):
+            signals = step(3, 'Failed to load from signals file', Signals.load, path)
+
+        with timed(result, 'process'):
+            dataset = make_dataset_from_signals(signals, scheme)
+
+        with timed(result, 'save'):
+            save_dataset_(dataset, out_path, scheme, signals.standard)
+
+    return result
+
+#%%
+# Fused, several stages in one job with everything carried in memory
+# Saves only the final output, and whichever intermediate stages are in keep
+
+STAGES = ['data', 'event', 'rawsignal', 'stdsignal', 'dataset']
+STAGES_IDX = {stage: i for i, stage in enumerate(STAGES)}
+STAGE_SUFFIXES = {
+    'event': ['.events.npz'],
+    'rawsignal': ['.rawsignals.npz', '.signals.npz'],
+    'stdsignal': ['.stdsignals.npz'],
+    'dataset': ['.dataset.npz']
+    }
+
+def stage_out_path(path, stage):
+    # Default output paths for fused_job, same as what run_process.py uses
+    # Data files get their suffix replaced, stage outputs their stage suffix
+    path = Path(path)
+    for suffixes in STAGE_SUFFIXES.values():
+        for suffix in suffixes:
+            if path.name.endswith(suffix):
+                return path.with_name(path.name[:-len(suffix)] + STAGE_SUFFIXES[stage][0])
+    return path.with_suffix(STAGE_SUFFIXES[stage][0])
+
+def fused_job(path, o=None, settings=None, start='data', end='dataset',
+              f=None, standard=None, scheme=None, keep=(), overwrite=False):
+    '''
+    Takes path, a file of the start stage, all the way to the end stage in
+    one go, e.g. data file to dataset, without saving and reloading in between
+
+    o is the final output path, defaults to where the stage scripts would put it
+    keep is any of the stages in between to also save, at their default paths
+    f and settings are for starting from data, standard and scheme are
+    needed if passing through those stages
+
+    Result timings are per stage, plus load and save
+    Result has an extra field, saved, the paths of everything saved in stage order
+    '''
+    if start not in STAGES[:-1] or end not in STAGES[1:]:
+        raise ValueError(f'Invalid stages: {start}, {end}')
+    stages = STAGES[STAGES_IDX[start]+1:STAGES_IDX[end]+1] # Stages to produce
+    if len(stages) == 0:
+        raise ValueError(f'End stage must be after start stage: {start}, {end}')
+    for stage in keep:
+        if stage not in stages[:-1]:
+            raise ValueError(f'Not an intermediate stage: {stage}')
+    if 'data' == start and f is None:
+        raise ValueError('Data format must be specified')
+    if 'stdsignal' in stages and standard is None:
+        raise ValueError('Standard must be specified')
+    if 'dataset' in stages and scheme is None:
+        raise ValueError('Scheme must be specified')
+
+    path = Path(path)
+    if o is not None:
+        out_path = with_suffixes(Path(o), STAGE_SUFFIXES[end][0])
+    else:
+        out_path = stage_out_path(path, end)
+    out_paths = {stage: stage_out_path(path, stage) for stage in keep}
+    out_paths[end] = out_path
+
+    with job(path, out_path) as result:
+        result['saved'] = []
+
+        if not path.exists():
+            raise JobFailed(1, 'Input file not found')
+        if start == 'data':
+            settings_path = find_settings(path, settings)
+        for stage_out_path_ in out_paths.values():
+            check_out_path(stage_out_path_, overwrite)
+
+        with timed(result, 'load'):
+            if start == 'data':
+                trace, settings = load_data(f, path, settings_path)
+            elif start == 'event':
+                events = step(3, 'Failed to load from events file', Events.load, path)
+            else:
+                signals = step(3, 'Failed to load from signals file', Signals.load, path)
+
+        for stage in stages:
+            with timed(result, stage):
+                if stage == 'event':
+                    events = extract_events(trace, settings)
+                elif stage == 'rawsignal':
+                    signals = extract_signals(events)
+                elif stage == 'stdsignal':
+                    standardize_signals(signals, standard)
+                else:
+                    dataset = make_dataset_from_signals(signals, scheme)
+
+            if stage not in out_paths:
+                continue
+            with timed(result, 'save'):
+                if stage == 'event':
+                    save_events(events, out_paths[stage])
+                elif stage == 'dataset':
+                    save_dataset_(dataset, out_paths[stage], scheme, signals.standard)
+                elif stage == 'rawsignal':
+                    save_signals(signals, out_paths[stage], 4) # Same exit codes as the stage scripts
+                else:
+                    save_signals(signals, out_paths[stage], 6)
+            result['saved'].append(str(out_paths[stage]))
+
+    return result
+
+#%%
+
+def make_worker_pool(max_workers=None):
+    '''
+    Persistent pool of worker processes for the *_job functions above
+
+    Reuse the same pool for every stage, workers stay alive between jobs
+    Workers import this module (and so all of nanoporemlv2) on their first job
+    '''
+    if max_workers is None:
+        max_workers = max(1, os.cpu_count()//2)
+    return concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
@@ -17,7 +17,7 @@ from ..utils import npztools
 
 from ..dataloaders.common import Trace, Info
 
-from .standards import STANDARDS, check_standard
+from .standards import STANDARDS, check_standard, standardize_batch
 
 #%%
 # This class needs to be relatively high performance
@@ -31,6 +31,16 @@ class Signal:
         self.trace_info = trace_info
         self._standard = None
 
+    @classmethod
+    def _init_nocheck(cls, values, trace_info, standard):
+        # For many signals at once, e.g. views into one buffer checked all at once
+        signal = cls.__new__(cls)
+        signal._values = values
+        signal._trace_info = trace_info
+        signal._standardized_values = None
+        signal._standard = standard
+        return signal
+
     @property
     def standard(self):
         return self._standard
@@ -102,6 +112,17 @@ class Signal:
 
 #%%
 
+SIGNALS_FORMATS = ['legacy', 'ragged']
+DEFAULT_SIGNALS_FORMAT = 'ragged'
+
+# legacy:
+#   One arr_N member per signal
+# ragged:
+#   values member, all signals concatenated
+#   offsets member, signal i is values[offsets[i]:offsets[i+1]]
+#   format.txt member saying "ragged"
+# Both have standard.txt, trace_info.json and meta.json
+
 class Signals(UserList):
     def __init__(self, signals):
         for signal in signals:
@@ -115,6 +136,55 @@ class Signals(UserList):
         self._extracted_from = None
         self._set_standard = None
 
+    @classmethod
+    def _init_nocheck(cls, signals):
+        new_signals = cls([])
+        new_signals.data = signals
+        return new_signals
+
+    @classmethod
+    def from_ragged(cls, values, offsets, trace_info, standard):
+        '''
+        Signals as zero-copy views into one flat values array
+        Signal i is values[offsets[i]:offsets[i+1]]
+        '''
+        values = np.asarray(values)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if values.ndim != 1 or values.dtype.kind not in 'if':
+            raise ValueError(f'Values not a 1D numeric array: {values.shape}, {values.dtype}')
+        if offsets.ndim != 1 or len(offsets) == 0 or offsets[0] != 0 or offsets[-1] != len(values):
+            raise ValueError('Offsets do not span the values')
+        if np.any(np.diff(offsets) <= 0):
+            raise ValueError('Empty or negative length signal')
+        if trace_info is not None and not isinstance(trace_info, Info):
+            raise ValueError(f'Not an Info object: {trace_info}')
+        signals = [
+            Signal._init_nocheck(values[start:end], trace_info, standard) \
+            for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())
+            ]
+        return cls._init_nocheck(signals)
+
+    def to_ragged(self):
+        '''
+        Values of all signals concatenated, and offsets of each in them, as
+        from_ragged takes
+        Always a copy, even if the signals are views into one buffer already
+        '''
+        lengths = np.array([len(signal) for signal in self.signals], dtype=np.int64)
+        offsets = np.zeros(len(lengths)+1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        if len(self.signals) == 0:
+            values = np.array([], dtype=np.float64)
+        else:
+            values = np.concatenate([signal.values for signal in self.signals])
+        return values, offsets
+
+    def pack(self):
+        # Move the values of all signals into one buffer, signals become views into it
+        values, offsets = self.to_ragged()
+        for signal, start, end in zip(self.signals, offsets[:-1].tolist(), offsets[1:].tolist()):
+            signal._values = values[start:end]
+
     @property
     def signals(self):
         return self.data
@@ -154,8 +224,9 @@ class Signals(UserList):
     def check_consistent(self):
         ref_trace_info_dic = self.trace_info.to_dict()
         ref_standard = self.standard
+        ref_trace_info = self.trace_info
         for signal in self.signals:
-            if signal.trace_info.to_dict() != ref_trace_info_dic:
+            if signal.trace_info is not ref_trace_info and signal.trace_info.to_dict() != ref_trace_info_dic:
                 raise ValueError(f'Inconsistent signal: {signal}')
             if signal.standard != ref_standard:
                 raise ValueError(f'Inconsistent standard: {signal}, {signal.standard}')
@@ -166,9 +237,20 @@ class Signals(UserList):
             new_signals[i] = new_signals[i].copy()
         return new_signals
 
-    def _standardize(self, standard):
-        for signal in self.signals:
-            Signal._standardize_nocheckraw(signal, standard)
+    def _standardize(self, standard, batch=True):
+        # Batch standardizes a copy of all values at once, signals become views into it
+        # Like the per signal standards, the original values arrays are not touched
+        if batch:
+            values, offsets = self.to_ragged()
+            batch = values.dtype.kind == 'f' # Integer values cannot be done in place
+        if batch:
+            standardize_batch(values, self.trace_info, standard)
+            for signal, start, end in zip(self.signals, offsets[:-1].tolist(), offsets[1:].tolist()):
+                signal._values = values[start:end]
+                signal._standard = standard
+        else:
+            for signal in self.signals:
+                Signal._standardize_nocheckraw(signal, standard)
         self._set_standard = standard
 
     def _pre_standardize_checks(self):
@@ -176,10 +258,10 @@ class Signals(UserList):
             raise ValueError(f'Cannot standardize non-raw signals')
         self.check_consistent()
 
-    def standardize(self, standard):
+    def standardize(self, standard, batch=True):
         check_standard(standard)
         self._pre_standardize_checks()
-        self._standardize(standard)
+        self._standardize(standard, batch=batch)
 
     def standardized(self, standard):
         check_standard(standard)
@@ -254,9 +336,14 @@ class Signals(UserList):
         return dic
 
     @staticmethod
-    def save_(path, signals, overwrite=False):
+    def save_(path, signals, overwrite=False, fmt=None):
         path = Path(path)
 
+        if fmt is None:
+            fmt = DEFAULT_SIGNALS_FORMAT
+        if fmt not in SIGNALS_FORMATS:
+            raise ValueError(f'Invalid signals format: {fmt}; Valid formats are {SIGNALS_FORMATS}')
+
         standard = signals.standard
         assert isinstance(standard, str)
 
@@ -280,11 +367,21 @@ class Signals(UserList):
         if overwrite:
             mode = 'wb'
 
-        arrs = [signal.values for signal in signals.signals]
-        with open(path, mode) as f:
-            np.savez_compressed(f, *arrs)
+        if fmt == 'ragged':
+            values, offsets = signals.to_ragged()
+            with open(path, mode) as f:
+                np.savez_compressed(f, values=values, offsets=offsets)
+        else:
+            arrs = [signal.values for signal in signals.signals]
+            with open(path, mode) as f:
+                np.savez_compressed(f, *arrs)
 
         with ZipFile(path, 'a') as zf:
+            if fmt == 'ragged':
+                zf.writestr(
+                    'format.txt',
+                    fmt
+                    )
             zf.writestr(
                 'standard.txt',
                 signals.standard
@@ -298,8 +395,8 @@ class Signals(UserList):
                 json.dumps(meta, indent=2)
                 )
 
-    def save(self, path, overwrite=False):
-        self.__class__.save_(path, self, overwrite=overwrite)
+    def save(self, path, overwrite=False, fmt=None):
+        self.__class__.save_(path, self, overwrite=overwrite, fmt=fmt)
 
     @classmethod
     def load(cls, path):
@@ -319,14 +416,24 @@ class Signals(UserList):
         if standard not in STANDARDS.keys():
             warn(f'Unrecognized standard: {standard}')
 
-        arr_names = npztools.get_arr_filenames(npzf)
-        signals = []
-        for arr_name in arr_names:
-            signal = Signal(npzf[arr_name], trace_info=trace_info)
-            signal._standard = standard
-            signals.append(signal)
+        if 'format.txt' in npzf.files:
+            fmt = npztools.readstr(npzf, 'format.txt')
+        else:
+            fmt = 'legacy'
+        if fmt not in SIGNALS_FORMATS:
+            raise ValueError(f'Unrecognized signals format: {fmt}')
+
+        if fmt == 'ragged':
+            signals = cls.from_ragged(npzf['values'], npzf['offsets'], trace_info, standard)
+        else:
+            arr_names = npztools.get_arr_filenames(npzf)
+            signals = []
+            for arr_name in arr_names:
+                signal = Signal(npzf[arr_name], trace_info=trace_info)
+                signal._standard = standard
+                signals.append(signal)
+            signals = cls(signals)
 
-        signals = cls(signals)
         signals._loaded_from = path
         signals._loaded_meta = meta
         signals._loaded_standard = standard
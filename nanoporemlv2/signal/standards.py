@@ -29,6 +29,33 @@ NONRAW_STANDARDS = {
     }
 STANDARDS.update(NONRAW_STANDARDS)
 
+#%%
+
+# Batch versions, on the values of many signals sharing one trace info at
+# once, e.g. a ragged buffer from Signals.to_ragged
+# Modify values (float) in place, same results as the per signal versions
+
+def root_G0_dG_nS_batch(values, trace_info):
+    # Multiply then divide separately, as the per signal version does, for identical results
+    values *= trace_info.pore_info.open_pore_conductance
+    values /= trace_info.signed_voltage
+    # copysign keeps the sign like the negs mask of the per signal version
+    magnitudes = np.abs(values)
+    np.sqrt(magnitudes, out=magnitudes)
+    np.copysign(magnitudes, values, out=values)
+
+BATCH_STANDARDS = {
+    'raw': lambda values, trace_info: nop(),
+    'root_G0_dG_nS': root_G0_dG_nS_batch
+    }
+
+def standardize_batch(values, trace_info, standard):
+    if standard not in BATCH_STANDARDS:
+        raise ValueError(f'Invalid standard: {standard}; Valid standards are {list(BATCH_STANDARDS.keys())}')
+    if not isinstance(values, np.ndarray) or values.dtype.kind != 'f':
+        raise ValueError(f'Values not a float array: {type(values)}')
+    BATCH_STANDARDS[standard](values, trace_info)
+
 
 def check_standard(standard):
     if standard not in STANDARDS:
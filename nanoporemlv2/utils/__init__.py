@@ -1,3 +1,3 @@
 #
 
-__all__ = ["convenience", "casting", "validators", "paramcontainer", "npztools"]
+__all__ = ["convenience", "casting", "validators", "paramcontainer", "npztools", "benchmarking"]
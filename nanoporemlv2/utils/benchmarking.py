@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+'''
+Shared by the benchmark_*.py scripts and check_parity.py
+
+Parity checks are functions without arguments asserting that a fast path
+gives the same results as the one it replaces, on fixed inputs, so whether
+they pass never depends on what a benchmark is run with
+'''
+
+import tracemalloc
+import time
+
+import numpy as np
+
+from ..dataloaders.common import Info
+from ..dataloaders.poreinfo import PORE_INFO_DICT
+from ..dataloaders.synthetic import SyntheticTrace
+from ..signal.signal import Signal, Signals
+
+#%%
+
+def measure(func, *args, repeats=1, memory=False):
+    '''
+    Best of repeats wall time of func(*args)
+    With memory, also peak memory allocated on top of what was already
+    allocated, from one extra run under tracemalloc (which slows down
+    allocation heavy code, so it is not timed), else peak is None
+    Returns result of the last run, time, peak
+    '''
+    peak = None
+    if memory:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak -= before
+    best = None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        ret = func(*args)
+        dt = time.perf_counter() - t0
+        if best is None or dt < best:
+            best = dt
+    return ret, best, peak
+
+#%%
+
+# Cleaners of the synthetic pipeline benchmarks, in order
+# Filtering spreads nan, so mask after
+PIPELINE_CLEANERS = ['lowpassfilter', 'zapmasker']
+
+def synthetic_params(**kwargs):
+    # SyntheticTrace.Params with trace info complete enough to save events, any valid values do
+    kwargs.setdefault('label', 'DNA')
+    kwargs.setdefault('signed_voltage', 0.2)
+    kwargs.setdefault('pore_id', next(iter(PORE_INFO_DICT)))
+    return SyntheticTrace.Params(**kwargs)
+
+def gen_signals(count, min_len, max_len, seed=0, quantize=False):
+    '''
+    Raw signals as from events, noisy pulses of random width and height,
+    mostly positive with noise dipping below 0
+    One array per signal, as loaded from legacy files or extracted one by one
+    With quantize, every other signal is rounded, for plateaus and tied peaks
+    '''
+    rng = np.random.default_rng(seed)
+    params = synthetic_params()
+    info = Info(
+        sampling_rate=params.sampling_rate,
+        label=params.label,
+        signed_voltage=params.signed_voltage,
+        pore_id=params.pore_id
+        )
+    signals = []
+    for i in range(count):
+        n = int(rng.integers(min_len, max_len+1))
+        values = rng.uniform(0.1, 2) * np.sin(np.linspace(0, np.pi, n)) + rng.normal(0, 0.1, n)
+        if quantize and i % 2 == 1:
+            values = np.round(values * 10) / 10
+        signal = Signal(values, trace_info=info)
+        signal._standard = 'raw'
+        signals.append(signal)
+    return Signals(signals)
+
+#%%
+
+def print_header(script, args=None):
+    print(f'========== {script} ==========')
+    print(f'Started at time: {time.asctime(time.localtime())}')
+    if args is not None:
+        print(f'Arguments: {args}')
+    print()
+
+def run_checks(checks):
+    '''
+    Runs every parity check, reporting each
+    Returns whether all passed
+    '''
+    passed = True
+    for check in checks:
+        try:
+            check()
+        except AssertionError as e:
+            passed = False
+            print(f'FAIL {check.__name__}: {e}')
+        else:
+            print(f'PASS {check.__name__}')
+    return passed
@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import struct
+
+import numpy as np
+
 def get_arr_filenames(npzf):
     arr_filenames = []
     for filename in npzf.files:
@@ -7,7 +11,7 @@ def get_arr_filenames(npzf):
             arr_filenames.append(filename)
     return arr_filenames
 
-from zipfile import ZipFile
+from zipfile import ZipFile, ZIP_STORED
 def writestr(npz_path, filename, string):
     if filename[:-4] == '.npy' or filename[:4] == 'arr_':
         raise ValueError('Illegal filename - cannot start with "arr_" or end with ".npy"')
@@ -27,3 +31,69 @@ def gen_csv_str(table):
         csv_str += ','.join([str(ele) for ele in row])
         csv_str += '\n'
     return csv_str
+
+#%%
+
+ZIP_LOCAL_HEADER_SIZE = 30
+
+def _member_data_offset(f, info):
+    # Where the member's data starts in the zip file, after its local header
+    # (whose extra field can differ from the central directory's)
+    f.seek(info.header_offset)
+    header = f.read(ZIP_LOCAL_HEADER_SIZE)
+    name_len, extra_len = struct.unpack('<HH', header[26:30])
+    return info.header_offset + ZIP_LOCAL_HEADER_SIZE + name_len + extra_len
+
+def _read_npy_header(f):
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(f)
+    elif version == (2, 0):
+        return np.lib.format.read_array_header_2_0(f)
+    else:
+        raise ValueError(f'Unsupported npy format version: {version}')
+
+def read_npy_member_header(path, name):
+    '''
+    shape, fortran_order, dtype of npy member name (without .npy) of npz file
+    at path, and the offset of the array data in the file (None if the
+    member is compressed), without reading the array
+    '''
+    with ZipFile(path) as zf:
+        info = zf.getinfo(name + '.npy')
+        if info.compress_type != ZIP_STORED:
+            with zf.open(info) as f:
+                shape, fortran_order, dtype = _read_npy_header(f)
+            return shape, fortran_order, dtype, None
+    with open(path, 'rb') as f:
+        f.seek(_member_data_offset(f, info))
+        shape, fortran_order, dtype = _read_npy_header(f)
+        offset = f.tell()
+    return shape, fortran_order, dtype, offset
+
+def memmap_npy_member(path, name):
+    '''
+    Read-only memmap of npy member name (without .npy) of an uncompressed
+    (np.savez, not np.savez_compressed) npz file, nothing is read until used
+    Raises ValueError if the member is compressed or holds objects
+    '''
+    shape, fortran_order, dtype, offset = read_npy_member_header(path, name)
+    if offset is None:
+        raise ValueError(f'Compressed member cannot be memory-mapped: {name}')
+    if dtype.hasobject:
+        raise ValueError(f'Object array cannot be memory-mapped: {name}')
+    if np.prod(shape) == 0:
+        return np.zeros(shape, dtype=dtype) # mmap of nothing is an error
+    return np.memmap(
+        path,
+        dtype=dtype,
+        mode='r',
+        offset=offset,
+        shape=shape,
+        order='F' if fortran_order else 'C'
+        )
+
+def readstr_zip(path, filename):
+    # readstr without np.load, for reading text members only
+    with ZipFile(path) as zf:
+        return zf.read(filename).decode()
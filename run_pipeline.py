@@ -108,7 +108,7 @@ if __name__ == '__main__':
 
     print('Running pipeline...')
     try:
-        pipeline.run()
+        pipeline.run(preserve_orig=False) # Loaded trace is not used again
     except Exception:
         print('Pipeline run failed')
         sys.exit(103)
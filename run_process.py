@@ -10,6 +10,7 @@ import subprocess
 import concurrent.futures
 import logging
 import os
+import functools
 
 from nanoporemlv2.interactiveutils.input_funcs import input_1, input_1_safe
 
@@ -21,33 +22,163 @@ from nanoporemlv2.featureeng.datasetio import save_dataset, load_dataset
 
 from nanoporemlv2.mltools.datasettools import combine_datasets
 
+from nanoporemlv2.processing.stages import (
+    run_pipeline_job,
+    events_to_signals_job,
+    signals_to_std_signals_job,
+    make_dataset_job,
+    fused_job,
+    make_worker_pool,
+    stage_out_path,
+    STAGES, STAGES_IDX
+    )
+from nanoporemlv2.processing.cache import BuildCache, stages_params, DEFAULT_CACHE_FILENAME
+
 #%%
 
-def submit_tasks(executor,
-                 func,
-                 targets,
-                 *args,
-                 unpack_target=False,
-                 **kwargs):
+def iter_completed(executor,
+                   func,
+                   targets,
+                   *args,
+                   max_in_flight=None,
+                   unpack_target=False,
+                   **kwargs):
+    # Submits func for every target (the "iterable args", args are fixed),
+    # yielding (future, target) as each completes, but only keeps up to
+    # max_in_flight jobs submitted at once
+    # For sharing one big pool with stages that should run fewer jobs at a
+    # time, e.g. memory hungry ones
+    targets = iter(targets)
     futures = {}
-    for target in targets: # This is sequential/ordered!
+
+    def submit_next():
+        target = next(targets, None)
+        if target is None:
+            return
         if unpack_target:
             future = executor.submit(func, *target, *args, **kwargs)
         else:
             future = executor.submit(func, target, *args, **kwargs)
         futures[future] = target
-    # Note that 'targets' are the "iterable args" whereas 'args' are fixed args
-    # 'targets' is iterated over but 'args' is not
 
-    # Keys are futures, values are targets that were used, everything reads
-    # easier this way
-    # When using with .as_completed simply use the dict since that is
-    # equivalent to dict.keys() and hence same as all the futures
-    # Then to get the associated target just get the value with the future as
-    # key
-    return futures
+    if max_in_flight is None:
+        max_in_flight = float('inf')
+    elif max_in_flight < 1:
+        raise ValueError(f'Invalid max in flight: {max_in_flight}')
+    while len(futures) < max_in_flight:
+        n = len(futures)
+        submit_next()
+        if len(futures) == n:
+            break
+
+    while futures:
+        done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            target = futures.pop(future)
+            submit_next()
+            yield future, target
+
+MAX_WORKERS_SUGGESTED = max(1, int(os.cpu_count()//2))
+
+#%%
+
+BACKENDS = ['pool', 'subprocess']
+# pool: Jobs run in a persistent pool of worker processes (nanoporemlv2.processing.stages)
+#   Imports and pore info read once per worker, results come back with timings
+# subprocess: One fresh python per job running the stage script, only the exit code comes back
+#   Slower, but jobs are fully isolated and have timeouts
+
+def exec_subprocess_job(single_func, *args, **kwargs):
+    # Wraps a subprocess exec function to give the same result dict as the pool jobs
+    t0 = time.perf_counter()
+    retcode = single_func(*args, **kwargs)
+    return {
+        'retcode': retcode,
+        'message': '',
+        'traceback': '', # The script prints it
+        'timings': {},
+        'total': time.perf_counter() - t0
+        }
+
+def format_timings(result):
+    ret = f'{result["total"]:.1f}s'
+    if result['timings']:
+        ret += ' (' + ', '.join(f'{step} {t:.1f}s' for step, t in result['timings'].items()) + ')'
+    return ret
+
+def exec_multi(single_func, job_func, targets, *args, overwrite=False, max_workers=MAX_WORKERS_SUGGESTED, executor=None, path_idx=0):
+    '''
+    Runs a stage for all targets and logs how each went
+
+    With executor=None, each target is run as a subprocess using single_func,
+    max_workers at a time
+    Otherwise executor is the worker pool to run job_func on (see
+    nanoporemlv2.processing.stages.make_worker_pool), still with at most
+    max_workers jobs at a time
+
+    Returns list of result dicts (as in nanoporemlv2.processing.stages) in
+    order of completion, with the target added
+    '''
+    errors = 0
+    results = []
+
+    if executor is None:
+        own_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        completed = iter_completed(
+            own_executor,
 
-MAX_WORKERS_SUGGESTED = int(os.cpu_count()//2)
+            exec_subprocess_job,
+            [[single_func] + list(target) for target in targets],
+            *args,
+            unpack_target=True,
+            overwrite=overwrite
+
+            )
+    else:
+        own_executor = None
+        completed = iter_completed(
+            executor,
+
+            job_func,
+            targets,
+            *args,
+            max_in_flight=max_workers,
+            unpack_target=True,
+            overwrite=overwrite
+
+            )
+
+    try:
+        logging.info(f'Queueing {len(targets)} jobs')
+        for future, target in completed:
+            if executor is None:
+                target = target[1:]
+            path = target[path_idx]
+            logging_targetrepr = f'"{path}"'
+
+            try:
+                result = future.result()
+                result['target'] = [str(x) for x in target]
+                result.setdefault('path', str(path))
+                results.append(result)
+                retcode = result['retcode']
+                if retcode != 0:
+                    errors += 1
+                    message = f': {result["message"]}' if result['message'] else ''
+                    if result.get('traceback'):
+                        message += f'\n{result["traceback"].rstrip()}'
+                    logging.error(f'Job for {logging_targetrepr} failed with exit code {retcode}{message}')
+                else:
+                    logging.info(f'Job for {logging_targetrepr} completed without errors in {format_timings(result)}')
+            except Exception:
+                errors += 1
+                logging.exception(f'Job for {logging_targetrepr} timed out or other unexpected error')
+    finally:
+        if own_executor is not None:
+            own_executor.shutdown()
+
+    logging.info(f'All {len(targets)} jobs finished with errors on {errors} jobs')
+    return results
 
 #%%
 
@@ -76,40 +207,15 @@ def exec_run_pipeline_single(f, path, settings=None, o=None, overwrite=False):
         )
     return res.returncode
 
-def exec_run_pipeline_multi(targets, overwrite=False, max_workers=2):
-    errors = 0
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = submit_tasks(
-            executor,
-
-            exec_run_pipeline_single,
-            targets,
-            unpack_target=True,
-            overwrite=overwrite
-
-            )
-        logging.info(f'Successfully queued {len(targets)} jobs')
-        for future in concurrent.futures.as_completed(futures):
-            target = futures[future]
-
-            f, path, settings, out = target
-            logging_targetrepr = f'"{path}"'
-
-            try:
-                retcode = future.result()
-                if retcode != 0:
-                    errors += 1
-                    logging.exception(f'Job for {logging_targetrepr} failed with exit code {retcode}')
-                else:
-                    logging.info(f'Job for {logging_targetrepr} completed without errors')
-            except Exception:
-                errors += 1
-                logging.exception(f'Job for {logging_targetrepr} timed out or other unexpected error')
-    logging.info(f'All {len(targets)} jobs finished with errors on {errors} jobs')
-    if errors:
-        return 1
-    else:
-        return 0
+def exec_run_pipeline_multi(targets, overwrite=False, max_workers=2, executor=None):
+    return exec_multi(
+        exec_run_pipeline_single, run_pipeline_job,
+        targets,
+        overwrite=overwrite,
+        max_workers=max_workers,
+        executor=executor,
+        path_idx=1
+        )
 
 def exec_events_to_signals_single(path, o=None, overwrite=False):
     args = PYTHON + ['events_to_signals.py']
@@ -127,40 +233,14 @@ def exec_events_to_signals_single(path, o=None, overwrite=False):
         )
     return res.returncode
 
-def exec_events_to_signals_multi(targets, overwrite=False, max_workers=MAX_WORKERS_SUGGESTED):
-    errors = 0
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = submit_tasks(
-            executor,
-
-            exec_events_to_signals_single,
-            targets,
-            unpack_target=True,
-            overwrite=overwrite
-
-            )
-        logging.info(f'Successfully queued {len(targets)} jobs')
-        for future in concurrent.futures.as_completed(futures):
-            target = futures[future]
-
-            path, out = target
-            logging_targetrepr = f'"{path}"'
-
-            try:
-                retcode = future.result()
-                if retcode != 0:
-                    errors += 1
-                    logging.exception(f'Job for {logging_targetrepr} failed with exit code {retcode}')
-                else:
-                    logging.info(f'Job for {logging_targetrepr} completed without errors')
-            except Exception:
-                errors += 1
-                logging.exception(f'Job for {logging_targetrepr} timed out or other unexpected error')
-    logging.info(f'All {len(targets)} jobs finished with errors on {errors} jobs')
-    if errors:
-        return 1
-    else:
-        return 0
+def exec_events_to_signals_multi(targets, overwrite=False, max_workers=MAX_WORKERS_SUGGESTED, executor=None):
+    return exec_multi(
+        exec_events_to_signals_single, events_to_signals_job,
+        targets,
+        overwrite=overwrite,
+        max_workers=max_workers,
+        executor=executor
+        )
 
 def exec_signals_to_std_signels_single(path, o=None, standard=None, overwrite=False):
     args = PYTHON + ['signals_to_std_signals.py']
@@ -182,41 +262,15 @@ def exec_signals_to_std_signels_single(path, o=None, standard=None, overwrite=Fa
         )
     return res.returncode
 
-def exec_signals_to_std_signals_multi(targets, standard, overwrite=False, max_workers=MAX_WORKERS_SUGGESTED):
-    errors = 0
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = submit_tasks(
-            executor,
-
-            exec_signals_to_std_signels_single,
-            targets,
-            standard,
-            unpack_target=True,
-            overwrite=overwrite
-
-            )
-        logging.info(f'Successfully queued {len(targets)} jobs')
-        for future in concurrent.futures.as_completed(futures):
-            target = futures[future]
-
-            path, out = target
-            logging_targetrepr = f'"{path}"'
-
-            try:
-                retcode = future.result()
-                if retcode != 0:
-                    errors += 1
-                    logging.exception(f'Job for {logging_targetrepr} failed with exit code {retcode}')
-                else:
-                    logging.info(f'Job for {logging_targetrepr} completed without errors')
-            except Exception:
-                errors += 1
-                logging.exception(f'Job for {logging_targetrepr} timed out or other unexpected error')
-    logging.info(f'All {len(targets)} jobs finished with errors on {errors} jobs')
-    if errors:
-        return 1
-    else:
-        return 0
+def exec_signals_to_std_signals_multi(targets, standard, overwrite=False, max_workers=MAX_WORKERS_SUGGESTED, executor=None):
+    return exec_multi(
+        exec_signals_to_std_signels_single, signals_to_std_signals_job,
+        targets,
+        standard,
+        overwrite=overwrite,
+        max_workers=max_workers,
+        executor=executor
+        )
 
 def exec_make_dataset_single(path, o=None, scheme=None, overwrite=False):
     args = PYTHON + ['make_dataset.py']
@@ -238,46 +292,75 @@ def exec_make_dataset_single(path, o=None, scheme=None, overwrite=False):
         )
     return res.returncode
 
-def exec_make_dataset_multi(targets, scheme, overwrite=False, max_workers=MAX_WORKERS_SUGGESTED):
-    errors = 0
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = submit_tasks(
-            executor,
-
-            exec_make_dataset_single,
-            targets,
-            scheme,
-            unpack_target=True,
-            overwrite=overwrite
-
-            )
-        logging.info(f'Successfully queued {len(targets)} jobs')
-        for future in concurrent.futures.as_completed(futures):
-            target = futures[future]
-
-            path, out = target
-            logging_targetrepr = f'"{path}"'
+def exec_make_dataset_multi(targets, scheme, overwrite=False, max_workers=MAX_WORKERS_SUGGESTED, executor=None):
+    return exec_multi(
+        exec_make_dataset_single, make_dataset_job,
+        targets,
+        scheme,
+        overwrite=overwrite,
+        max_workers=max_workers,
+        executor=executor
+        )
 
-            try:
-                retcode = future.result()
-                if retcode != 0:
-                    errors += 1
-                    logging.exception(f'Job for {logging_targetrepr} failed with exit code {retcode}')
-                else:
-                    logging.info(f'Job for {logging_targetrepr} completed without errors')
-            except Exception:
-                errors += 1
-                logging.exception(f'Job for {logging_targetrepr} timed out or other unexpected error')
-    logging.info(f'All {len(targets)} jobs finished with errors on {errors} jobs')
-    if errors:
-        return 1
-    else:
-        return 0
+def exec_fused_multi(targets, start, end, f=None, standard=None, scheme=None, keep=(), overwrite=False, max_workers=MAX_WORKERS_SUGGESTED, executor=None):
+    # Targets as for the multi function of the start stage, pool backend only
+    if executor is None:
+        raise ValueError('Fused runs need a worker pool')
+    if start == 'data':
+        targets = [[path, out, settings] for _, path, settings, out in targets]
+    return exec_multi(
+        None,
+        functools.partial(fused_job, start=start, end=end, f=f, standard=standard, scheme=scheme, keep=keep),
+        targets,
+        overwrite=overwrite,
+        max_workers=max_workers,
+        executor=executor
+        )
 
 #%%
 
-STAGES = ['data', 'event', 'rawsignal', 'stdsignal', 'dataset']
-STAGES_IDX = {stage: i for i, stage in enumerate(STAGES)}
+def split_up_to_date(cache, targets, start, end, path_idx=0, f=None, standard=None, scheme=None, keep=()):
+    '''
+    For incremental runs, splits targets (as for the multi function of the
+    start stage, output path last) into those to build and those whose
+    outputs are all up to date according to cache
+
+    Returns the targets to build, the outputs that are up to date, and the
+    keys to record once built, dict of input path: {output path: (stage, key)}
+    '''
+    to_build = []
+    up_to_date = []
+    keys = {}
+    for target in targets:
+        path = target[path_idx]
+        settings = target[2] if start == 'data' else None
+        try:
+            params = stages_params(start, end, path=path, f=f, settings=settings, standard=standard, scheme=scheme)
+            chain = cache.chain_keys(path, start, end, params)
+        except Exception: # e.g. bad settings, let the job fail and report it
+            to_build.append(target)
+            continue
+
+        outs = {str(Path(target[-1]).absolute()): (end, chain[end])}
+        for stage in keep:
+            outs[str(stage_out_path(path, stage).absolute())] = (stage, chain[stage])
+
+        if all(cache.is_up_to_date(out_path, key) for out_path, (_, key) in outs.items()):
+            logging.info(f'Up to date, skipping "{path}"')
+            up_to_date.append(target[-1])
+            continue
+        keys[str(path)] = outs
+        to_build.append(target)
+    return to_build, up_to_date, keys
+
+def record_results(cache, results, keys):
+    for result in results:
+        if result['retcode'] != 0:
+            continue
+        for out_path, (stage, key) in keys.get(result['path'], {}).items():
+            if Path(out_path).exists():
+                cache.record(out_path, stage, key)
+    cache.save()
 
 #%%
 
@@ -290,6 +373,12 @@ if __name__ == '__main__':
     parser.add_argument("-f", "--format", choices=DATALOADERS.keys())
     parser.add_argument("--standard", choices=NONRAW_STANDARDS.keys())
     parser.add_argument("--scheme", choices=SCHEMES.keys())
+    parser.add_argument("--backend", choices=BACKENDS, default='pool')
+    parser.add_argument("-j", "--workers", type=int, default=MAX_WORKERS_SUGGESTED)
+    parser.add_argument("--fused", action='store_true')
+    parser.add_argument("--keep", nargs='+', choices=STAGES[1:-1], default=[])
+    parser.add_argument("-i", "--incremental", action='store_true')
+    parser.add_argument("--cache", type=Path)
     args = parser.parse_args()
 
     #%%
@@ -321,22 +410,94 @@ if __name__ == '__main__':
             print('Data format must be specified')
             sys.exit(1)
 
-    # if 'stdsignal' in stages:
-    #     if args.standard is None:
-    #         print('Signal standardization standard must be specified')
-    #         sys.exit(1)
-    ## Prompt later
-
-    # if 'dataset' in stages:
-    #     if args.scheme is None:
-    #         print('Scheme for making dataset must be specified')
-    #         sys.exit(1)
-    ## Prompt later
+    # Fused: All stages run in one job per file, in memory, only the end stage
+    # output is saved plus any intermediate stages in --keep
+    fused = args.fused
+    if fused:
+        if args.backend != 'pool':
+            print('Fused mode needs the pool backend')
+            sys.exit(1)
+        for stage in args.keep:
+            if stage not in STAGES[start_stage_idx+1:end_stage_idx]:
+                print(f'Cannot keep {stage}, not an intermediate stage')
+                sys.exit(1)
+        print(f'Fused, keeping: {args.keep}')
 
     print()
 
     #%%
 
+    if 'rawsignal' in stages:
+        if args.standard is None:
+            while True:
+                standard = input_nonraw_standard('Select standard')
+                if input_1_safe('Confirm standard selection?'):
+                    break
+        else:
+            standard = args.standard
+    else:
+        standard = None
+
+    if 'stdsignal' in stages:
+        if args.scheme is None:
+            while True:
+                scheme = input_scheme('Select scheme')
+                if input_1_safe('Confirm scheme selection?'):
+                    break
+        else:
+            scheme = args.scheme
+    else:
+        scheme = None
+
+    # Incremental: Outputs whose inputs and parameters have not changed since
+    # they were last built are skipped (but still carried on to the next stage),
+    # outputs that were built before but are out of date are overwritten
+    # without asking
+    if args.incremental:
+        if args.cache is not None:
+            cache_path = args.cache
+        elif args.path.is_dir():
+            cache_path = args.path / DEFAULT_CACHE_FILENAME
+        else:
+            cache_path = args.path.parent / DEFAULT_CACHE_FILENAME
+        cache = BuildCache(cache_path)
+        print(f'Incremental, build cache: {cache_path}')
+    else:
+        cache = None
+
+    # Output path of the first stage, or of the end stage if fused
+    def first_out_path(path, stage):
+        if fused:
+            return stage_out_path(path, end)
+        return stage_out_path(path, stage)
+
+    def split_targets(targets_, stage_from, path_idx=0):
+        stage_to = end if fused else STAGES[STAGES_IDX[stage_from]+1]
+        if cache is None:
+            return targets_, [], {}
+        return split_up_to_date(
+            cache, targets_, stage_from, stage_to, path_idx=path_idx,
+            f=args.format, standard=standard, scheme=scheme,
+            keep=args.keep if fused else ()
+            )
+
+    def ask_overwrite(path, out_path):
+        if not out_path.exists():
+            return True
+        if cache is not None and cache.is_recorded(out_path):
+            return True # Built by us before and now out of date
+        return input_1_safe(f'Output destination for "{path}", "{out_path}" exists. Overwrite?')
+
+    def run_fused(targets):
+        print(f'Starting fused {start} -> {end} run')
+        max_workers_ = min(2, max_workers) if start == 'data' else max_workers
+        results = exec_fused_multi(targets, start, end, args.format, standard, scheme, args.keep, overwrite=True, max_workers=max_workers_, executor=executor)
+        print(f'Run finished, now in {end} stage')
+        print()
+        return results
+
+    #%%
+
     # Only use basic logging
     handlers = [logging.StreamHandler(sys.stdout)]
     logging_fmt = \
@@ -349,6 +510,16 @@ if __name__ == '__main__':
 
     #%%
 
+    if args.backend == 'pool':
+        executor = make_worker_pool(max_workers=args.workers)
+        logging.info(f'Using worker pool with {args.workers} workers')
+    else:
+        executor = None
+        logging.info('Using one subprocess per job')
+    max_workers = args.workers
+
+    #%%
+
     if 'data' in stages:
         Fmt = DATALOADERS[args.format]
         if args.scan:
@@ -394,14 +565,15 @@ if __name__ == '__main__':
         targets_ = []
         for path in nonsets:
             settings_path = path.with_suffix('.json')
-            out_path = path.with_suffix('.events.npz')
+            out_path = first_out_path(path, 'event')
             targets_.append([args.format, path, settings_path, out_path])
         for path in sets:
             members = Fmt.set_members(path)
             settings_path = path.with_suffix('.json')
             for member in members:
-                out_path = member.with_suffix('.events.npz')
+                out_path = first_out_path(member, 'event')
                 targets_.append([args.format, member, settings_path, out_path])
+        targets_, up_to_date, keys = split_targets(targets_, 'data', path_idx=1)
 
         while True:
             targets = []
@@ -409,26 +581,30 @@ if __name__ == '__main__':
             for target in targets_:
                 path = target[1]
                 out_path = target[3]
-                if out_path.exists():
-                    if not input_1_safe(f'Output destination for "{path}", "{out_path}" exists. Overwrite?'):
-                        nooverwrites.append(out_path)
-                        continue
+                if not ask_overwrite(path, out_path):
+                    nooverwrites.append(out_path)
+                    continue
                 targets.append(target)
             print()
             if input_1_safe('Final confirm targets?'):
                 print()
                 break
 
-        print('Starting data -> event run')
-        exec_run_pipeline_multi(targets, overwrite=True)
-        print('Run finished, now in event stage')
+        if fused:
+            results = run_fused(targets)
+        else:
+            print('Starting data -> event run')
+            results = exec_run_pipeline_multi(targets, overwrite=True, max_workers=min(2, max_workers), executor=executor)
+            print('Run finished, now in event stage')
+        if cache is not None:
+            record_results(cache, results, keys)
         print()
 
     #%%
 
-    if 'event' in stages:
-        if 'data' in stages:
-            prev_outs = [target[3] for target in targets]
+    if 'event' in stages and not (fused and start != 'event'):
+        if 'data' in stages and not fused:
+            prev_outs = [target[3] for target in targets] + up_to_date
             prev_nooverwrites = nooverwrites
 
             carried = prev_outs
@@ -465,8 +641,9 @@ if __name__ == '__main__':
 
         targets_ = []
         for path in events:
-            out_path = path.with_name(path.name[:-len('.events.npz')]+'.rawsignals.npz')
+            out_path = first_out_path(path, 'rawsignal')
             targets_.append([path, out_path])
+        targets_, up_to_date, keys = split_targets(targets_, 'event')
 
         while True:
             targets = []
@@ -474,34 +651,30 @@ if __name__ == '__main__':
             for target in targets_:
                 path = target[0]
                 out_path = target[1]
-                if out_path.exists():
-                    if not input_1_safe(f'Output destination for "{path}", "{out_path}" exists. Overwrite?'):
-                        nooverwrites.append(out_path)
-                        continue
+                if not ask_overwrite(path, out_path):
+                    nooverwrites.append(out_path)
+                    continue
                 targets.append(target)
             print()
             if input_1_safe('Final confirm targets?'):
                 print()
                 break
 
-        print('Starting event -> rawsignal run')
-        exec_events_to_signals_multi(targets, overwrite=True)
-        print('Run finished, now in rawsignal stage')
+        if fused:
+            results = run_fused(targets)
+        else:
+            print('Starting event -> rawsignal run')
+            results = exec_events_to_signals_multi(targets, overwrite=True, max_workers=max_workers, executor=executor)
+            print('Run finished, now in rawsignal stage')
+        if cache is not None:
+            record_results(cache, results, keys)
         print()
 
     #%%
 
-    if 'rawsignal' in stages:
-        if args.standard is None:
-            while True:
-                standard = input_nonraw_standard('Select standard')
-                if input_1_safe('Confirm standard selection?'):
-                    break
-        else:
-            standard = args.standard
-
-        if 'event' in stages:
-            prev_outs = [target[1] for target in targets]
+    if 'rawsignal' in stages and not (fused and start != 'rawsignal'):
+        if 'event' in stages and not fused:
+            prev_outs = [target[1] for target in targets] + up_to_date
             prev_nooverwrites = nooverwrites
 
             carried = prev_outs
@@ -538,8 +711,9 @@ if __name__ == '__main__':
 
         targets_ = []
         for path in rawsignals:
-            out_path = path.with_name(path.name[:-len('.rawsignals.npz')]+'.stdsignals.npz')
+            out_path = first_out_path(path, 'stdsignal')
             targets_.append([path, out_path])
+        targets_, up_to_date, keys = split_targets(targets_, 'rawsignal')
 
         while True:
             targets = []
@@ -547,34 +721,30 @@ if __name__ == '__main__':
             for target in targets_:
                 path = target[0]
                 out_path = target[1]
-                if out_path.exists():
-                    if not input_1_safe(f'Output destination for "{path}", "{out_path}" exists. Overwrite?'):
-                        nooverwrites.append(out_path)
-                        continue
+                if not ask_overwrite(path, out_path):
+                    nooverwrites.append(out_path)
+                    continue
                 targets.append(target)
             print()
             if input_1_safe('Final confirm targets?'):
                 print()
                 break
 
-        print('Starting rawsignals -> stdsignal run')
-        exec_signals_to_std_signals_multi(targets, standard, overwrite=True)
-        print('Run finished, now in rawsignal stage')
+        if fused:
+            results = run_fused(targets)
+        else:
+            print('Starting rawsignals -> stdsignal run')
+            results = exec_signals_to_std_signals_multi(targets, standard, overwrite=True, max_workers=max_workers, executor=executor)
+            print('Run finished, now in rawsignal stage')
+        if cache is not None:
+            record_results(cache, results, keys)
         print()
 
     #%%
 
-    if 'stdsignal' in stages:
-        if args.scheme is None:
-            while True:
-                scheme = input_scheme('Select scheme')
-                if input_1_safe('Confirm scheme selection?'):
-                    break
-        else:
-            scheme = args.scheme
-
-        if 'rawsignal' in stages:
-            prev_outs = [target[1] for target in targets]
+    if 'stdsignal' in stages and not (fused and start != 'stdsignal'):
+        if 'rawsignal' in stages and not fused:
+            prev_outs = [target[1] for target in targets] + up_to_date
             prev_nooverwrites = nooverwrites
 
             carried = prev_outs
@@ -611,8 +781,9 @@ if __name__ == '__main__':
 
         targets_ = []
         for path in stdsignals:
-            out_path = path.with_name(path.name[:-len('.stdsignals.npz')]+'.dataset.npz')
+            out_path = first_out_path(path, 'dataset')
             targets_.append([path, out_path])
+        targets_, up_to_date, keys = split_targets(targets_, 'stdsignal')
 
         while True:
             targets = []
@@ -620,52 +791,59 @@ if __name__ == '__main__':
             for target in targets_:
                 path = target[0]
                 out_path = target[1]
-                if out_path.exists():
-                    if not input_1_safe(f'Output destination for "{path}", "{out_path}" exists. Overwrite?'):
-                        nooverwrites.append(out_path)
-                        continue
+                if not ask_overwrite(path, out_path):
+                    nooverwrites.append(out_path)
+                    continue
                 targets.append(target)
             print()
             if input_1_safe('Final confirm targets?'):
                 print()
                 break
 
-        print('Starting stdsignals -> dataset run')
-        exec_make_dataset_multi(targets, scheme, overwrite=True)
-        print('Run finished, now in dataset stage')
+        if fused:
+            results = run_fused(targets)
+        else:
+            print('Starting stdsignals -> dataset run')
+            results = exec_make_dataset_multi(targets, scheme, overwrite=True, max_workers=max_workers, executor=executor)
+            print('Run finished, now in dataset stage')
+        if cache is not None:
+            record_results(cache, results, keys)
         print()
 
     #%%
 
-        if 'data' in stages:
-            print('Making combined dataset for sets')
-            for path in sets:
-                abort = False
-                members = Fmt.set_members(path)
-                out_path = path.with_suffix('.dataset.npz')
-                if out_path.exists():
-                    if not input_1_safe(f'Combined file for set "{path}", "{out_path}" exists, overwrite?'):
-                        continue
-                datasets = []
-                for member in members:
-                    dataset_path = member.with_suffix('.dataset.npz')
-                    try:
-                        dataset = load_dataset(dataset_path)
-                    except:
-                        print(f'Failed to load dataset of member "{member}", aborting combine for this set...')
-                        abort = True
-                        break
-                    datasets.append(dataset)
-                if abort:
+    if end == 'dataset' and 'data' in stages:
+        print('Making combined dataset for sets')
+        for path in sets:
+            abort = False
+            members = Fmt.set_members(path)
+            out_path = path.with_suffix('.dataset.npz')
+            if out_path.exists():
+                if not input_1_safe(f'Combined file for set "{path}", "{out_path}" exists, overwrite?'):
                     continue
-                combined_dataset = combine_datasets(*datasets)
-                meta = {
-                    'combined_from': [str(member) for member in members]
-                    }
-                save_dataset(out_path, *combined_dataset, scheme, standard, meta, overwrite=True)
+            datasets = []
+            for member in members:
+                dataset_path = member.with_suffix('.dataset.npz')
+                try:
+                    dataset = load_dataset(dataset_path)
+                except:
+                    print(f'Failed to load dataset of member "{member}", aborting combine for this set...')
+                    abort = True
+                    break
+                datasets.append(dataset)
+            if abort:
+                continue
+            combined_dataset = combine_datasets(*datasets)
+            meta = {
+                'combined_from': [str(member) for member in members]
+                }
+            save_dataset(out_path, *combined_dataset, scheme, standard, meta, overwrite=True)
 
 
     #%%
 
+    if executor is not None:
+        executor.shutdown()
+
     print('Program completed')
     sys.exit(0)